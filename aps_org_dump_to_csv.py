@@ -14,51 +14,81 @@ as env vars that are private to your environment, not global vars on the
 machine that you are working on.
 """
 
-import os
-import json
-import requests
-import logging
 import sys
-import time
-import csv
 from datetime import datetime
 import argparse
 
 from modules.core.logger import ScriptLogger
 from modules.core.mist_verbs import MistVerbs
+from modules.core.mist_errors import MistApiError
+from modules.core.response_cache import ResponseCache
+from modules.core.mist_mirror import MistMirror
+from modules.core.report_writer import write_report, check_report_options, REPORT_FORMATS, COMPRESSIONS
 from modules.core.stopwatch import StopWatch
 from modules.core.get_vars import GetVars
 from modules.core.banner import header, footer
 
-# create parser args
-parse_descr = "Script to dump all APs of an org in to a CSV report (date-stamped reports dumped in the 'reports' folder) \n"
-parser = argparse.ArgumentParser(description=parse_descr)
+# define URLs
+sites_url = "{}/api/v1/orgs/{}/sites"
+inventory_url = "{}/api/v1/orgs/{}/inventory"
+
+column_headers = ["device_name", "device_model", "device_type", "device_serial", "site_name"]
+column_types = {"device_model": 'dictionary', "device_type": 'dictionary', "site_name": 'dictionary'}
 
-args = parser.parse_args()
+def ap_rows(devices, sites_lookup):
+    """
+    Generator to return a report row for each AP in a device list
+    """
 
-# set up logging
-logger = ScriptLogger('mist_api')
+    for device in devices:
 
-# supply required token
-vars_obj = GetVars()
-vars_found = vars_obj.find_vars()
-api_token = vars_found.get('token')
-org_id = vars_found.get('org_id')
+        if device['type'] != 'ap':
+            continue
 
-# define URLs
-base_url = "https://api.mist.com"
-sites_url = "{}/api/v1/orgs/{}/sites".format(base_url, org_id)
-inventory_url = "{}/api/v1/orgs/{}/inventory".format(base_url, org_id)
+        yield {
+            "device_name": device['name'],
+            "device_model": device['model'],
+            "device_type": device['type'],
+            "device_serial": device['serial'],
+            "site_name": sites_lookup.get(device['site_id'], ''),
+        }
+
+def main(argv=None):
+
+    # create parser args
+    parse_descr = "Script to dump all APs of an org in to a CSV report (date-stamped reports dumped in the 'reports' folder) \n"
+    parser = argparse.ArgumentParser(description=parse_descr)
+    parser.add_argument('--cache', action='store_true', help="re-use API responses cached by earlier runs if unchanged")
+    parser.add_argument('--cache-ttl', type=float, default=0, help="secs a cached response is used without checking for changes (default: 0)")
+    parser.add_argument('--format', choices=REPORT_FORMATS, default='csv', help="report file format (parquet & arrow require pyarrow, default: csv)")
+    parser.add_argument('--compress', choices=COMPRESSIONS, help="compress the report as it is written (zstd CSV reports require zstandard)")
+    parser.add_argument('--compress-level', type=int, help="compression level (default: 6 for gzip, 3 for zstd)")
+    parser.add_argument('--from-mirror', action='store_true', help="report from the local mirror (see mirror_sync.py) rather than the API")
+
+    args = parser.parse_args(argv)
+
+    try:
+        check_report_options(args.format, args.compress)
+    except (ValueError, ImportError) as err:
+        parser.error(str(err))
 
-# define CSV file name
-report_file = 'reports/AP_Inventory_Org_' + str(datetime.now().strftime('%Y_%m_%d_%H_%M_%S')) + '.csv'
+    # set up logging
+    logger = ScriptLogger('mist_api')
 
-def main():
+    # supply required token
+    vars_obj = GetVars()
+    vars_found = vars_obj.find_vars()
+    api_token = vars_found.get('token')
+    base_url = vars_found.get('base_url')
+    org_id = vars_found.get('org_id')
+
+    # define CSV file name
+    report_file = 'reports/AP_Inventory_Org_' + str(datetime.now().strftime('%Y_%m_%d_%H_%M_%S')) + '.csv'
 
     timer = StopWatch()
     timer.start()
 
-    if not api_token:
+    if not api_token and not args.from_mirror:
         print("You must define a valid API token using the MIST_TOKEN environmental variable name to use this script...exiting.")
         sys.exit()
     
@@ -68,54 +98,64 @@ def main():
     
     header()
 
-    # Get my org sites
-    logger.info("Getting sites info.")
-    verb_obj = MistVerbs(api_token)
-    sites = verb_obj.mist_read(sites_url)
+    cache = None
 
-    # Create sites dict based on response
-    sites_lookup = {}
+    if args.from_mirror:
+        logger.info("Getting sites & device inventory info from mirror.")
 
-    for site in sites:
+        try:
+            mirror = MistMirror(read_only=True)
+        except IOError as err:
+            logger.error("Unable to open mirror: {}".format(err))
+            sys.exit(1)
 
-        site_id = site['id']
-        site_name = site['name']
+        synced_at = mirror.last_synced(org_id, 'inventory')
 
-        sites_lookup[site_id] = site_name
-    
-    # Get my device inventory
-    logger.info("Getting device inventory info.")
-    devices = verb_obj.mist_read(inventory_url)
+        if synced_at is None:
+            logger.error("The device inventory of org {} has not been synced to the mirror (run mirror_sync.py first).".format(org_id))
+            sys.exit(1)
 
-    dict_data = []
-    
-    for device in devices:
-        dict = {
-            "device_name": device['name'],
-            "device_model": device['model'],
-            "device_type": device['type'],
-            "device_serial": device['serial'],
-            "site_name": sites_lookup[device['site_id']],
-        }
+        logger.info("Mirror last synced at {}.".format(datetime.fromtimestamp(synced_at).strftime('%Y-%m-%d %H:%M:%S')))
+        sites_lookup = mirror.site_names(org_id)
+        devices = mirror.records('inventory', org_id=org_id)
 
-        if device['type'] == 'ap':
-            dict_data.append(dict)
+    else:
+        # Get my org sites
+        logger.info("Getting sites info.")
+        cache = ResponseCache(default_ttl=args.cache_ttl) if args.cache else None
+        verb_obj = MistVerbs(api_token, cache=cache)
+        # Create sites dict based on response
+        sites_lookup = {}
 
-    logger.info("Dumping CSV device report file: {}.".format(report_file))
+        try:
+            for site in verb_obj.mist_iter(sites_url.format(base_url, org_id)):
 
-    column_headers = ["device_name", "device_model", "device_type", "device_serial", "site_name"]
+                site_id = site['id']
+                site_name = site['name']
 
-    try:
-        with open(report_file, 'w', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=column_headers)
-            writer.writeheader()
+                sites_lookup[site_id] = site_name
 
-            for dict in dict_data:
-                writer.writerow(dict)
+        except MistApiError as err:
+            logger.error("Unable to get sites info: {}".format(err))
+            sys.exit(1)
+    
+        # Get my device inventory
+        logger.info("Getting device inventory info.")
+        devices = verb_obj.mist_iter(inventory_url.format(base_url, org_id))
 
+    try:
+        write_report(ap_rows(devices, sites_lookup), report_file, column_headers, logger, args.format, column_types,
+                     args.compress, args.compress_level)
     except IOError as err:
-        logger.error("CSV I/O error: {}".format(err))
+        logger.error("Report I/O error: {}".format(err))
+    except MistApiError as err:
+        # the device inventory is read as the report is written
+        logger.error("Unable to get device inventory info, report is incomplete: {}".format(err))
+        sys.exit(1)
     
+    if cache:
+        logger.info("Response cache stats: {}".format(cache.stats()))
+
     logger.info("Script complete.")
 
     timer.stop()
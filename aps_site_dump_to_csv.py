@@ -1,100 +1,270 @@
 #!/usr/bin/env python
 """
-aps_org_dump_to_csv.py <site_id> - Dump all APs on a specific site to a CSV file
+aps_site_dump_to_csv.py <site_id> [<site_id> ...] - Dump all APs on one or more sites to CSV
+
+Sites may be given on the command line, listed in a file (one site ID per
+line) with --file, or all sites of the org may be dumped with --all. The
+device lists of the sites are fetched concurrently (--workers sets how many
+at once) over a shared pool of connections, and written either to one
+merged report file (default), or one report file per site (--per-site).
+Reports are CSV files by default, or Parquet/Arrow files with --format, and
+may be compressed as they are written with --compress.
 
 To use this script, you must set the following environmental variables that
 are used by the script:
 
     MIST_TOKEN - A valid API token created for access to your organization
+    MIST_ORG_ID - The organization ID of your org (only required for --all)
 
 These are required to prevent the requirement for hard coding them in to
 script of an accompanying config file. These variables should be created
-as env vars that are private to your environment, not global vars on the 
+as env vars that are private to your environment, not global vars on the
 machine that you are working on.
 """
 
-import os
 import sys
-import csv
+import time
+import asyncio
 from datetime import datetime
 import argparse
 
 from modules.core.logger import ScriptLogger
-from modules.core.mist_verbs import MistVerbs
+from modules.core.async_mist_verbs import AsyncMistVerbs
+from modules.core.mist_errors import MistApiError
+from modules.core.mist_mirror import MistMirror
+from modules.core.report_writer import create_report_writer, open_report, check_report_options, REPORT_FORMATS, COMPRESSIONS
 from modules.core.stopwatch import StopWatch
 from modules.core.get_vars import GetVars
 from modules.core.banner import header, footer
 
-# create parser args
-parse_descr = "Script to dump all APs for a specific site in to a CSV report (date-stamped reports dumped in the 'reports' folder) \n"
-parser = argparse.ArgumentParser(description=parse_descr)
-parser.add_argument('site_id')
+# define URLs
+sites_url = "{}/api/v1/orgs/{}/sites"
+site_inventory_url = "{}/api/v1/sites/{}/devices"
+
+# define CSV file names (completed with time stamp)
+report_file = 'reports/AP_Inventory_Site_{}.csv'
+site_report_file = 'reports/AP_Inventory_Site_{}_{}.csv'
 
+column_headers = ["device_name", "device_model", "device_type", "device_serial", "site_id", "site_name"]
+column_types = {"device_model": 'dictionary', "device_type": 'dictionary', "site_id": 'dictionary', "site_name": 'dictionary'}
 
-args = parser.parse_args()
 
-# set up logging
-logger = ScriptLogger('mist_api')
+def read_site_ids_file(filename):
+    """
+    Read site IDs from a file (one per line, blank lines & lines starting
+    with '#' are ignored). The file may be gzip or zstd compressed.
+    """
 
-# supply required token
-vars_obj = GetVars()
-vars_found = vars_obj.find_vars()
-api_token = vars_found.get('token')
+    with open_report(filename) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
 
-# get the site_id passed on the command line
-site_id = args.site_id
 
-# define URLs
-base_url = "https://api.mist.com"
-site_inventory_url = "{}/api/v1/sites/{}/devices".format(base_url, site_id)
+async def get_mirror_site_devices(mirror, site_id):
+    """
+    Get the device list of a site from the mirror, returning (site_id, devices, elapsed time, error)
+    """
+
+    start_time = time.perf_counter()
+    devices = list(mirror.records('devices', site_id=site_id))
+
+    return site_id, devices, time.perf_counter() - start_time, None
+
+
+async def get_site_devices(verb_obj, base_url, site_id):
+    """
+    Get the device list of a site, returning (site_id, devices, elapsed time, error)
+    """
+
+    start_time = time.perf_counter()
+
+    try:
+        devices = await verb_obj.mist_read_all(site_inventory_url.format(base_url, site_id))
+        error = None
+    except MistApiError as err:
+        devices = []
+        error = err
+
+    return site_id, devices, time.perf_counter() - start_time, error
+
+
+async def write_site_reports(tasks, site_names, args, time_stamp, logger):
+    """
+    Write the devices of each site to the report as its task completes.
+    Returns the number of sites that failed.
+    """
+
+    merged_writer = None
+    failed = 0
+
+    if not args.per_site:
+        merged_writer = create_report_writer(report_file.format(time_stamp), column_headers, args.format, column_types,
+                                             args.compress, args.compress_level)
+        logger.info("Dumping device report file: {}.".format(merged_writer.report_file))
+        merged_writer.open()
+
+    try:
+        total = len(tasks)
+
+        for count, task in enumerate(asyncio.as_completed(tasks), 1):
+
+            site_id, devices, elapsed, error = await task
+
+            if error:
+                failed += 1
+                logger.error("[{}/{}] Site {} failed after {:.2f} sec: {}".format(count, total, site_id, elapsed, error))
+                continue
+
+            rows = [{
+                "device_name": device['name'],
+                "device_model": device['model'],
+                "device_type": device['type'],
+                "device_serial": device['serial'],
+                "site_id": site_id,
+                "site_name": site_names.get(site_id, ''),
+            } for device in devices if device['type'] == 'ap']
+
+            logger.info("[{}/{}] Site {}: {} APs in {:.2f} sec".format(count, total, site_id, len(rows), elapsed))
+
+            if merged_writer:
+                merged_writer.write_rows(rows)
+            else:
+                with create_report_writer(site_report_file.format(site_id, time_stamp), column_headers, args.format, column_types,
+                                          args.compress, args.compress_level) as writer:
+                    writer.write_rows(rows)
+
+    finally:
+        if merged_writer:
+            merged_writer.close()
+
+    return failed
+
+
+async def dump_sites(site_names, args, api_token, base_url, org_id, time_stamp, logger, mirror=None):
+    """
+    Fetch the devices of all sites concurrently (from the API, or the mirror
+    if given) & write them to the report as each site completes. Returns the
+    number of sites that failed. If the site list has to be read & can't be,
+    MistApiError is raised before any report is opened.
+    """
 
-# define CSV file name
-report_file = 'reports/AP_Inventory_Site_' + str(datetime.now().strftime('%Y_%m_%d_%H_%M_%S')) + '.csv'
+    if mirror:
+        mirror_site_names = mirror.site_names(org_id) if org_id else {}
 
-def main():
+        if not site_names:
+            logger.info("Getting sites info from mirror.")
+            site_names.update(mirror_site_names)
+        else:
+            site_names.update({site_id: mirror_site_names.get(site_id, '') for site_id in site_names})
+
+        tasks = [get_mirror_site_devices(mirror, site_id) for site_id in site_names]
+
+        return await write_site_reports(tasks, site_names, args, time_stamp, logger)
+
+    async with AsyncMistVerbs(api_token, concurrency=args.workers) as verb_obj:
+
+        if not site_names:
+            logger.info("Getting sites info.")
+            sites = await verb_obj.mist_read_all(sites_url.format(base_url, org_id))
+            site_names.update({site['id']: site['name'] for site in sites})
+
+        tasks = [get_site_devices(verb_obj, base_url, site_id) for site_id in site_names]
+
+        return await write_site_reports(tasks, site_names, args, time_stamp, logger)
+
+
+def main(argv=None):
+
+    # create parser args
+    parse_descr = "Script to dump all APs for one or more sites in to CSV reports (date-stamped reports dumped in the 'reports' folder) \n"
+    parser = argparse.ArgumentParser(description=parse_descr)
+    parser.add_argument('site_ids', nargs='*', metavar='site_id', help="ID of site to dump (may be repeated)")
+    parser.add_argument('--file', help="file containing site IDs to dump (one per line)")
+    parser.add_argument('--all', action='store_true', help="dump all sites in the org (requires MIST_ORG_ID)")
+    parser.add_argument('--per-site', action='store_true', help="write one report file per site rather than one merged file")
+    parser.add_argument('--format', choices=REPORT_FORMATS, default='csv', help="report file format (parquet & arrow require pyarrow, default: csv)")
+    parser.add_argument('--compress', choices=COMPRESSIONS, help="compress the report as it is written (zstd CSV reports require zstandard)")
+    parser.add_argument('--compress-level', type=int, help="compression level (default: 6 for gzip, 3 for zstd)")
+    parser.add_argument('--workers', type=int, default=10, help="number of sites fetched concurrently (default: 10)")
+    parser.add_argument('--from-mirror', action='store_true', help="report from the local mirror (see mirror_sync.py) rather than the API")
+
+    args = parser.parse_args(argv)
+
+    try:
+        check_report_options(args.format, args.compress)
+    except (ValueError, ImportError) as err:
+        parser.error(str(err))
+
+    # set up logging
+    logger = ScriptLogger('mist_api')
+
+    # supply required token
+    vars_obj = GetVars()
+    vars_found = vars_obj.find_vars()
+    api_token = vars_found.get('token')
+    base_url = vars_found.get('base_url')
+    org_id = vars_found.get('org_id')
+
+    time_stamp = str(datetime.now().strftime('%Y_%m_%d_%H_%M_%S'))
 
     timer = StopWatch()
     timer.start()
 
-    if not api_token:
+    if not api_token and not args.from_mirror:
         print("You must define a valid API token using the MIST_TOKEN environmental variable name to use this script...exiting.")
         sys.exit()
-       
+
+    # site ID to site name (if known)
+    site_names = {}
+
+    if not args.all:
+        site_ids = list(args.site_ids)
+
+        if args.file:
+            site_ids.extend(read_site_ids_file(args.file))
+
+        if not site_ids:
+            print("You must supply at least one site ID (on the command line or via --file), or use --all...exiting.")
+            sys.exit()
+
+        site_names = dict.fromkeys(site_ids, '')
+
+    elif not org_id:
+        print("You must define a valid organization ID using the MIST_ORG_ID environmental variable name to use --all...exiting.")
+        sys.exit()
+
     header()
 
-    # Get my org sites
-    logger.info("Getting sites info.")
-    verb_obj = MistVerbs(api_token)
-    devices_on_site = verb_obj.mist_read(site_inventory_url)
+    mirror = None
 
-    dict_data = []
-    
-    for device in devices_on_site:
-        dict = {
-            "device_name": device['name'],
-            "device_model": device['model'],
-            "device_type": device['type'],
-            "device_serial": device['serial'],
-        }
+    if args.from_mirror:
+        try:
+            mirror = MistMirror(read_only=True)
+        except IOError as err:
+            logger.error("Unable to open mirror: {}".format(err))
+            sys.exit(1)
 
-        if device['type'] == 'ap':
-            dict_data.append(dict)
+        synced_at = mirror.last_synced(org_id, 'sites')
 
-    logger.info("Dumping CSV device report file: {}.".format(report_file))
+        if synced_at is None:
+            logger.error("The sites of {} have not been synced to the mirror (run mirror_sync.py first).".format(
+                "org {}".format(org_id) if org_id else "any org"))
+            sys.exit(1)
 
-    column_headers = ["device_name", "device_model", "device_type", "device_serial"]
+        logger.info("Mirror last synced at {}.".format(datetime.fromtimestamp(synced_at).strftime('%Y-%m-%d %H:%M:%S')))
 
     try:
-        with open(report_file, 'w', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=column_headers)
-            writer.writeheader()
+        failed = asyncio.run(dump_sites(site_names, args, api_token, base_url, org_id, time_stamp, logger, mirror))
+    except IOError as err:
+        logger.error("Report I/O error: {}".format(err))
+        failed = 0
+    except MistApiError as err:
+        # the device lists of the sites are read by dump_sites, which reports their errors
+        logger.error("Unable to get sites info: {}".format(err))
+        sys.exit(1)
 
-            for dict in dict_data:
-                writer.writerow(dict)
+    if failed:
+        logger.warning("{} site(s) could not be dumped.".format(failed))
 
-    except IOError as err:
-        logger.error("CSV I/O error: {}".format(err))
-    
     logger.info("Script complete.")
 
     timer.stop()
@@ -103,5 +273,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
-
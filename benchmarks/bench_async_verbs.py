@@ -0,0 +1,114 @@
+"""
+bench_async_verbs.py - Compare sequential MistVerbs reads with AsyncMistVerbs
+
+Reads the device list of every site of a mock org (see mock_mist_api.py),
+first one site at a time with MistVerbs, then concurrently with
+AsyncMistVerbs.gather_read(), and prints the wall-clock time of each.
+
+Also pages through the org inventory & site list (paginated list calls of
+different lengths) with concurrent AsyncMistVerbs.mist_iter_pages()
+iterators, whose pages are fetched in whichever worker thread is free, &
+checks each iterator returns the same records as a sequential
+MistVerbs.mist_iter().
+
+Usage (from the root of the repo):
+
+    python -m benchmarks.bench_async_verbs --sites 200 --latency 0.05 --concurrency 20
+"""
+
+import argparse
+import asyncio
+import time
+
+from modules.core.mist_verbs import MistVerbs
+from modules.core.async_mist_verbs import AsyncMistVerbs
+from modules.core.rate_limiter import RateLimiter
+from benchmarks.mock_mist_api import MockMistApi
+
+
+# the mock API has no call budget, so don't let pacing skew the timings
+bench_limiter = RateLimiter(calls_per_hour=10 ** 9)
+
+
+def site_device_urls(mock_api):
+    return ["{}/api/v1/sites/{}/devices".format(mock_api.base_url, site['id']) for site in mock_api.org.sites]
+
+
+def run_sequential(urls):
+
+    verb_obj = MistVerbs('bench-token', rate_limiter=bench_limiter)
+    return [verb_obj.mist_read(url) for url in urls]
+
+
+def run_async(urls, concurrency):
+
+    async def gather():
+        async with AsyncMistVerbs('bench-token', concurrency=concurrency, rate_limiter=bench_limiter) as verb_obj:
+            return await verb_obj.gather_read(urls)
+
+    return asyncio.run(gather())
+
+
+def run_sequential_pages(urls, page_size):
+
+    verb_obj = MistVerbs('bench-token', rate_limiter=bench_limiter)
+    return [list(verb_obj.mist_iter(url, page_size=page_size)) for url in urls]
+
+
+def run_async_pages(urls, page_size, concurrency):
+
+    async def read_pages(verb_obj, url):
+        records = []
+        async for page in verb_obj.mist_iter_pages(url, page_size=page_size):
+            records.extend(page)
+        return records
+
+    async def gather():
+        async with AsyncMistVerbs('bench-token', concurrency=concurrency, rate_limiter=bench_limiter) as verb_obj:
+            return await asyncio.gather(*[read_pages(verb_obj, url) for url in urls])
+
+    return asyncio.run(gather())
+
+
+def timed(func, *args):
+
+    start_time = time.perf_counter()
+    results = func(*args)
+    return time.perf_counter() - start_time, results
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmark sequential vs concurrent reads against a mock Mist API")
+    parser.add_argument('--sites', type=int, default=100, help="number of sites in the mock org")
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds of delay added to each mock response")
+    parser.add_argument('--concurrency', type=int, default=20, help="max concurrent requests for AsyncMistVerbs")
+    parser.add_argument('--page-size', type=int, default=25, help="records per page of the paged inventory read")
+    args = parser.parse_args()
+
+    with MockMistApi(num_sites=args.sites, latency=args.latency) as mock_api:
+
+        urls = site_device_urls(mock_api)
+
+        seq_time, seq_results = timed(run_sequential, urls)
+        async_time, async_results = timed(run_async, urls, args.concurrency)
+
+        list_urls = ["{}/api/v1/orgs/{}/{}".format(mock_api.base_url, mock_api.org_id, endpoint)
+                     for endpoint in ('inventory', 'sites') for _ in range(args.concurrency)]
+        seq_records = run_sequential_pages(list_urls, args.page_size)
+        pages_time, async_records = timed(run_async_pages, list_urls, args.page_size, args.concurrency)
+
+    assert seq_results == async_results, "sequential & async results differ"
+    assert len(seq_records[0]) == len(mock_api.org.inventory()), "sequential paged read is incomplete"
+    assert seq_records == async_records, "sequential & async paged results differ"
+
+    print("\nRead devices of {} sites (latency {}s per request):\n".format(len(urls), args.latency))
+    print("    Sequential MistVerbs:              {:8.3f} sec".format(seq_time))
+    print("    AsyncMistVerbs (concurrency {:3d}): {:8.3f} sec".format(args.concurrency, async_time))
+    print("    Speed-up:                          {:8.1f}x\n".format(seq_time / async_time))
+    print("Paged through inventory ({} devices) & sites ({} sites), {} per page, with {} concurrent iterators: {:.3f} sec\n".format(
+        len(seq_records[0]), len(seq_records[-1]), args.page_size, len(list_urls), pages_time))
+
+
+if __name__ == "__main__":
+    main()
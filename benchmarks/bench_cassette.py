@@ -0,0 +1,130 @@
+"""
+bench_cassette.py - Compare a live run of a report script with a replay of its recorded API calls
+
+Runs a report script (default: aps_org_dump_to_csv) against the mock API
+(see mock_mist_api.py) while recording its API calls to a cassette (see
+modules/core/cassette.py), then stops the mock & replays the cassette. For
+each run the time taken & records written are printed, so the replay shows
+the time the script spends on its own work (JSON parsing, report writing).
+
+It also checks that:
+
+ - the replay writes the same number of records as the live run
+ - a call with no recorded response fails as a MistApiError (CassetteMissError),
+   both when made directly & when a script makes it (the script must exit
+   with status 1 & log the error, not print a traceback)
+
+and exits with status 1 if a check fails.
+
+Usage (from the root of the repo):
+
+    python -m benchmarks.bench_cassette
+    python -m benchmarks.bench_cassette --sites 200 --devices 20 --latency 0.02
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+from benchmarks.mock_mist_api import MockMistApi
+from benchmarks.bench_scripts import run_script, ap_count, BENCH_RATE_LIMIT
+from benchmarks.bench_faults import count_report_rows
+from modules.core.cassette import CassetteReader, ReplaySession, CassetteMissError, CASSETTE_VAR, CASSETTE_MODE_VAR
+from modules.core.mist_errors import MistApiError
+from modules.core.mist_verbs import MistVerbs
+
+SCRIPT = 'aps_org_dump_to_csv'
+
+
+def check_direct_miss(cassette_file, base_url):
+    """
+    Make a call with no recorded response through a ReplaySession, returning
+    an error message if it does not fail with a MistApiError that is a
+    CassetteMissError (or None)
+    """
+
+    reader = CassetteReader(cassette_file)
+    verb_obj = MistVerbs('bench-token', transport=ReplaySession(reader))
+
+    try:
+        verb_obj.mist_read('{}/api/v1/orgs/not-recorded/sites'.format(base_url))
+    except MistApiError as err:
+        if isinstance(err, CassetteMissError):
+            return None
+        return "replay miss raised {} rather than CassetteMissError".format(type(err).__name__)
+    except Exception as err:
+        return "replay miss raised {} ({}) rather than a MistApiError".format(type(err).__name__, err)
+    finally:
+        reader.close()
+
+    return "replay miss returned a response"
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Compare a live run of a report script with a replay of its recorded API calls")
+    parser.add_argument('--sites', type=int, default=50, help="number of sites in the mock org (default: 50)")
+    parser.add_argument('--devices', type=int, default=20, help="number of APs per site (default: 20)")
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds of delay added to each mock response (default: 0.02)")
+    args = parser.parse_args()
+
+    failures = []
+
+    with tempfile.TemporaryDirectory() as work_dir:
+
+        cassette_file = os.path.join(work_dir, 'bench.cassette')
+
+        with MockMistApi(num_sites=args.sites, devices_per_site=args.devices, latency=args.latency,
+                         rate_limit=BENCH_RATE_LIMIT) as mock_api:
+
+            env = dict(os.environ, MIST_TOKEN='bench-token', MIST_ORG_ID=mock_api.org_id, MIST_BASE_URL=mock_api.base_url)
+            env[CASSETTE_VAR] = cassette_file
+            env[CASSETTE_MODE_VAR] = 'record'
+
+            expected = ap_count(mock_api.org)
+
+            with tempfile.TemporaryDirectory() as run_dir:
+                live_time, _, live_status, _ = run_script(SCRIPT, [], env, run_dir)
+                live_rows = count_report_rows(run_dir)
+
+        # the mock has stopped, so any call not served from the cassette fails
+        env[CASSETTE_MODE_VAR] = 'replay'
+
+        with tempfile.TemporaryDirectory() as run_dir:
+            replay_time, _, replay_status, replay_errors = run_script(SCRIPT, [], env, run_dir)
+            replay_rows = count_report_rows(run_dir)
+
+        with tempfile.TemporaryDirectory() as run_dir:
+            _, _, miss_status, miss_errors = run_script(SCRIPT, [], dict(env, MIST_ORG_ID='not-recorded'), run_dir)
+
+        print("\n{}: {} sites, {} APs per site, latency {}s per request\n".format(SCRIPT, args.sites, args.devices, args.latency))
+        print("    {:<10}{:>9}{:>9}{:>11}".format('Run', 'Time (s)', 'Records', 'Records/s'))
+        print("    {:<10}{:>9.2f}{:>9}{:>11.0f}".format('live', live_time, live_rows, live_rows / live_time))
+        print("    {:<10}{:>9.2f}{:>9}{:>11.0f}".format('replay', replay_time, replay_rows, replay_rows / replay_time))
+        print("")
+
+        if live_status != 0 or live_rows != expected:
+            failures.append("live run exited with status {} & wrote {} of {} records".format(live_status, live_rows, expected))
+
+        if replay_status != 0 or replay_rows != live_rows:
+            failures.append("replay exited with status {} & wrote {} of {} records: {}".format(
+                replay_status, replay_rows, live_rows, replay_errors.strip().splitlines()[-1:]))
+
+        if miss_status != 1 or 'Traceback' in miss_errors or 'No recorded response' not in miss_errors:
+            failures.append("script replay miss exited with status {}: {}".format(miss_status, miss_errors.strip().splitlines()[-1:]))
+
+        error = check_direct_miss(cassette_file, env['MIST_BASE_URL'])
+        if error:
+            failures.append(error)
+
+    for failure in failures:
+        print("FAIL: " + failure)
+
+    print("{}\n".format("FAILED" if failures else "OK"))
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+bench_faults.py - Run the bulk scripts against a mock Mist API that injects faults
+
+Runs each script in BULK_SCRIPTS against the mock API (see mock_mist_api.py)
+once per fault profile (see FAULT_PROFILES in mock_mist_api.py), e.g. 5% of
+calls throttled with HTTP 429, bursts of 503s, connection resets, slow or
+truncated response bodies. For each run it reports:
+
+ - result: ok (all records written), partial (some records missing) or
+   failed (script exited with an error)
+ - time taken & records written per second
+ - API calls made, retries (read from the metrics the script writes, see
+   modules/core/metrics.py) & faults injected by the mock
+ - completion: share of the expected records written to the report
+
+Faults are chosen at random with a fixed seed, so runs are repeatable.
+The exit status is 1 if any run is not ok: every fault profile should be
+ridden out by the retries, inc. truncated bodies (GETs are retried if
+the body is not valid JSON), so a partial report is a regression.
+
+Usage (from the root of the repo):
+
+    python -m benchmarks.bench_faults
+    python -m benchmarks.bench_faults --profile throttle --profile mixed --sites 50 --seed 7
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+
+from benchmarks.mock_mist_api import MockMistApi, FaultProfile, FAULT_PROFILES
+from benchmarks.bench_scripts import run_script, ap_count, BENCH_RATE_LIMIT
+from modules.core.metrics import JSON_FILE
+from modules.core.report_writer import read_report
+
+
+def org_client_count(org):
+    return len({session['mac'] for site in org.sites for session in org.client_sessions(site['id'])})
+
+
+# script: (command line args, function returning number of records the script should write)
+BULK_SCRIPTS = {
+    'aps_org_dump_to_csv': ([], ap_count),
+    'aps_site_dump_to_csv': (['--all'], ap_count),
+    'clients_org_dump_to_csv': ([], org_client_count),
+}
+
+
+def count_report_rows(work_dir):
+    """
+    Return the number of rows in the report files written by a script
+    """
+
+    return sum(sum(1 for _ in read_report(report_file)) for report_file in glob.glob(os.path.join(work_dir, 'reports', '*')))
+
+
+def read_call_metrics(metrics_dir):
+    """
+    Return the (API calls, retries) recorded in the metrics written by a script
+    """
+
+    metrics_file = os.path.join(metrics_dir, JSON_FILE)
+
+    if not os.path.isfile(metrics_file):
+        return 0, 0
+
+    with open(metrics_file) as f:
+        endpoints = json.load(f)['endpoints']
+
+    return sum(endpoint['requests'] for endpoint in endpoints), sum(endpoint['retries'] for endpoint in endpoints)
+
+
+def run_profile(profile, scripts, args):
+    """
+    Run the scripts against a mock API injecting the faults of a profile,
+    returning a list of result dicts
+    """
+
+    results = []
+
+    for script in scripts:
+
+        script_args, count_records = BULK_SCRIPTS[script]
+        faults = FaultProfile(seed=args.seed, **FAULT_PROFILES[profile])
+
+        with MockMistApi(num_sites=args.sites, devices_per_site=args.devices, latency=args.latency,
+                         clients_per_site=args.clients, rate_limit=BENCH_RATE_LIMIT, faults=faults) as mock_api, \
+                tempfile.TemporaryDirectory() as work_dir:
+
+            metrics_dir = os.path.join(work_dir, 'metrics')
+            env = dict(os.environ, MIST_TOKEN='bench-token', MIST_ORG_ID=mock_api.org_id,
+                       MIST_BASE_URL=mock_api.base_url, MIST_METRICS_DIR=metrics_dir)
+
+            elapsed, _, status, errors = run_script(script, script_args, env, work_dir)
+
+            expected = count_records(mock_api.org)
+            rows = count_report_rows(work_dir)
+            calls, retries = read_call_metrics(metrics_dir)
+
+            if status != 0:
+                result = 'failed'
+            elif rows < expected:
+                result = 'partial'
+            else:
+                result = 'ok'
+
+            results.append({
+                'profile': profile,
+                'script': script,
+                'result': result,
+                'time': elapsed,
+                'rows': rows,
+                'calls': calls,
+                'retries': retries,
+                'faults': sum(faults.counts.values()),
+                'completion': min(1.0, rows / expected) if expected else 1.0,
+                'error': errors.strip().splitlines()[-1] if status != 0 and errors.strip() else '',
+            })
+
+    return results
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Run the bulk scripts against a mock Mist API injecting faults")
+    parser.add_argument('--profile', action='append', choices=sorted(FAULT_PROFILES), help="fault profile to run (may be repeated, default: all)")
+    parser.add_argument('--script', action='append', choices=sorted(BULK_SCRIPTS), help="script to run (may be repeated, default: all)")
+    parser.add_argument('--sites', type=int, default=20, help="number of sites in the mock org (default: 20)")
+    parser.add_argument('--devices', type=int, default=20, help="number of APs per site (default: 20)")
+    parser.add_argument('--clients', type=int, default=200, help="number of client sessions per site (default: 200)")
+    parser.add_argument('--latency', type=float, default=0.01, help="seconds of delay added to each mock response (default: 0.01)")
+    parser.add_argument('--seed', type=int, default=1, help="seed of the random choice of faults (default: 1)")
+    args = parser.parse_args()
+
+    profiles = args.profile if args.profile else list(FAULT_PROFILES)
+    scripts = args.script if args.script else sorted(BULK_SCRIPTS)
+
+    print("\nMock org: {} sites, {} APs per site, {} client sessions per site, latency {}s per request\n".format(
+        args.sites, args.devices, args.clients, args.latency))
+    print("    {:<11}{:<26}{:<9}{:>9}{:>11}{:>7}{:>9}{:>8}{:>12}".format(
+        'Profile', 'Script', 'Result', 'Time (s)', 'Records/s', 'Calls', 'Retries', 'Faults', 'Completion'))
+
+    errors = []
+
+    for profile in profiles:
+        for result in run_profile(profile, scripts, args):
+
+            print("    {:<11}{:<26}{:<9}{:>9.2f}{:>11.0f}{:>7}{:>9}{:>8}{:>11.1f}%".format(
+                result['profile'], result['script'], result['result'], result['time'], result['rows'] / result['time'],
+                result['calls'], result['retries'], result['faults'], result['completion'] * 100))
+
+            if result['error']:
+                errors.append("{} / {}: {}".format(result['profile'], result['script'], result['error']))
+            elif result['result'] == 'partial':
+                errors.append("{} / {}: {} of the expected records written".format(
+                    result['profile'], result['script'], '{:.1f}%'.format(result['completion'] * 100)))
+
+    if errors:
+        print("\n  Errors:\n")
+        for error in errors:
+            print("    " + error)
+
+    print("")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
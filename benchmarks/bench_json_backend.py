@@ -0,0 +1,192 @@
+"""
+bench_json_backend.py - Compare JSON decode/encode speed of the installed backends
+
+Times decoding of inventory & client session payloads with each installed
+JSON backend (see modules/core/json_backend.py), against the original
+json.loads(content.decode('utf-8')) approach used by MistVerbs.
+
+By default, synthetic payloads shaped like the Mist API responses are used.
+Recorded API responses may be used instead by saving the raw response bodies
+to files and passing them on the command line.
+
+Streamed decoding (see modules/core/json_stream.py) of each payload is
+timed too. It is also checked to decode small inventory & search responses
+the same as json.loads when they arrive in 1-3 byte chunks, so that chunk
+boundaries fall inside every number (e.g. just after a '.' or 'e'). The
+exit status is 1 if the check fails.
+
+Usage (from the root of the repo):
+
+    python -m benchmarks.bench_json_backend
+    python -m benchmarks.bench_json_backend --payload inventory.json --payload sessions.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+from modules.core.json_backend import BACKENDS, BACKEND
+from modules.core.json_stream import iter_json_array
+
+# size of chunks streamed responses are read in (as MistVerbs.mist_stream)
+STREAM_CHUNK_SIZE = 65536
+
+
+def synthetic_inventory(num_devices):
+
+    return [{
+        "id": "00000000-0000-0000-1000-{:012x}".format(num),
+        "mac": "5c5b35{:06x}".format(num),
+        "serial": "A{:011d}".format(num),
+        "name": "AP-{:05d}".format(num),
+        "model": "AP43",
+        "type": "ap",
+        "site_id": "00000000-0000-0000-0001-{:012d}".format(num // 20),
+        "org_id": "00000000-0000-0000-0000-000000000001",
+        "connected": True,
+        "deviceprofile_id": None,
+        "created_time": 1590000000 + num,
+        "modified_time": 1600000000 + num,
+    } for num in range(num_devices)]
+
+
+def synthetic_sessions(num_sessions):
+
+    results = [{
+        "mac": "a4c3f0{:06x}".format(num),
+        "ap": "5c5b35{:06x}".format(num % 500),
+        "ssid": "Corp-WiFi",
+        "band": "5" if num % 3 else "24",
+        "client_manufacture": "Apple",
+        "client_family": "iPhone",
+        "client_model": "iPhone 11",
+        "client_os": "iOS 13.5",
+        "connect": 1600000000.0 + num,
+        "disconnect": 1600003600.0 + num,
+        "duration": 3600.0,
+        "tags": ["roamed", "5GHz"],
+        "rssi": -55.5 - (num % 20),
+    } for num in range(num_sessions)]
+
+    return {"results": results, "start": 1600000000, "end": 1600086400, "limit": num_sessions, "total": num_sessions}
+
+
+def iter_chunks(content, min_size, max_size, seed=1):
+    """
+    Split a payload in to chunks of random sizes
+    """
+
+    chooser = random.Random(seed)
+    start = 0
+
+    while start < len(content):
+        size = chooser.randint(min_size, max_size)
+        yield content[start:start + size]
+        start += size
+
+
+def stream_decode(content, chunks):
+    """
+    Decode a payload using json_stream, returning the same data structure as
+    json.loads
+    """
+
+    meta = {}
+    items = list(iter_json_array(chunks, key='results', meta=meta))
+
+    return items if content.lstrip().startswith(b'[') else dict(meta, results=items)
+
+
+def check_stream(name, content):
+    """
+    Check that a payload streamed in 1-3 byte chunks decodes as json.loads,
+    returning an error message (or None)
+    """
+
+    try:
+        data = stream_decode(content, iter_chunks(content, 1, 3))
+    except ValueError as err:
+        return "{}: streamed decode failed: {}".format(name, err)
+
+    if data != json.loads(content):
+        return "{}: streamed decode does not match json.loads".format(name)
+
+    return None
+
+
+def bench_payload(name, content, number):
+
+    stdlib_time = timeit.timeit(lambda: json.loads(content.decode('utf-8')), number=number) / number
+    data = json.loads(content)
+
+    print("\n{} ({:.1f} KB):\n".format(name, len(content) / 1024))
+    print("    {:<34} {:>10} {:>10}".format("backend", "decode ms", "encode ms"))
+    print("    {:<34} {:>10.3f} {:>10}".format("json (decode('utf-8') + loads)", stdlib_time * 1000, "-"))
+
+    for backend_name, (loads, dumps) in sorted(BACKENDS.items()):
+
+        assert loads(content) == data, "{} decode mismatch".format(backend_name)
+
+        decode_time = timeit.timeit(lambda: loads(content), number=number) / number
+        encode_time = timeit.timeit(lambda: dumps(data), number=number) / number
+
+        marker = " *" if backend_name == BACKEND else ""
+        print("    {:<34} {:>10.3f} {:>10.3f}  ({:.1f}x){}".format(
+            backend_name, decode_time * 1000, encode_time * 1000, stdlib_time / decode_time, marker))
+
+    assert stream_decode(content, iter_chunks(content, STREAM_CHUNK_SIZE, STREAM_CHUNK_SIZE)) == data, "json_stream decode mismatch"
+
+    stream_time = timeit.timeit(lambda: stream_decode(content, iter_chunks(content, STREAM_CHUNK_SIZE, STREAM_CHUNK_SIZE)),
+                                number=number) / number
+    print("    {:<34} {:>10.3f} {:>10}  ({:.1f}x)".format(
+        "json_stream (64 KB chunks)", stream_time * 1000, "-", stdlib_time / stream_time))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmark installed JSON backends on Mist API payloads")
+    parser.add_argument('--payload', action='append', default=[], help="file containing a recorded API response body (may be repeated)")
+    parser.add_argument('--devices', type=int, default=5000, help="number of devices in synthetic inventory payload")
+    parser.add_argument('--sessions', type=int, default=10000, help="number of sessions in synthetic client payload")
+    parser.add_argument('--number', type=int, default=20, help="number of timed repetitions")
+    args = parser.parse_args()
+
+    if args.payload:
+        payloads = []
+        for filename in args.payload:
+            with open(filename, 'rb') as f:
+                payloads.append((os.path.basename(filename), f.read()))
+    else:
+        payloads = [
+            ("Synthetic inventory, {} devices".format(args.devices), json.dumps(synthetic_inventory(args.devices)).encode('utf-8')),
+            ("Synthetic client sessions, {} sessions".format(args.sessions), json.dumps(synthetic_sessions(args.sessions)).encode('utf-8')),
+        ]
+
+    # small payloads, as streaming 1-3 byte chunks of a large one is slow
+    checks = [
+        ("Synthetic inventory, 20 devices", json.dumps(synthetic_inventory(20)).encode('utf-8')),
+        ("Synthetic client sessions, 20 sessions", json.dumps(synthetic_sessions(20)).encode('utf-8')),
+        ("Numbers", b'{"results": [1, 2.5, -0.25e-3, 1E+10, 12345678901234567890, {"rssi": -55.5}], "total": 2.5, "next": null}'),
+    ]
+
+    errors = [error for error in (check_stream(name, content) for name, content in checks) if error]
+
+    print("\nInstalled JSON backends: {} (* = selected)".format(", ".join(sorted(BACKENDS))))
+
+    for name, content in payloads:
+        bench_payload(name, content, args.number)
+
+    print("\nStreamed decode check (1-3 byte chunks): {}".format("FAILED" if errors else "OK"))
+
+    for error in errors:
+        print("    " + error)
+
+    print("")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
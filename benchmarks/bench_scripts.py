@@ -0,0 +1,152 @@
+"""
+bench_scripts.py - Time the report scripts end to end against a mock Mist API
+
+Runs each script in SCRIPTS as a separate process (as a user would run it),
+pointed at a local mock of the API (see mock_mist_api.py) via the
+MIST_BASE_URL env var, so no token or network access is required. Each
+script runs in a temporary folder (its reports are written to a 'reports'
+folder there & discarded).
+
+For each script, the median wall clock time of the runs is printed, with the
+records handled per second, API calls made per second & the peak resident
+memory (RSS) of the process. Peak RSS is read from the resource usage of the
+process, so this benchmark needs a Unix-like OS.
+
+The mock reports a very high call budget (X-RateLimit-* headers), so the
+scripts' rate limiters do not pace the calls & skew the timings.
+
+Usage (from the root of the repo):
+
+    python -m benchmarks.bench_scripts
+    python -m benchmarks.bench_scripts --sites 200 --devices 20 --clients 1000 --latency 0.02 --repeat 3
+    python -m benchmarks.bench_scripts --script aps_org_dump_to_csv --script simple_summary
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.mock_mist_api import MockMistApi
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# call budget reported by the mock
+BENCH_RATE_LIMIT = 10 ** 9
+
+
+def ap_count(org):
+    return len([device for device in org.inventory() if device['type'] == 'ap'])
+
+
+def apple_client_count(org):
+    sessions = org.client_sessions(org.sites[0]['id'])
+    return len({session['mac'] for session in sessions if session['client_manufacture'] == 'Apple'})
+
+
+def summary_count(org):
+    return len(org.sites) + len(org.wlans) + len(org.inventory())
+
+
+# script: (command line args, function returning number of records the script handles)
+SCRIPTS = {
+    'aps_org_dump_to_csv': ([], ap_count),
+    'aps_site_dump_to_csv': (['--all'], ap_count),
+    'clients_list_site_apple_to_csv': ([], apple_client_count),
+    'simple_summary': ([], summary_count),
+}
+
+
+def run_script(script, args, env, work_dir=None):
+    """
+    Run a script in a folder (default = a temporary folder), returning (wall
+    clock secs, peak RSS in MB, exit status, stderr output)
+    """
+
+    if work_dir is None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            return run_script(script, args, env, temp_dir)
+
+    os.makedirs(os.path.join(work_dir, 'reports'), exist_ok=True)
+
+    with tempfile.TemporaryFile(mode='w+') as stderr:
+
+        start_time = time.perf_counter()
+        process = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, script + '.py')] + args, cwd=work_dir,
+                                   env=env, stdout=subprocess.DEVNULL, stderr=stderr)
+
+        # wait4 returns the resource usage of just this process
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - start_time
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+        # ru_maxrss is in KB on Linux, bytes on macOS
+        peak_rss = usage.ru_maxrss / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0)
+
+        stderr.seek(0)
+        return elapsed, peak_rss, process.returncode, stderr.read()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmark the report scripts end to end against a mock Mist API")
+    parser.add_argument('--sites', type=int, default=50, help="number of sites in the mock org (default: 50)")
+    parser.add_argument('--devices', type=int, default=20, help="number of APs per site (default: 20)")
+    parser.add_argument('--clients', type=int, default=1000, help="number of client sessions per site (default: 1000)")
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds of delay added to each mock response (default: 0.02)")
+    parser.add_argument('--repeat', type=int, default=3, help="number of runs of each script (default: 3)")
+    parser.add_argument('--script', action='append', choices=sorted(SCRIPTS), help="script to run (may be repeated, default: all)")
+    args = parser.parse_args()
+
+    scripts = args.script if args.script else sorted(SCRIPTS)
+    failed = False
+
+    with MockMistApi(num_sites=args.sites, devices_per_site=args.devices, latency=args.latency,
+                     clients_per_site=args.clients, rate_limit=BENCH_RATE_LIMIT) as mock_api:
+
+        env = dict(os.environ, MIST_TOKEN='bench-token', MIST_ORG_ID=mock_api.org_id,
+                   MIST_SITE_ID=mock_api.org.sites[0]['id'], MIST_BASE_URL=mock_api.base_url)
+
+        print("\nMock org: {} sites, {} APs per site, {} client sessions per site, latency {}s per request\n".format(
+            args.sites, args.devices, args.clients, args.latency))
+        print("    {:<34}{:>10}{:>10}{:>12}{:>11}{:>10}{:>15}".format(
+            'Script', 'Time (s)', 'Records', 'Records/s', 'API calls', 'Calls/s', 'Peak RSS (MB)'))
+
+        for script in scripts:
+
+            script_args, count_records = SCRIPTS[script]
+            records = count_records(mock_api.org)
+            times = []
+            peak_rss = 0.0
+            calls = 0
+
+            for _ in range(args.repeat):
+
+                start_count = mock_api.request_count
+                elapsed, rss, status, errors = run_script(script, script_args, env)
+
+                if status != 0:
+                    print("\n    {} failed (exit status {}):\n{}".format(script, status, errors))
+                    failed = True
+                    break
+
+                times.append(elapsed)
+                peak_rss = max(peak_rss, rss)
+                calls = mock_api.request_count - start_count
+
+            if not times:
+                continue
+
+            median_time = statistics.median(times)
+            print("    {:<34}{:>10.3f}{:>10}{:>12.0f}{:>11}{:>10.0f}{:>15.1f}".format(
+                script, median_time, records, records / median_time, calls, calls / median_time, peak_rss))
+
+    print("")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
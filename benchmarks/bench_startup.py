@@ -0,0 +1,152 @@
+"""
+bench_startup.py - Check the startup time of the mist_utils.py entry point
+
+Times 'python mist_utils.py --help' (& any other command lines given) against
+a bare interpreter start ('python -c pass'), and fails (exit status 1) if the
+extra startup time is over budget. It also fails if:
+
+ - any module in HEAVY_MODULES is imported by 'mist_utils.py --help' (the
+   command registry must not import the scripts that implement commands)
+ - any module in ASYNC_MODULES is imported by modules.core.mist_verbs (which
+   every script imports, while few use asyncio)
+ - any script registered as a command does work (e.g. parses the command
+   line) when it is imported, rather than in its main() function
+
+The import time of each command's script is reported, for information.
+
+Usage (from the root of the repo):
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --budget-ms 30
+    python -m benchmarks.bench_startup --budget-ms 150 --cmd "token-list --help"
+"""
+
+import argparse
+import os
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+
+from mist_utils import COMMANDS
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that must not be imported just to show the list of commands
+HEAVY_MODULES = ('requests', 'asyncio', 'sqlite3', 'concurrent.futures', 'pyarrow', 'modules.core.mist_verbs')
+
+# modules that must not be imported by the (synchronous) API client
+ASYNC_MODULES = ('asyncio',)
+
+
+def run_python(args, env=None):
+
+    return subprocess.run([sys.executable] + args, cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+
+
+def time_command(args, number):
+    """
+    Return the median wall clock time (secs) of running python with args
+    """
+
+    times = []
+
+    for _ in range(number):
+        start_time = time.perf_counter()
+        run_python(args)
+        times.append(time.perf_counter() - start_time)
+
+    return statistics.median(times)
+
+
+def imported_modules(args):
+    """
+    Return a dict of module name to cumulative import time (secs) of the
+    modules imported when running python with args
+    """
+
+    modules = {}
+    result = run_python(['-X', 'importtime'] + args)
+
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(cumulative) / 1000000
+
+    return modules
+
+
+def check_import_side_effects(module_name):
+    """
+    Import a script with a bogus command line & no Mist env vars, returning
+    any error output (argparse would exit with an error if the script parses
+    the command line at import time)
+    """
+
+    env = {name: value for name, value in os.environ.items() if not name.startswith('MIST_')}
+    code = "import sys; sys.argv = ['{0}', '--no-such-option']; import {0}".format(module_name)
+    result = run_python(['-c', code], env=env)
+
+    return result.stderr.strip() if result.returncode else None
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Check startup time of the mist_utils.py entry point")
+    parser.add_argument('--budget-ms', type=float, default=50, help="max startup time over a bare interpreter (default: 50 ms)")
+    parser.add_argument('--cmd', action='append', default=[], help="extra mist_utils.py command line to time (may be repeated)")
+    parser.add_argument('--number', type=int, default=20, help="number of timed runs of each command line")
+    args = parser.parse_args()
+
+    failures = []
+
+    baseline = time_command(['-c', 'pass'], args.number)
+    print("\nBare interpreter start: {:.1f} ms\n".format(baseline * 1000))
+    print("    {:<40} {:>9} {:>9}".format("command", "total ms", "extra ms"))
+
+    for command in ['--help'] + args.cmd:
+        elapsed = time_command(['mist_utils.py'] + shlex.split(command), args.number)
+        extra = (elapsed - baseline) * 1000
+        over = extra > args.budget_ms
+
+        print("    {:<40} {:>9.1f} {:>9.1f}{}".format("mist_utils.py " + command, elapsed * 1000, extra,
+                                                       "  ** over budget **" if over else ""))
+        if over:
+            failures.append("mist_utils.py {} took {:.1f} ms over budget ({} ms)".format(command, extra, args.budget_ms))
+
+    heavy = [name for name in imported_modules(['mist_utils.py', '--help']) if name in HEAVY_MODULES]
+    if heavy:
+        failures.append("mist_utils.py --help imports: {}".format(", ".join(heavy)))
+
+    async_imports = [name for name in imported_modules(['-c', 'import modules.core.mist_verbs']) if name in ASYNC_MODULES]
+    if async_imports:
+        failures.append("modules.core.mist_verbs imports: {}".format(", ".join(async_imports)))
+
+    print("\n    {:<40} {:>9}".format("command script", "import ms"))
+
+    for command, (module_name, _) in sorted(COMMANDS.items()):
+
+        error = check_import_side_effects(module_name)
+        if error:
+            failures.append("importing {} ({}) has side effects: {}".format(module_name, command, error.splitlines()[-1]))
+            continue
+
+        import_time = imported_modules(['-c', 'import ' + module_name]).get(module_name, 0)
+        print("    {:<40} {:>9.1f}".format(module_name, import_time * 1000))
+
+    print("")
+
+    for failure in failures:
+        print("FAIL: " + failure)
+
+    print("{}\n".format("FAILED" if failures else "OK"))
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
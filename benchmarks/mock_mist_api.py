@@ -0,0 +1,660 @@
+"""
+mock_mist_api.py - A local mock of the Mist API for offline benchmarking
+
+Serves a synthetic organization (N sites, each with M APs & K client
+sessions) over plain http on localhost, with an optional fixed latency added
+to every response to simulate the round trip to api.mist.com. Only the API
+calls used by the scripts in this repo are implemented. Lists are paginated
+as the Mist API does (limit/page query params & X-Page-* headers, or a
+'next' link for searches), & every response carries an ETag.
+
+Usage (stand-alone, from the root of the repo):
+
+    python -m benchmarks.mock_mist_api --sites 50 --devices 10 --clients 200 --latency 0.05
+
+The scripts may then be pointed at the mock by setting the MIST_BASE_URL env
+var to the URL it prints (with MIST_ORG_ID set to the org_id it prints, &
+any value for MIST_TOKEN).
+
+Faults may be injected at random in to a share of responses, to see how the
+scripts cope with an API under stress (see FaultProfile & FAULT_PROFILES):
+
+    python -m benchmarks.mock_mist_api --faults mixed
+    python -m benchmarks.mock_mist_api --throttle-rate 0.05 --retry-after 2 --reset-rate 0.01
+
+Usage (from a benchmark):
+
+    from benchmarks.mock_mist_api import MockMistApi
+
+    with MockMistApi(num_sites=50, latency=0.05) as mock_api:
+        url = "{}/api/v1/orgs/{}/sites".format(mock_api.base_url, mock_api.org_id)
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import socket
+import struct
+import threading
+import uuid
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+ORG_ID = "00000000-0000-0000-0000-000000000001"
+DEVICE_MODELS = ["AP12", "AP32", "AP33", "AP43", "AP45", "AP63"]
+
+# (manufacturer, family, model, OS) of client devices
+CLIENT_TYPES = [
+    ("Apple", "iPhone", "iPhone 15", "iOS 17"),
+    ("Apple", "Mac", "MacBook Pro", "macOS 14"),
+    ("Apple", "iPad", "iPad Air", "iPadOS 17"),
+    ("Samsung", "Galaxy", "Galaxy S24", "Android 14"),
+    ("Intel", "PC", "AX211", "Windows 11"),
+    ("Google", "Pixel", "Pixel 8", "Android 14"),
+    ("Dell", "PC", "Latitude 7440", "Windows 11"),
+]
+BANDS = ["24", "5", "6"]
+
+# max results per search page (if no limit given)
+SEARCH_LIMIT = 100
+
+FAULTS = ('throttle', 'error', 'reset', 'slow', 'truncate')
+
+
+class FaultProfile(object):
+
+    """
+    Rates (0 to 1, the share of requests affected) of the faults injected in
+    to the responses of the mock API:
+
+     - throttle: HTTP 429 with a Retry-After header
+     - error: a burst of HTTP 503 responses (to this & the next requests)
+     - reset: the connection is reset (TCP RST) before a response is sent
+     - slow: the response body is sent in small pieces over 'slow_secs'
+     - truncate: the response body is cut short (a complete response with
+       invalid JSON, as sent by a failing proxy)
+
+    Arguments:
+        throttle_rate {optional float} -- [Share of requests throttled (default = 0)]
+        error_rate {optional float} -- [Share of requests starting a burst of 503s (default = 0)]
+        reset_rate {optional float} -- [Share of connections reset (default = 0)]
+        slow_rate {optional float} -- [Share of responses sent slowly (default = 0)]
+        truncate_rate {optional float} -- [Share of responses truncated (default = 0)]
+        retry_after {optional float} -- [Secs sent in the Retry-After header of 429s (default = 1)]
+        error_burst {optional int} -- [Number of consecutive 503s in a burst (default = 3)]
+        slow_secs {optional float} -- [Secs taken to send a slow response body (default = 0.5)]
+        seed {optional int} -- [Seed of the random choice of faults, for repeatable runs (default = None)]
+    """
+
+    def __init__(self, throttle_rate=0, error_rate=0, reset_rate=0, slow_rate=0, truncate_rate=0, retry_after=1,
+                 error_burst=3, slow_secs=0.5, seed=None):
+
+        self.rates = {
+            'throttle': throttle_rate,
+            'error': error_rate,
+            'reset': reset_rate,
+            'slow': slow_rate,
+            'truncate': truncate_rate,
+        }
+
+        if sum(self.rates.values()) > 1:
+            raise ValueError('Total of fault rates must not be over 1')
+
+        self.retry_after = retry_after
+        self.error_burst = error_burst
+        self.slow_secs = slow_secs
+
+        self.random = random.Random(seed)
+        self.burst_left = 0
+        self.counts = dict.fromkeys(FAULTS, 0)
+        self.lock = threading.Lock()
+
+    def pick(self):
+        """
+        Return the fault to inject in to a response (None for no fault)
+        """
+
+        with self.lock:
+
+            if self.burst_left:
+                self.burst_left -= 1
+                fault = 'error'
+
+            else:
+                fault = None
+                value = self.random.random()
+
+                for name in FAULTS:
+                    if value < self.rates[name]:
+                        fault = name
+                        break
+                    value -= self.rates[name]
+
+                if fault == 'error':
+                    self.burst_left = self.error_burst - 1
+
+            if fault:
+                self.counts[fault] += 1
+
+            return fault
+
+
+# fault profile name: FaultProfile args
+FAULT_PROFILES = {
+    'none': {},
+    'throttle': {'throttle_rate': 0.05},
+    'errors': {'error_rate': 0.02, 'error_burst': 3},
+    'slow': {'slow_rate': 0.1, 'slow_secs': 0.5},
+    'resets': {'reset_rate': 0.03},
+    'truncated': {'truncate_rate': 0.02},
+    'mixed': {'throttle_rate': 0.02, 'error_rate': 0.01, 'reset_rate': 0.01, 'slow_rate': 0.05, 'truncate_rate': 0.01},
+}
+
+
+class MockOrg(object):
+
+    """
+    A synthetic Mist organization
+
+    Arguments:
+        num_sites {optional int} -- [Number of sites in the org (default = 10)]
+        devices_per_site {optional int} -- [Number of APs on each site (default = 10)]
+        clients_per_site {optional int} -- [Number of client sessions on each site, over the last 24 hours (default = 0)]
+    """
+
+    def __init__(self, num_sites=10, devices_per_site=10, clients_per_site=0):
+
+        self.org_id = ORG_ID
+        self.name = "Mock Org"
+        self.sites = []
+        self.site_nums = {}
+        self.devices = {}
+        self.clients_per_site = clients_per_site
+        self.now = int(time.time())
+        self.sessions = {}
+        self.tokens = []
+        self.lock = threading.Lock()
+
+        for site_num in range(num_sites):
+
+            site_id = "00000000-0000-0000-0001-{:012d}".format(site_num)
+            self.sites.append({
+                "id": site_id,
+                "org_id": self.org_id,
+                "name": "Site {:04d}".format(site_num),
+                "timezone": "Europe/London",
+                "country_code": "GB",
+            })
+
+            self.site_nums[site_id] = site_num
+            self.devices[site_id] = []
+
+            for device_num in range(devices_per_site):
+                serial_num = site_num * devices_per_site + device_num
+                self.devices[site_id].append({
+                    "id": "00000000-0000-0000-1000-{:012x}".format(serial_num),
+                    "mac": "5c5b35{:06x}".format(serial_num),
+                    "serial": "A{:011d}".format(serial_num),
+                    "name": "AP-{:04d}-{:03d}".format(site_num, device_num),
+                    "model": DEVICE_MODELS[serial_num % len(DEVICE_MODELS)],
+                    "type": "ap",
+                    "site_id": site_id,
+                    "org_id": self.org_id,
+                })
+
+        self.wlans = [{"id": "wlan-{}".format(num), "ssid": "SSID-{}".format(num)} for num in range(4)]
+
+    def inventory(self):
+        return [device for site_devices in self.devices.values() for device in site_devices]
+
+    def update_device(self, site_id, device_id, update):
+        """
+        Apply an update to a device, returning the updated device (or None
+        if the site has no such device)
+        """
+
+        with self.lock:
+            for device in self.devices.get(site_id, []):
+                if device["id"] == device_id:
+                    device.update({name: value for name, value in update.items() if name not in ("id", "site_id", "org_id")})
+                    return dict(device)
+
+        return None
+
+    def client_sessions(self, site_id):
+        """
+        Return the client sessions of a site (oldest first). Each client has
+        two sessions, so reports must de-duplicate clients by MAC.
+        """
+
+        if site_id not in self.site_nums:
+            return None
+
+        with self.lock:
+            if site_id not in self.sessions:
+                self.sessions[site_id] = self._make_sessions(site_id, self.site_nums[site_id])
+
+            return self.sessions[site_id]
+
+    def _make_sessions(self, site_id, site_num):
+
+        sessions = []
+        devices = self.devices[site_id]
+
+        for session_num in range(self.clients_per_site):
+            client_num = session_num // 2
+            manufacturer, family, model, client_os = CLIENT_TYPES[client_num % len(CLIENT_TYPES)]
+            timestamp = self.now - 86400 + session_num * 86400 // self.clients_per_site
+
+            sessions.append({
+                "mac": "{:04x}{:08x}".format(site_num, client_num),
+                "client_manufacture": manufacturer,
+                "client_family": family,
+                "client_model": model,
+                "client_os": client_os,
+                "band": BANDS[client_num % len(BANDS)],
+                "ap": devices[session_num % len(devices)]["mac"] if devices else None,
+                "site_id": site_id,
+                "org_id": self.org_id,
+                "connect": timestamp,
+                "disconnect": timestamp + 600,
+                "duration": 600,
+                "timestamp": timestamp,
+            })
+
+        return sessions
+
+    def stats(self):
+        """
+        Return the org stats
+        """
+
+        inventory = self.inventory()
+        disconnected = len(inventory) // 10
+
+        return {
+            "id": self.org_id,
+            "name": self.name,
+            "orggroup_ids": [],
+            "allow_mist": False,
+            "num_inventory": len(inventory),
+            "num_devices": len(inventory),
+            "num_devices_connected": len(inventory) - disconnected,
+            "num_devices_disconnected": disconnected,
+            "num_sites": len(self.sites),
+            "num_clients": self.clients_per_site * len(self.sites) // 2,
+            "sle": [],
+        }
+
+    def find_token(self, key):
+        """
+        Return the API token with a key, adding it if not yet known (so the
+        token used to call the mock is always in the token list)
+        """
+
+        with self.lock:
+            for token in self.tokens:
+                if token["key"] == key:
+                    return token
+
+            return self._add_token(key)
+
+    def create_token(self):
+
+        with self.lock:
+            return self._add_token(uuid.uuid4().hex + uuid.uuid4().hex[:8])
+
+    def _add_token(self, key):
+
+        token = {"id": str(uuid.uuid4()), "key": key, "created_time": int(time.time()), "last_used": None}
+        self.tokens.append(token)
+
+        return token
+
+    def list_tokens(self):
+        """
+        Return the API tokens, with their keys masked (as the Mist API does)
+        """
+
+        with self.lock:
+            return [dict(token, key="{}...{}".format(token["key"][:4], token["key"][-4:])) for token in self.tokens]
+
+    def delete_token(self, token_id):
+
+        with self.lock:
+            for token in self.tokens:
+                if token["id"] == token_id:
+                    self.tokens.remove(token)
+                    return True
+
+        return False
+
+
+class MockMistHandler(BaseHTTPRequestHandler):
+
+    """
+    Request handler for the mock API. Routes are matched against the URL
+    path, list responses are paginated in the same way as the Mist API
+    (limit/page query params, X-Page-* response headers), searches return a
+    page of 'results' & a 'next' link
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def begin_request(self):
+        """
+        Count the request, wait for the configured latency & return the
+        parsed URL, query params & the API token of the caller (or None if
+        a fault has been sent in place of the response)
+        """
+
+        server = self.server
+
+        with server.count_lock:
+            server.request_count += 1
+
+        time.sleep(server.latency)
+
+        # read any request body, so the connection may be re-used
+        self.body = self.rfile.read(int(self.headers["Content-Length"])) if self.headers.get("Content-Length") else b""
+
+        self.fault = server.faults.pick() if server.faults else None
+
+        if self.fault == 'throttle':
+            self.send_json(429, {"detail": "Too Many Requests"}, {"Retry-After": str(server.faults.retry_after)})
+            return None
+
+        if self.fault == 'error':
+            self.send_json(503, {"detail": "Service Unavailable"})
+            return None
+
+        if self.fault == 'reset':
+            # close with SO_LINGER 0, so the client sees a TCP RST
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            self.close_connection = True
+            return None
+
+        url = urlsplit(self.path)
+        key = self.headers.get("Authorization", "").replace("Token ", "")
+        token = server.org.find_token(key) if key else None
+
+        return url, parse_qs(url.query), token
+
+    def do_GET(self):
+
+        request = self.begin_request()
+        if request is None:
+            return
+
+        url, query, token = request
+        org = self.server.org
+
+        match = re.match(r"^/api/v1/sites/([^/]+)/clients/sessions/search$", url.path)
+        if match:
+            sessions = org.client_sessions(match.group(1))
+            if sessions is None:
+                self.send_json(404, {"detail": "Not found"})
+            else:
+                self.send_search(sessions, url.path, query)
+            return
+
+        routes = [
+            (r"^/api/v1/self$", lambda match: {"email": "mock@example.com", "first_name": "Mock", "last_name": "User"}),
+            (r"^/api/v1/self/apitokens$", lambda match: org.list_tokens()),
+            (r"^/api/v1/orgs/[^/]+/stats$", lambda match: org.stats()),
+            (r"^/api/v1/orgs/[^/]+/sites$", lambda match: org.sites),
+            (r"^/api/v1/orgs/[^/]+/inventory$", lambda match: org.inventory()),
+            (r"^/api/v1/orgs/[^/]+/wlans$", lambda match: org.wlans),
+            (r"^/api/v1/sites/([^/]+)/devices$", lambda match: org.devices.get(match.group(1))),
+        ]
+
+        for pattern, handler in routes:
+            match = re.match(pattern, url.path)
+            if match:
+                data = handler(match)
+                if data is None:
+                    break
+                if isinstance(data, list):
+                    self.send_list(data, query)
+                else:
+                    self.send_json(200, data)
+                return
+
+        self.send_json(404, {"detail": "Not found"})
+
+    def do_POST(self):
+
+        request = self.begin_request()
+        if request is None:
+            return
+
+        url, query, token = request
+
+        if url.path == "/api/v1/self/apitokens":
+            self.send_json(200, self.server.org.create_token())
+        else:
+            self.send_json(404, {"detail": "Not found"})
+
+    def do_PUT(self):
+
+        request = self.begin_request()
+        if request is None:
+            return
+
+        url, query, token = request
+
+        match = re.match(r"^/api/v1/sites/([^/]+)/devices/([^/]+)$", url.path)
+        device = self.server.org.update_device(match.group(1), match.group(2), json.loads(self.body)) if match else None
+
+        if device is None:
+            self.send_json(404, {"detail": "Not found"})
+        else:
+            self.send_json(200, device)
+
+    def do_DELETE(self):
+
+        request = self.begin_request()
+        if request is None:
+            return
+
+        url, query, token = request
+
+        match = re.match(r"^/api/v1/self/apitokens/([^/]+)$", url.path)
+        if match and self.server.org.delete_token(match.group(1)):
+            self.send_json(200, {})
+        else:
+            self.send_json(404, {"detail": "Not found"})
+
+    def send_list(self, data, query):
+        """
+        Send a page of a list response
+        """
+
+        limit = int(query.get("limit", [100])[0])
+        page = int(query.get("page", [1])[0])
+        records = data[(page - 1) * limit:page * limit]
+
+        page_headers = {
+            "X-Page-Limit": str(limit),
+            "X-Page-Page": str(page),
+            "X-Page-Total": str(len(data)),
+        }
+        self.send_json(200, records, page_headers)
+
+    def send_search(self, sessions, path, query):
+        """
+        Send a page of a search response, filtered by the query params
+        (start, end & any field of the records, e.g. client_manufacture)
+        """
+
+        limit = int(query.get("limit", [SEARCH_LIMIT])[0])
+        offset = int(query.get("offset", [0])[0])
+        start = int(query.get("start", [0])[0])
+        end = int(query.get("end", [self.server.org.now])[0])
+        filters = {name: values[0] for name, values in query.items() if name not in ("limit", "offset", "start", "end", "page")}
+
+        matched = [session for session in sessions if start <= session["timestamp"] < end and
+                   all(str(session.get(name)) == value for name, value in filters.items())]
+
+        data = {
+            "results": matched[offset:offset + limit],
+            "start": start,
+            "end": end,
+            "limit": limit,
+            "total": len(matched),
+        }
+
+        if offset + limit < len(matched):
+            params = dict(filters, start=start, end=end, limit=limit, offset=offset + limit)
+            data["next"] = "{}?{}".format(path, urlencode(params))
+
+        self.send_json(200, data)
+
+    def send_json(self, status, data, extra_headers=None):
+
+        body = json.dumps(data).encode("utf-8")
+        etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+
+        # honour conditional requests for unchanged data
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            status = 304
+            body = b""
+
+        self.send_response(status)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Type", "application/json")
+
+        if self.server.rate_limit:
+            self.send_header("X-RateLimit-Limit", str(self.server.rate_limit))
+            self.send_header("X-RateLimit-Remaining", str(max(0, self.server.rate_limit - self.server.request_count)))
+
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+
+        if status == 200 and self.fault == 'truncate':
+            body = body[:len(body) // 2]
+
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        if status == 200 and self.fault == 'slow':
+            pieces = 10
+            size = len(body) // pieces + 1
+
+            for start in range(0, len(body), size):
+                self.wfile.write(body[start:start + size])
+                self.wfile.flush()
+                time.sleep(self.server.faults.slow_secs / pieces)
+        else:
+            self.wfile.write(body)
+
+
+class MockServer(ThreadingHTTPServer):
+
+    # the default listen backlog (5) drops connections opened in a burst
+    # by many workers at once, which then wait ~1 sec to be retried
+    request_queue_size = 128
+
+
+class MockMistApi(object):
+
+    """
+    Runs the mock API in a background thread. May be used as a context
+    manager, which starts & stops the server.
+
+    Arguments:
+        num_sites {optional int} -- [Number of sites in the org (default = 10)]
+        devices_per_site {optional int} -- [Number of APs on each site (default = 10)]
+        latency {optional float} -- [Seconds of delay added to each response (default = 0)]
+        port {optional int} -- [TCP port to listen on (default = 0, any free port)]
+        clients_per_site {optional int} -- [Number of client sessions on each site (default = 0)]
+        rate_limit {optional int} -- [Hourly call limit reported in X-RateLimit-* headers (default = None, no headers)]
+        faults {optional FaultProfile obj} -- [Faults injected in to responses (default = None, no faults)]
+    """
+
+    def __init__(self, num_sites=10, devices_per_site=10, latency=0, port=0, clients_per_site=0, rate_limit=None,
+                 faults=None):
+
+        self.org = MockOrg(num_sites, devices_per_site, clients_per_site)
+        self.org_id = self.org.org_id
+
+        self.server = MockServer(("127.0.0.1", port), MockMistHandler)
+        self.server.daemon_threads = True
+        self.server.org = self.org
+        self.server.latency = latency
+        self.server.rate_limit = rate_limit
+        self.server.faults = faults
+        self.server.request_count = 0
+        self.server.count_lock = threading.Lock()
+
+        self.base_url = "http://127.0.0.1:{}".format(self.server.server_port)
+        self.thread = None
+
+    @property
+    def request_count(self):
+        """
+        Number of requests received by the mock
+        """
+
+        return self.server.request_count
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Run a local mock of the Mist API")
+    parser.add_argument('--sites', type=int, default=10, help="number of sites in the org")
+    parser.add_argument('--devices', type=int, default=10, help="number of APs per site")
+    parser.add_argument('--clients', type=int, default=0, help="number of client sessions per site")
+    parser.add_argument('--latency', type=float, default=0, help="seconds of delay added to each response")
+    parser.add_argument('--rate-limit', type=int, help="hourly call limit reported in X-RateLimit-* headers")
+    parser.add_argument('--port', type=int, default=8080, help="port to listen on")
+    parser.add_argument('--faults', choices=sorted(FAULT_PROFILES), help="named fault profile (see FAULT_PROFILES)")
+    parser.add_argument('--throttle-rate', type=float, help="share of requests answered with 429")
+    parser.add_argument('--retry-after', type=float, help="secs sent in the Retry-After header of 429s")
+    parser.add_argument('--error-rate', type=float, help="share of requests starting a burst of 503s")
+    parser.add_argument('--reset-rate', type=float, help="share of connections reset")
+    parser.add_argument('--slow-rate', type=float, help="share of response bodies sent slowly")
+    parser.add_argument('--truncate-rate', type=float, help="share of response bodies truncated")
+    args = parser.parse_args()
+
+    fault_args = dict(FAULT_PROFILES[args.faults]) if args.faults else {}
+
+    for name in ('throttle_rate', 'retry_after', 'error_rate', 'reset_rate', 'slow_rate', 'truncate_rate'):
+        if getattr(args, name) is not None:
+            fault_args[name] = getattr(args, name)
+
+    faults = FaultProfile(**fault_args) if fault_args else None
+
+    mock_api = MockMistApi(args.sites, args.devices, args.latency, args.port, args.clients, args.rate_limit, faults)
+    print("Mock Mist API listening on {} (org_id: {})".format(mock_api.base_url, mock_api.org_id))
+
+    try:
+        mock_api.server.serve_forever()
+    except KeyboardInterrupt:
+        mock_api.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,27 +6,23 @@ before trying to execute any scripts
 Checks:
 
  1. DNS lookup
- 2. Network connectivity: can we get to api.mist.com?
+ 2. Network connectivity: can we get to the Mist API URL (api.mist.com, unless
+    overridden by MIST_BASE_URL)?
  3. Have we got an API key configured?
  4. Can we do a basic API call?
 
 """
 
 import requests
-import os
 import socket
 import json
-from pprint import pprint
+import argparse
 from http.client import responses
+from urllib.parse import urlsplit
 from modules.core.banner import header, footer
 from modules.core.get_vars import GetVars
 
-# supply required token
-vars_obj = GetVars()
-vars_found = vars_obj.find_vars()
-api_token = vars_found.get('token')
-
-def check_env():
+def check_env(api_token, base_url):
 
     total_tests = 4
     passed_count = 0
@@ -35,17 +31,17 @@ def check_env():
 
     print("Executing tests to check if our environment is \nsuitable to use Mist API:\n")
 
-    print("1. Checking our DNS is good (looking up api.mist.com)...")
+    host = urlsplit(base_url).hostname
+    print("1. Checking our DNS is good (looking up {})...".format(host))
 
     try:
-        socket.gethostbyname("api.mist.com")
+        socket.gethostbyname(host)
         print("   Result: OK.\n")
         passed_count += 1
     except:
         print("   Result: ** Fail ** (Check your DNS settings or network connectivity) .\n")
 
 
-    base_url = "https://api.mist.com"
     print("2. Checking we can get to Mist API URL ({})...".format(base_url))
 
     session = requests.Session()
@@ -72,7 +68,7 @@ def check_env():
                 'Authorization': 'Token {}'.format(api_token)
     }
 
-    url = "https://api.mist.com//api/v1/self"
+    url = "{}/api/v1/self".format(base_url)
 
     try:
         response = session.get(url, headers=headers,  timeout=2)
@@ -98,8 +94,20 @@ def check_env():
 
 
 
-def main():
-    check_env()
+def main(argv=None):
+
+    # create parser args
+    parse_descr = "Script to check your environment is set up to use the Mist API \n"
+    parser = argparse.ArgumentParser(description=parse_descr)
+    parser.parse_args(argv)
+
+    # supply required token
+    vars_obj = GetVars()
+    vars_found = vars_obj.find_vars()
+    api_token = vars_found.get('token')
+    base_url = vars_found.get('base_url')
+
+    check_env(api_token, base_url)
 
 
 if __name__ == "__main__":
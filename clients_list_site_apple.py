@@ -16,30 +16,36 @@ that is private to your environment, not a global var on the machine that
 you are working on.
 """
 
-import os
 import sys
+import argparse
 from pprint import pprint
 
 from modules.core.logger import ScriptLogger
 from modules.core.mist_verbs import MistVerbs
+from modules.core.mist_errors import MistApiError
 from modules.core.stopwatch import StopWatch
 from modules.core.get_vars import GetVars
 from modules.core.banner import header, footer
 
-logger = ScriptLogger('mist-api')
-logger.info("Starting script...")
+# define URLs
+clients_url = "{}/api/v1/sites/{}/clients/sessions/search?client_manufacture=Apple"
 
-# supply required token
-vars_obj = GetVars()
-vars_found = vars_obj.find_vars()
-api_token = vars_found.get('token')
-site_id = vars_found.get('site_id')
+def main(argv=None):
 
-# define URLs
-base_url = "https://api.mist.com"
-clients_url = "{}/api/v1/sites/{}/clients/sessions/search?client_manufacture=Apple".format(base_url, site_id)
+    # create parser args
+    parse_descr = "Script to list all Apple clients of a specific site (env var MIST_SITE_ID) \n"
+    parser = argparse.ArgumentParser(description=parse_descr)
+    parser.parse_args(argv)
+
+    logger = ScriptLogger('mist-api')
+    logger.info("Starting script...")
 
-def main():
+    # supply required token
+    vars_obj = GetVars()
+    vars_found = vars_obj.find_vars()
+    api_token = vars_found.get('token')
+    base_url = vars_found.get('base_url')
+    site_id = vars_found.get('site_id')
 
     timer = StopWatch()
     timer.start()
@@ -57,7 +63,13 @@ def main():
     logger.info("Getting clients.")
     
     verb_obj = MistVerbs(api_token)
-    clients = verb_obj.mist_read(clients_url)
+
+    try:
+        clients = verb_obj.mist_read(clients_url.format(base_url, site_id))
+    except MistApiError as err:
+        logger.error("Unable to get clients: {}".format(err))
+        sys.exit(1)
+
     pprint(clients)
 
     logger.info("Script complete.")
@@ -5,6 +5,12 @@ clients_list_site_apple.py - List Apple clients on a site
 This script will list all Apple clients on a specific site and dunp them
 to a CSV file.
 
+By default the API's default search period is used. A longer period may be
+searched using --hours (the last N hours) or --start/--end. The period is
+split in to time shards (--shard-hours) that are searched concurrently,
+with any shard that hits the per-query result limit split again, so that
+no sessions are lost.
+
 To use this script, you must set the following environmental variables that
 are used by the script:
 
@@ -17,43 +23,141 @@ that is private to your environment, not a global var on the machine that
 you are working on.
 """
 
-import os
 import sys
-import csv
+import time
+import asyncio
 from datetime import datetime
 import argparse
 
 from modules.core.logger import ScriptLogger
 from modules.core.mist_verbs import MistVerbs
-from modules.core.stopwatch import StopWatch
+from modules.core.mist_errors import MistApiError
+from modules.core.async_mist_verbs import AsyncMistVerbs
+from modules.core.query_sharder import QuerySharder
+from modules.core.report_writer import write_report, create_report_writer, check_report_options, REPORT_FORMATS, COMPRESSIONS
+from modules.core.stopwatch import StopWatch, Phase
 from modules.core.get_vars import GetVars
 from modules.core.banner import header, footer
 
-# create parser args
-parse_descr = "Script to dump all Apple device details for a specific site (env var MIST_SITE_ID) in to a CSV report (date-stamped reports dumped in the 'reports' folder) \n"
-parser = argparse.ArgumentParser(description=parse_descr)
-#parser.add_argument('site_id')
+# define URLs
+apple_clients_url = "{}/api/v1/sites/{}/clients/sessions/search?client_manufacture=Apple"
 
-args = parser.parse_args()
+def parse_time(value):
+    """
+    Convert a time given on the command line to epoch secs
+    """
 
-# set up logging
-logger = ScriptLogger('mist-api')
-logger.info("Starting script...")
+    if value.isdigit():
+        return int(value)
 
-# supply required token
-vars_obj = GetVars()
-vars_found = vars_obj.find_vars()
-api_token = vars_found.get('token')
-site_id = vars_found.get('site_id')
+    for time_format in ('%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return int(datetime.strptime(value, time_format).timestamp())
+        except ValueError:
+            pass
 
-# define URLs
-base_url = "https://api.mist.com"
-apple_clients_url = "{}/api/v1/sites/{}/clients/sessions/search?client_manufacture=Apple".format(base_url, site_id)
+    raise ValueError("Unable to parse time: {}".format(value))
+
+
+def client_row(device):
+    """
+    Return the report row of a client session
+    """
+
+    return {
+        "client_manufacture": device['client_manufacture'],
+        "client_family": device['client_family'],
+        "client_model": device['client_model'],
+        "client_os": device['client_os'],
+        "band": device['band'],
+        "mac": device['mac'],
+    }
+
+
+def client_rows(sessions):
+    """
+    Generator to return a report row for each client in a list of sessions
+    (only the first session of each client is used)
+    """
+
+    mac_set = set()
+
+    for device in sessions:
+
+        # do not add duplicates
+        if device['mac'] in mac_set:
+            continue
+
+        mac_set.add(device['mac'])
+
+        yield client_row(device)
+
+
+async def dump_sharded(api_token, url, start, end, shard_seconds, limit, workers, writer, logger):
+    """
+    Search the sessions of the period in concurrent time shards, writing a
+    row for each new client to the report as each shard completes (so the
+    sessions of the whole period are never held in memory)
+    """
+
+    mac_set = set()
+
+    async with AsyncMistVerbs(api_token, concurrency=workers) as verb_obj:
+        sharder = QuerySharder(verb_obj, shard_seconds=shard_seconds, limit=limit)
+
+        async for device in sharder.iter_search(url, start, end):
+
+            # do not add duplicates
+            if device['mac'] in mac_set:
+                continue
 
-# define CSV file name
-report_file = 'reports/Apple_Devices_Site_' + str(datetime.now().strftime('%Y_%m_%d_%H_%M_%S')) + '.csv'
+            mac_set.add(device['mac'])
+            writer.write_row(client_row(device))
 
-def main():
+    logger.info("Shard stats: {}".format(sharder.stats()))
+
+
+def main(argv=None):
+
+    # create parser args
+    parse_descr = "Script to dump all Apple device details for a specific site (env var MIST_SITE_ID) in to a CSV report (date-stamped reports dumped in the 'reports' folder) \n"
+    parser = argparse.ArgumentParser(description=parse_descr)
+    #parser.add_argument('site_id')
+    parser.add_argument('--hours', type=float, help="search the last N hours")
+    parser.add_argument('--start', help="start of search period (epoch secs, 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM')")
+    parser.add_argument('--end', help="end of search period (default: now)")
+    parser.add_argument('--shard-hours', type=float, default=1, help="size of time shards searched concurrently (default: 1)")
+    parser.add_argument('--limit', type=int, default=1000, help="max results per query, shards hitting this are split (default: 1000)")
+    parser.add_argument('--format', choices=REPORT_FORMATS, default='csv', help="report file format (parquet & arrow require pyarrow, default: csv)")
+    parser.add_argument('--compress', choices=COMPRESSIONS, help="compress the report as it is written (zstd CSV reports require zstandard)")
+    parser.add_argument('--compress-level', type=int, help="compression level (default: 6 for gzip, 3 for zstd)")
+    parser.add_argument('--workers', type=int, default=10, help="number of shards searched concurrently (default: 10)")
+
+    args = parser.parse_args(argv)
+
+    try:
+        check_report_options(args.format, args.compress)
+    except (ValueError, ImportError) as err:
+        parser.error(str(err))
+
+    if args.end and not (args.hours or args.start):
+        parser.error("--end requires --hours or --start")
+
+    # set up logging
+    logger = ScriptLogger('mist-api')
+    logger.info("Starting script...")
+
+    # supply required token
+    vars_obj = GetVars()
+    vars_found = vars_obj.find_vars()
+    api_token = vars_found.get('token')
+    base_url = vars_found.get('base_url')
+    site_id = vars_found.get('site_id')
+
+    clients_url = apple_clients_url.format(base_url, site_id)
+
+    # define CSV file name
+    report_file = 'reports/Apple_Devices_Site_' + str(datetime.now().strftime('%Y_%m_%d_%H_%M_%S')) + '.csv'
 
     timer = StopWatch()
     timer.start()
@@ -68,44 +172,36 @@ def main():
     
     header()
 
-    logger.info("Getting tokens.")
-    
-    verb_obj = MistVerbs(api_token)
-    apple_devices = verb_obj.mist_read(apple_clients_url)
-
-    dict_data = []
-    mac_list = []
-    
-    for device in apple_devices['results']:
-        dict = {
-            "client_manufacture": device['client_manufacture'],
-            "client_family": device['client_family'],
-            "client_model": device['client_model'],
-            "client_os": device['client_os'],
-            "band": device['band'],
-            "mac": device['mac'],
-        }
-
-
-        # add to device dict, but do not add duplicates
-        if not device['mac'] in mac_list:
-            dict_data.append(dict)
-            mac_list.append(device['mac'])
-
-    logger.info("Dumping CSV device report file: {}.".format(report_file))
+    logger.info("Getting clients.")
 
     column_headers = ["client_manufacture", "client_family", "client_model", "client_os", "mac", "band"]
+    column_types = {name: 'dictionary' for name in column_headers if name != 'mac'}
 
     try:
-        with open(report_file, 'w', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=column_headers)
-            writer.writeheader()
+        if args.hours or args.start:
+            end = parse_time(args.end) if args.end else int(time.time())
+            start = parse_time(args.start) if args.start else end - int(args.hours * 3600)
+
+            with Phase('write report'), create_report_writer(report_file, column_headers, args.format, column_types,
+                                                             args.compress, args.compress_level) as writer:
+                logger.info("Dumping report file: {}.".format(writer.report_file))
+                asyncio.run(dump_sharded(api_token, clients_url, start, end, int(args.shard_hours * 3600),
+                                         args.limit, args.workers, writer, logger))
+
+            logger.info("{} rows written (first row after {:.2f} sec).".format(writer.rows_written, writer.first_row_time or 0))
 
-            for dict in dict_data:
-                writer.writerow(dict)
+        else:
+            verb_obj = MistVerbs(api_token)
+            sessions = verb_obj.mist_iter(clients_url, stream=True)
+            write_report(client_rows(sessions), report_file, column_headers, logger, args.format, column_types,
+                         args.compress, args.compress_level)
 
     except IOError as err:
-        logger.error("CSV I/O error: {}".format(err))
+        logger.error("Report I/O error: {}".format(err))
+    except MistApiError as err:
+        # the sessions are read as the report is written
+        logger.error("Unable to get clients, report is incomplete: {}".format(err))
+        sys.exit(1)
 
     logger.info("Script complete.")
     timer.stop()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+"""
+clients_org_dump_to_csv.py - Dump the clients of all sites in an org to a CSV file
+
+This script will search the client sessions of every site in an org and
+dump the clients found to a CSV file. Client details are taken from the
+first session seen for each client MAC address (so each client appears
+only once, even if it has roamed between sites).
+
+The sites are searched concurrently (--workers sets how many at once) and
+rows are written to the CSV file as each page of results arrives. Clients
+may be limited to a specific manufacturer with --manufacturer (e.g. Apple).
+Reports are CSV files by default, or Parquet/Arrow files with --format, and
+may be compressed as they are written with --compress.
+
+To use this script, you must set the following environmental variables that
+are used by the script:
+
+    MIST_TOKEN - A valid API token created for access to your organization
+    MIST_ORG_ID - The organization ID of your org
+
+These are required to prevent the requirement for hard coding them in to
+script of an accompanying config file. These variables should be created
+as env vars that are private to your environment, not global vars on the
+machine that you are working on.
+"""
+
+import sys
+import asyncio
+from datetime import datetime
+from urllib.parse import urlencode
+import argparse
+
+from modules.core.logger import ScriptLogger
+from modules.core.async_mist_verbs import AsyncMistVerbs
+from modules.core.mist_errors import MistApiError
+from modules.core.report_writer import create_report_writer, check_report_options, REPORT_FORMATS, COMPRESSIONS
+from modules.core.stopwatch import StopWatch
+from modules.core.get_vars import GetVars
+from modules.core.banner import header, footer
+
+# define URLs
+sites_url = "{}/api/v1/orgs/{}/sites"
+clients_search_url = "{}/api/v1/sites/{}/clients/sessions/search"
+
+column_headers = ["client_manufacture", "client_family", "client_model", "client_os", "mac", "band", "site_id", "site_name"]
+column_types = {name: 'dictionary' for name in column_headers if name != 'mac'}
+
+
+async def dump_site_clients(verb_obj, base_url, site, writer, mac_set, search_params):
+    """
+    Search the client sessions of a site & write a row for each client not
+    already seen, returning the number of rows written
+    """
+
+    url = clients_search_url.format(base_url, site['id'])
+    if search_params:
+        url += '?' + urlencode(search_params)
+
+    rows_written = 0
+
+    async for sessions in verb_obj.mist_iter_pages(url):
+
+        for session in sessions:
+
+            # add to report, but do not add duplicates
+            if session['mac'] in mac_set:
+                continue
+
+            mac_set.add(session['mac'])
+            writer.write_row({
+                "client_manufacture": session.get('client_manufacture'),
+                "client_family": session.get('client_family'),
+                "client_model": session.get('client_model'),
+                "client_os": session.get('client_os'),
+                "mac": session['mac'],
+                "band": session.get('band'),
+                "site_id": site['id'],
+                "site_name": site['name'],
+            })
+            rows_written += 1
+
+    return rows_written
+
+
+async def dump_org_clients(verb_obj, base_url, org_id, writer, search_params, logger):
+    """
+    Search all sites of the org concurrently (up to the concurrency of the
+    AsyncMistVerbs object), returning the number of clients written & the
+    number of sites that failed
+    """
+
+    mac_set = set()
+    failed = 0
+
+    logger.info("Getting sites info.")
+    sites = await verb_obj.mist_read_all(sites_url.format(base_url, org_id))
+
+    # limit the number of sites in progress, as each site task holds a
+    # paged search open until all of its pages have been read
+    semaphore = asyncio.Semaphore(verb_obj.concurrency)
+
+    async def dump_site(site):
+        async with semaphore:
+            try:
+                return site, await dump_site_clients(verb_obj, base_url, site, writer, mac_set, search_params), None
+            except MistApiError as err:
+                return site, 0, err
+
+    tasks = [dump_site(site) for site in sites]
+    total = len(tasks)
+
+    for count, task in enumerate(asyncio.as_completed(tasks), 1):
+
+        site, rows_written, error = await task
+
+        if error:
+            failed += 1
+            logger.error("[{}/{}] Site {} failed: {}".format(count, total, site['name'], error))
+        else:
+            logger.info("[{}/{}] Site {}: {} new clients".format(count, total, site['name'], rows_written))
+
+    return len(mac_set), failed
+
+
+async def search_org_clients(api_token, base_url, org_id, writer, search_params, workers, logger):
+    """
+    Search all sites of the org using a new AsyncMistVerbs object with
+    'workers' concurrent requests (see dump_org_clients())
+    """
+
+    async with AsyncMistVerbs(api_token, concurrency=workers) as verb_obj:
+        return await dump_org_clients(verb_obj, base_url, org_id, writer, search_params, logger)
+
+
+def main(argv=None):
+
+    # create parser args
+    parse_descr = "Script to dump the clients of all sites in an org in to a CSV report (date-stamped reports dumped in the 'reports' folder) \n"
+    parser = argparse.ArgumentParser(description=parse_descr)
+    parser.add_argument('--manufacturer', help="only dump clients of this manufacturer (e.g. Apple)")
+    parser.add_argument('--format', choices=REPORT_FORMATS, default='csv', help="report file format (parquet & arrow require pyarrow, default: csv)")
+    parser.add_argument('--compress', choices=COMPRESSIONS, help="compress the report as it is written (zstd CSV reports require zstandard)")
+    parser.add_argument('--compress-level', type=int, help="compression level (default: 6 for gzip, 3 for zstd)")
+    parser.add_argument('--workers', type=int, default=10, help="number of sites searched concurrently (default: 10)")
+
+    args = parser.parse_args(argv)
+
+    try:
+        check_report_options(args.format, args.compress)
+    except (ValueError, ImportError) as err:
+        parser.error(str(err))
+
+    # set up logging
+    logger = ScriptLogger('mist_api')
+    logger.info("Starting script...")
+
+    # supply required token
+    vars_obj = GetVars()
+    vars_found = vars_obj.find_vars()
+    api_token = vars_found.get('token')
+    base_url = vars_found.get('base_url')
+    org_id = vars_found.get('org_id')
+
+    search_params = {'client_manufacture': args.manufacturer} if args.manufacturer else {}
+
+    # define CSV file name
+    report_file = 'reports/Clients_Org_' + str(datetime.now().strftime('%Y_%m_%d_%H_%M_%S')) + '.csv'
+
+    timer = StopWatch()
+    timer.start()
+
+    if not api_token:
+        print("You must define a valid API key using the MIST_TOKEN environmental variable name to use this script...exiting.")
+        sys.exit()
+
+    if not org_id:
+        print("You must define a valid organization ID using the MIST_ORG_ID environmental variable name to use this script...exiting.")
+        sys.exit()
+
+    header()
+
+    try:
+        with create_report_writer(report_file, column_headers, args.format, column_types,
+                                  args.compress, args.compress_level) as writer:
+            logger.info("Dumping client report file: {}.".format(writer.report_file))
+            clients, failed = asyncio.run(search_org_clients(api_token, base_url, org_id, writer, search_params, args.workers, logger))
+
+        logger.info("{} unique clients dumped (first row after {:.2f} sec).".format(clients, writer.first_row_time or 0))
+
+        if failed:
+            logger.warning("{} site(s) could not be searched.".format(failed))
+
+    except IOError as err:
+        logger.error("Report I/O error: {}".format(err))
+    except MistApiError as err:
+        # searches of single sites are reported by dump_org_clients, so this is the org site list
+        logger.error("Unable to get sites info, no clients dumped: {}".format(err))
+        sys.exit(1)
+
+    logger.info("Script complete.")
+    timer.stop()
+
+    footer()
+
+if __name__ == "__main__":
+    main()
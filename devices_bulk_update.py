@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+"""
+devices_bulk_update.py <updates_file> - Apply updates (e.g. AP names or config) to many devices
+
+The updates are read from a CSV file, with a site_id & device_id column
+and a column for each device setting to be updated (e.g. name), or a JSON
+lines file (.jsonl), with a site_id, device_id & the settings to be updated
+in each line, e.g.:
+
+    {"site_id": "4ac1dcf4-...", "device_id": "00000000-...", "name": "AP-Lobby-01"}
+
+The file may be gzip or zstd compressed. Empty CSV values are not sent.
+
+CSV values are sent as strings. For a setting that is a number, true/false
+or an object (e.g. height, disabled or led), add ':json' to its column name
+& give its value as JSON, e.g. a 'disabled:json' column of true/false, or a
+'led:json' column of {"enabled": false}.
+
+Every line of the file is checked before any update is sent. The updates
+are then sent concurrently (--workers sets how many at once), paced by the
+API rate limit, and a device that can't be updated does not stop the
+others. The result of each update (with its HTTP status) is written to a
+date-stamped report in the 'reports' folder.
+
+The outcome of each update is also recorded in a checkpoint file (default:
+the updates file name + '.checkpoint'). If the script is run again with
+the same updates file (e.g. after it was interrupted, or to retry failed
+updates), the updates that have already been applied are not sent again.
+Use --restart to discard the checkpoint & send every update.
+
+To use this script, you must set the following environmental variables that
+are used by the script:
+
+    MIST_TOKEN - A valid API token created for access to your organization
+
+This is required to prevent the requirement for hard coding them in to
+script of an accompanying config file. It should be created as an env_var
+that is private to your environment, not a global var on the machine that
+you are working on.
+"""
+
+import os
+import sys
+import csv
+import json
+import asyncio
+from datetime import datetime
+import argparse
+
+from modules.core.logger import ScriptLogger
+from modules.core.async_mist_verbs import AsyncMistVerbs
+from modules.core.bulk_writer import BulkWriter, operation_key, read_checkpoint
+from modules.core.report_writer import create_report_writer, open_report
+from modules.core.stopwatch import StopWatch
+from modules.core.get_vars import GetVars
+from modules.core.banner import header, footer
+
+# define URLs
+device_url = "{}/api/v1/sites/{}/devices/{}"
+
+# define CSV file name (completed with time stamp)
+report_file = 'reports/Device_Updates_{}.csv'
+
+column_headers = ["line", "site_id", "device_id", "result", "status", "elapsed", "error"]
+
+# suffix of CSV column names whose values are JSON (e.g. numbers or true/false)
+JSON_SUFFIX = ':json'
+
+
+def csv_settings(row):
+    """
+    Return the settings of a CSV row (empty values are dropped & the values
+    of ':json' columns are decoded), raising ValueError if a value is not
+    valid JSON
+    """
+
+    settings = {}
+
+    for name, value in row.items():
+
+        if not value:
+            continue
+
+        if name.endswith(JSON_SUFFIX):
+            name = name[:-len(JSON_SUFFIX)]
+            try:
+                value = json.loads(value)
+            except ValueError as err:
+                raise ValueError("invalid JSON in column {}{} ({})".format(name, JSON_SUFFIX, err))
+
+        settings[name] = value
+
+    return settings
+
+
+def read_updates_file(filename):
+    """
+    Read the updates from a CSV or JSON lines file, returning a list of
+    (line number, site_id, device_id, settings dict) & a list of errors
+    found in the file
+    """
+
+    updates = []
+    errors = []
+
+    with open_report(filename) as f:
+
+        if '.jsonl' in os.path.basename(filename):
+            rows = []
+            for line_num, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    rows.append((line_num, json.loads(line)))
+                except ValueError as err:
+                    errors.append("line {}: invalid JSON ({})".format(line_num, err))
+        else:
+            rows = []
+            # line 1 is the header row
+            for line_num, row in enumerate(csv.DictReader(f), 2):
+                try:
+                    rows.append((line_num, csv_settings(row)))
+                except ValueError as err:
+                    errors.append("line {}: {}".format(line_num, err))
+
+    for line_num, row in rows:
+
+        if not isinstance(row, dict):
+            errors.append("line {}: not a JSON object".format(line_num))
+            continue
+
+        settings = dict(row)
+        site_id = settings.pop('site_id', None)
+        device_id = settings.pop('device_id', None)
+
+        if not site_id or not device_id:
+            errors.append("line {}: site_id & device_id are required".format(line_num))
+        elif not settings:
+            errors.append("line {}: no settings to update".format(line_num))
+        else:
+            updates.append((line_num, site_id, device_id, settings))
+
+    return updates, errors
+
+
+async def apply_updates(api_token, operations, updates, writer, checkpoint_file, workers, logger):
+    """
+    Send the updates concurrently, logging the result of each as it
+    completes & writing it to the report. Returns the BulkResult of each update.
+    """
+
+    total = len(operations)
+    count = 0
+
+    def log_result(result):
+
+        nonlocal count
+        count += 1
+
+        line_num, site_id, device_id, _ = updates[result.index]
+
+        if result.resumed:
+            outcome = 'already applied'
+        elif result.ok:
+            outcome = 'ok'
+            logger.info("[{}/{}] Updated device {} in {:.2f} sec".format(count, total, device_id, result.elapsed))
+        else:
+            outcome = 'failed'
+            logger.error("[{}/{}] Device {} (line {}) could not be updated: {}".format(count, total, device_id, line_num, result.error))
+
+        writer.write_row({
+            "line": line_num,
+            "site_id": site_id,
+            "device_id": device_id,
+            "result": outcome,
+            "status": result.status if result.status is not None else '',
+            "elapsed": round(result.elapsed, 3),
+            "error": result.error,
+        })
+
+    async with AsyncMistVerbs(api_token, read_only=False, concurrency=workers) as verb_obj:
+        return await BulkWriter(verb_obj, checkpoint_file).update(operations, on_result=log_result)
+
+
+def main(argv=None):
+
+    # create parser args
+    parse_descr = "Script to apply updates (e.g. AP names or config) listed in a CSV or JSON lines file to many devices \n"
+    parser = argparse.ArgumentParser(description=parse_descr)
+    parser.add_argument('updates_file', help="CSV or JSON lines (.jsonl) file of updates (site_id, device_id & settings to update)")
+    parser.add_argument('--workers', type=int, default=10, help="number of updates sent concurrently (default: 10)")
+    parser.add_argument('--checkpoint', help="checkpoint file used to resume an interrupted run (default: <updates_file>.checkpoint)")
+    parser.add_argument('--restart', action='store_true', help="discard the checkpoint & send every update (with --dry-run, the checkpoint is kept)")
+    parser.add_argument('--dry-run', action='store_true', help="check the updates file & list the number of updates to send, without sending any")
+
+    args = parser.parse_args(argv)
+
+    # set up logging
+    logger = ScriptLogger('mist_api')
+
+    # supply required token
+    vars_obj = GetVars()
+    vars_found = vars_obj.find_vars()
+    api_token = vars_found.get('token')
+    base_url = vars_found.get('base_url')
+
+    time_stamp = str(datetime.now().strftime('%Y_%m_%d_%H_%M_%S'))
+    checkpoint_file = args.checkpoint if args.checkpoint else args.updates_file + '.checkpoint'
+
+    timer = StopWatch()
+    timer.start()
+
+    if not api_token:
+        print("You must define a valid API token using the MIST_TOKEN environmental variable name to use this script...exiting.")
+        sys.exit()
+
+    header()
+
+    logger.info("Reading updates file: {}.".format(args.updates_file))
+
+    try:
+        updates, errors = read_updates_file(args.updates_file)
+    except (IOError, csv.Error) as err:
+        logger.error("Unable to read updates file: {}".format(err))
+        sys.exit(1)
+
+    if errors:
+        for error in errors:
+            logger.error("Updates file {}".format(error))
+        logger.error("{} error(s) in updates file, no updates sent.".format(len(errors)))
+        sys.exit(1)
+
+    operations = [(device_url.format(base_url, site_id, device_id), settings) for _, site_id, device_id, settings in updates]
+
+    if not args.restart:
+        done = read_checkpoint(checkpoint_file)
+    else:
+        done = {}
+
+        # a dry run leaves the checkpoint in place
+        if os.path.isfile(checkpoint_file) and not args.dry_run:
+            logger.info("Discarding checkpoint file: {}.".format(checkpoint_file))
+            os.remove(checkpoint_file)
+
+    already_applied = sum(1 for url, settings in operations if operation_key('PUT', url, settings) in done)
+
+    if already_applied:
+        logger.info("Resuming from checkpoint file {}: {} of {} updates already applied.".format(
+            checkpoint_file, already_applied, len(operations)))
+
+    if args.dry_run:
+        logger.info("Dry run: {} updates to send, none sent.".format(len(operations) - already_applied))
+
+    elif operations:
+        writer = create_report_writer(report_file.format(time_stamp), column_headers)
+        logger.info("Writing results to: {}.".format(writer.report_file))
+
+        with writer:
+            results = asyncio.run(apply_updates(api_token, operations, updates, writer, checkpoint_file, args.workers, logger))
+
+        failed = sum(1 for result in results if not result.ok)
+        resumed = sum(1 for result in results if result.resumed)
+        logger.info("{} device(s) updated, {} already applied, {} failed.".format(
+            len(results) - failed - resumed, resumed, failed))
+
+        if failed:
+            logger.warning("{} device(s) could not be updated, run the script again to retry them.".format(failed))
+    else:
+        logger.info("No updates in file.")
+
+    logger.info("Script complete.")
+
+    timer.stop()
+
+    footer()
+
+if __name__ == "__main__":
+    main()
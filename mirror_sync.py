@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+mirror_sync.py - Sync a local mirror of your org sites, devices, WLANs & inventory
+
+This script will update a local SQLite copy (.mist_cache/mirror.sqlite) of
+the sites, devices, WLANs & inventory of your org. Only records that have
+changed since the last sync are written. Reports may then be produced from
+the mirror without calling the API (e.g. aps_org_dump_to_csv.py --from-mirror).
+
+To use this script, you must set the following environmental variables that
+are used by the script:
+
+    MIST_TOKEN - A valid API token created for access to your organization
+    MIST_ORG_ID - The organization ID of your org
+
+These are required to prevent the requirement for hard coding them in to
+script of an accompanying config file. These variables should be created
+as env vars that are private to your environment, not global vars on the 
+machine that you are working on.
+"""
+
+import sys
+import argparse
+
+from modules.core.logger import ScriptLogger
+from modules.core.mist_verbs import MistVerbs
+from modules.core.mist_errors import MistApiError
+from modules.core.mist_mirror import MistMirror
+from modules.core.stopwatch import StopWatch
+from modules.core.get_vars import GetVars
+from modules.core.banner import header, footer
+
+def main(argv=None):
+
+    # create parser args
+    parse_descr = "Script to sync a local mirror of org sites, devices, WLANs & inventory (org_id may be passed on CLI or via MIST_ORG_ID env var) \n"
+    parser = argparse.ArgumentParser(description=parse_descr)
+    parser.add_argument('org_id', nargs='?')
+    parser.add_argument('--workers', type=int, default=10, help="number of sites whose devices are read concurrently (default: 10)")
+
+    args = parser.parse_args(argv)
+
+    # set up logging
+    logger = ScriptLogger('mist_api')
+
+    # supply required token
+    vars_obj = GetVars()
+    vars_found = vars_obj.find_vars()
+    api_token = vars_found.get('token')
+    base_url = vars_found.get('base_url')
+
+    org_id = args.org_id if args.org_id else vars_found.get('org_id')
+
+    timer = StopWatch()
+    timer.start()
+
+    if not api_token:
+        print("You must define a valid API token using the MIST_TOKEN environment variable name to use this script...exiting.")
+        sys.exit()
+    
+    if not org_id:
+        print("You must define a valid organization ID using the MIST_ORG_ID environment variable name to use this script...exiting.")
+        sys.exit()
+    
+    header()
+
+    logger.info("Syncing org mirror.")
+    verb_obj = MistVerbs(api_token)
+    mirror = MistMirror()
+
+    try:
+        results = mirror.sync(verb_obj, org_id, base_url, workers=args.workers)
+    except MistApiError as err:
+        logger.error("Unable to sync org mirror: {}".format(err))
+        sys.exit(1)
+    finally:
+        mirror.close()
+
+    print("\n    {:<12} {:>9} {:>9} {:>9} {:>9}".format("", "inserted", "updated", "unchanged", "deleted"))
+
+    for collection, counts in results.items():
+        print("    {:<12} {inserted:>9} {updated:>9} {unchanged:>9} {deleted:>9}".format(collection, **counts))
+
+    print("")
+
+    logger.info("Script complete.")
+
+    timer.stop()
+
+    footer()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+"""
+mist_daemon.py - Run collection jobs on a schedule in a long-running process
+
+Rather than running the dump scripts from cron (with each run paying for
+interpreter start up, config parsing & a new HTTPS connection to the API),
+this script stays running & runs the jobs configured in config.json at their
+own intervals. All jobs share one MistVerbs object, so its pooled (warm)
+connections are re-used by every job, and all jobs draw on the same API
+call budget of the token (see modules/core/rate_limiter.py). The org site
+list, which is read by every ap-dump & client-export run, is kept in memory
+& re-used for --memo-ttl secs (see modules/core/memo_cache.py), so jobs
+running close together read it once.
+
+Each job runs every 'interval' secs, plus a random delay of up to 'jitter'
+secs. A job is not started again while its previous run is still in
+progress (see modules/core/job_scheduler.py).
+
+Jobs are configured by a "daemon_jobs" list in config.json, e.g.:
+
+{
+    "daemon_jobs": [
+        {"name": "aps", "job": "ap-dump", "interval": 3600, "jitter": 120,
+         "options": {"format": "parquet", "compress": "zstd"}},
+        {"name": "summary", "job": "org-summary", "interval": 300, "jitter": 30},
+        {"name": "apple-clients", "job": "client-export", "interval": 86400, "jitter": 600,
+         "options": {"manufacturer": "Apple", "compress": "gzip"}}
+    ]
+}
+
+Job types (see JOB_TYPES) & their options:
+
+    ap-dump - dump the APs of the org (as aps_org_dump_to_csv.py)
+        options: format, compress, compress_level
+    org-summary - log a summary of the org (as org_summary_list.py)
+    client-export - dump the clients of all sites in the org (as clients_org_dump_to_csv.py)
+        options: manufacturer, concurrency, format, compress, compress_level
+
+Every job must have a known 'job' type & an 'interval' (secs, > 0). The
+jobs are checked before any is run: each error found (e.g. a missing
+interval or an unknown option) is logged with the number & name of the job
+entry it is in, and the daemon exits with status 1.
+
+If the MIST_METRICS_DIR env var is set, API call metrics (see
+modules/core/metrics.py) are written to that folder after each job run, so
+a Prometheus textfile collector always sees current values.
+
+The daemon runs until stopped with Ctrl-C or SIGTERM (running jobs are
+allowed to complete). Use --once to run each job once & exit.
+
+To use this script, you must set the following environmental variables that
+are used by the script:
+
+    MIST_TOKEN - A valid API token created for access to your organization
+    MIST_ORG_ID - The organization ID of your org
+
+These are required to prevent the requirement for hard coding them in to
+script of an accompanying config file. These variables should be created
+as env vars that are private to your environment, not global vars on the
+machine that you are working on.
+"""
+
+import sys
+import json
+import os
+import inspect
+import signal
+import asyncio
+from datetime import datetime
+import argparse
+
+from modules.core.logger import ScriptLogger
+from modules.core.mist_verbs import MistVerbs
+from modules.core.http_pool import HttpPool, PoolConfig
+from modules.core.memo_cache import MemoCache
+from modules.core.async_mist_verbs import AsyncMistVerbs
+from modules.core.job_scheduler import JobScheduler
+from modules.core.metrics import write_metrics
+from modules.core.report_writer import write_report, create_report_writer, check_report_options
+from modules.core.get_vars import GetVars
+
+import aps_org_dump_to_csv
+import clients_org_dump_to_csv
+import org_summary_list
+
+
+def time_stamp():
+    return str(datetime.now().strftime('%Y_%m_%d_%H_%M_%S'))
+
+
+def ap_dump_job(verb_obj, base_url, org_id, logger, format='csv', compress=None, compress_level=None):
+    """
+    Dump the APs of the org to a date-stamped report file
+    """
+
+    sites_url = aps_org_dump_to_csv.sites_url.format(base_url, org_id)
+    inventory_url = aps_org_dump_to_csv.inventory_url.format(base_url, org_id)
+
+    sites_lookup = {site['id']: site['name'] for site in verb_obj.mist_iter(sites_url)}
+    devices = verb_obj.mist_iter(inventory_url)
+
+    report_file = 'reports/AP_Inventory_Org_' + time_stamp() + '.csv'
+    write_report(aps_org_dump_to_csv.ap_rows(devices, sites_lookup), report_file, aps_org_dump_to_csv.column_headers,
+                 logger, format, aps_org_dump_to_csv.column_types, compress, compress_level)
+
+
+def org_summary_job(verb_obj, base_url, org_id, logger):
+    """
+    Log a one line summary of the org
+    """
+
+    org_info = verb_obj.mist_read(org_summary_list.org_stats_url.format(base_url, org_id))
+
+    logger.info("Org {}: {} claimed devices, {} in use, {} connected, {} disconnected, {} sites.".format(
+        org_info['name'], org_info['num_inventory'], org_info['num_devices'], org_info['num_devices_connected'],
+        org_info['num_devices_disconnected'], org_info['num_sites']))
+
+
+def client_export_job(verb_obj, base_url, org_id, logger, manufacturer=None, concurrency=10, format='csv', compress=None,
+                      compress_level=None):
+    """
+    Dump the clients of all sites in the org to a date-stamped report file
+    """
+
+    search_params = {'client_manufacture': manufacturer} if manufacturer else {}
+    report_file = 'reports/Clients_Org_' + time_stamp() + '.csv'
+
+    async def export(writer):
+        async with AsyncMistVerbs(verb_obj.token, concurrency=concurrency, verb_obj=verb_obj) as async_verb_obj:
+            return await clients_org_dump_to_csv.dump_org_clients(async_verb_obj, base_url, org_id, writer, search_params, logger)
+
+    with create_report_writer(report_file, clients_org_dump_to_csv.column_headers, format,
+                              clients_org_dump_to_csv.column_types, compress, compress_level) as writer:
+        logger.info("Dumping client report file: {}.".format(writer.report_file))
+        clients, failed = asyncio.run(export(writer))
+
+    logger.info("{} unique clients dumped.".format(clients))
+
+    if failed:
+        logger.warning("{} site(s) could not be searched.".format(failed))
+
+
+# job type: function running job
+JOB_TYPES = {
+    'ap-dump': ap_dump_job,
+    'org-summary': org_summary_job,
+    'client-export': client_export_job,
+}
+
+
+# arguments of every job function that are not job options
+JOB_ARGS = ('verb_obj', 'base_url', 'org_id', 'logger')
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def check_job(job):
+    """
+    Return a list of the errors in one entry of the 'daemon_jobs' list
+    """
+
+    if not isinstance(job, dict):
+        return ["not a JSON object"]
+
+    errors = []
+
+    if job.get('job') not in JOB_TYPES:
+        errors.append("unknown job type '{}' (choose from {})".format(job.get('job'), ", ".join(sorted(JOB_TYPES))))
+
+    if 'interval' not in job:
+        errors.append("'interval' (secs between runs) is required")
+    elif not is_number(job['interval']) or job['interval'] <= 0:
+        errors.append("'interval' must be a number of secs greater than 0, not {}".format(json.dumps(job['interval'])))
+
+    if not is_number(job.get('jitter', 0)) or job.get('jitter', 0) < 0:
+        errors.append("'jitter' must be a number of secs (0 or more), not {}".format(json.dumps(job['jitter'])))
+
+    if not isinstance(job.get('run_at_start', True), bool):
+        errors.append("'run_at_start' must be true or false")
+
+    options = job.get('options', {})
+
+    if not isinstance(options, dict):
+        errors.append("'options' must be a JSON object")
+
+    elif job.get('job') in JOB_TYPES:
+        allowed = [name for name in inspect.signature(JOB_TYPES[job['job']]).parameters if name not in JOB_ARGS]
+        unknown = sorted(set(options) - set(allowed))
+
+        if unknown:
+            errors.append("unknown option(s) {} for job type '{}' (choose from {})".format(
+                ", ".join(unknown), job['job'], ", ".join(allowed) if allowed else 'none'))
+
+        if 'format' in allowed:
+            try:
+                check_report_options(options.get('format', 'csv'), options.get('compress'))
+            except (ValueError, ImportError) as err:
+                errors.append(str(err))
+
+    return errors
+
+
+def read_job_config(config_file):
+    """
+    Read the list of jobs from the config file, returning the list of jobs &
+    a list of errors found in it (each naming the job entry it is in)
+    """
+
+    if not os.path.isfile(config_file):
+        return [], []
+
+    with open(config_file, 'r') as f:
+        jobs = json.load(f).get('daemon_jobs', [])
+
+    if not isinstance(jobs, list):
+        return [], ["'daemon_jobs' in {} must be a list of jobs".format(config_file)]
+
+    errors = []
+    names = set()
+
+    for index, job in enumerate(jobs, 1):
+
+        name = job.get('name', job.get('job')) if isinstance(job, dict) else None
+        job_errors = check_job(job)
+
+        if name in names:
+            job_errors.append("job name '{}' is used by another job (set a unique 'name')".format(name))
+        names.add(name)
+
+        for error in job_errors:
+            errors.append("daemon_jobs entry {}{}: {}".format(index, " ({})".format(name) if name else '', error))
+
+    return jobs, errors
+
+
+def main(argv=None):
+
+    # create parser args
+    parse_descr = "Script to run collection jobs (configured in config.json) on a schedule in a long-running process \n"
+    parser = argparse.ArgumentParser(description=parse_descr)
+    parser.add_argument('--config', default='config.json', help="config file containing 'daemon_jobs' list (default: config.json)")
+    parser.add_argument('--workers', type=int, default=4, help="max number of jobs running at once (default: 4)")
+    parser.add_argument('--connections', type=int, default=10, help="size of the pool of connections to the API shared by all jobs (default: 10)")
+    parser.add_argument('--connect-timeout', type=float, default=10, help="secs to wait for a connection to the API (default: 10)")
+    parser.add_argument('--read-timeout', type=float, default=60, help="secs to wait for data from the API (default: 60)")
+    parser.add_argument('--http2', action='store_true', help="use HTTP/2 (requires httpx[http2])")
+    parser.add_argument('--memo-ttl', type=float, default=300, help="secs the org site list is re-used by jobs before it is read again (0 = read by every job, default: 300)")
+    parser.add_argument('--once', action='store_true', help="run each job once, then exit")
+
+    args = parser.parse_args(argv)
+
+    # set up logging
+    logger = ScriptLogger('mist_api')
+
+    # supply required token
+    vars_obj = GetVars(args.config)
+    vars_found = vars_obj.find_vars()
+    api_token = vars_found.get('token')
+    org_id = vars_found.get('org_id')
+    base_url = vars_found.get('base_url')
+
+    if not api_token:
+        print("You must define a valid API token using the MIST_TOKEN environmental variable name to use this script...exiting.")
+        sys.exit()
+
+    if not org_id:
+        print("You must define a valid organization ID using the MIST_ORG_ID environmental variable name to use this script...exiting.")
+        sys.exit()
+
+    jobs, errors = read_job_config(args.config)
+
+    if errors:
+        for error in errors:
+            logger.error(error)
+        logger.error("{} error(s) in the 'daemon_jobs' list of {}, no jobs run.".format(len(errors), args.config))
+        sys.exit(1)
+
+    if not jobs:
+        print("You must define at least one job in the 'daemon_jobs' list of {} to use this script...exiting.".format(args.config))
+        sys.exit()
+
+    # one MistVerbs object (& connection pool) shared by all jobs
+    pool = HttpPool(PoolConfig(max_connections=args.connections, connect_timeout=args.connect_timeout,
+                               read_timeout=args.read_timeout, http2=args.http2))
+    # only the site list is shared between jobs: job results are always read fresh
+    memo = MemoCache(default_ttl=0, ttls={'*/orgs/*/sites': args.memo_ttl})
+    verb_obj = MistVerbs(api_token, pool=pool, memo=memo)
+
+    scheduler = JobScheduler(max_workers=args.workers)
+
+    for job in jobs:
+
+        job_func = JOB_TYPES[job['job']]
+        options = job.get('options', {})
+
+        def run_job(job_func=job_func, options=options):
+            try:
+                job_func(verb_obj, base_url, org_id, logger, **options)
+            finally:
+                write_metrics()
+
+        scheduler.add_job(job.get('name', job['job']), run_job, job['interval'], job.get('jitter', 0),
+                          job.get('run_at_start', True))
+
+    def stop(signum, frame):
+        logger.info("Received signal {}, stopping.".format(signum))
+        scheduler.stop()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info("Running {} job(s).".format(len(jobs)))
+    scheduler.run(run_once=args.once)
+
+    for name, stats in scheduler.stats().items():
+        logger.info("Job {}: {}".format(name, stats))
+
+    logger.info("Rate limiter stats: {}".format(verb_obj.rate_limiter.stats()))
+    logger.info("Site list memo stats: {}".format(memo.stats()))
+    pool.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+mist_utils.py <command> [<args>] - Single entry point for the scripts in this repo
+
+Each script may be run as a subcommand of this script, e.g.:
+
+    python mist_utils.py token-list
+    python mist_utils.py aps-site-dump --all --format parquet
+    python mist_utils.py aps-site-dump --help
+
+Commands are listed in the COMMANDS registry below, which maps each command
+to the script that implements it. A script is only imported when its command
+is run, so '--help' & simple commands do not pay the cost of importing the
+modules (requests, asyncio, pyarrow etc.) used by the other commands. This
+keeps startup fast when called frequently (e.g. from cron).
+
+All scripts may still be run directly (e.g. python token_list.py), & use the
+same environmental variables (or config.json file) described in each script.
+"""
+
+import sys
+import argparse
+
+# command name: (module implementing command, description)
+COMMANDS = {
+    'aps-org-dump': ('aps_org_dump_to_csv', "dump an org's AP info in to a report file"),
+    'aps-site-dump': ('aps_site_dump_to_csv', "dump the AP info of one or more sites (or all sites of an org) in to report files"),
+    'check-env': ('check_env', "check if our env is set up to use the Mist API"),
+    'clients-site-apple': ('clients_list_site_apple', "list Apple clients on a site"),
+    'clients-site-apple-dump': ('clients_list_site_apple_to_csv', "dump all Apple clients on a site to a report file"),
+    'clients-org-dump': ('clients_org_dump_to_csv', "dump the clients of all sites in an org to a report file"),
+    'devices-bulk-update': ('devices_bulk_update', "apply updates (e.g. AP names or config) listed in a file to many devices"),
+    'daemon': ('mist_daemon', "run the collection jobs configured in config.json on a schedule, in a long-running process"),
+    'mirror-sync': ('mirror_sync', "sync a local SQLite mirror of your org sites, devices, WLANs & inventory"),
+    'org-summary': ('org_summary_list', "list a summary of an org"),
+    'simple-summary': ('simple_summary', "very simple overview listing of your org"),
+    'token-create': ('token_create', "create an API token"),
+    'token-delete': ('token_delete', "remove a specific token"),
+    'token-list': ('token_list', "list the tokens we currently have created"),
+    'token-tidy': ('token_tidy', "remove all tokens except the token we are currently using"),
+}
+
+
+def run_command(command, argv=None):
+    """
+    Import the script implementing a command & run its main() function
+
+    Arguments:
+        command {str} -- [Name of command (see COMMANDS)]
+        argv {optional list} -- [Command line args passed to the command]
+    """
+
+    from importlib import import_module
+
+    module_name = COMMANDS[command][0]
+
+    # show the command in the usage/help messages of the script
+    sys.argv = ["{} {}".format(sys.argv[0], command)]
+
+    return import_module(module_name).main(argv if argv is not None else [])
+
+
+def main(argv=None):
+
+    command_list = "\n".join("  {:<26}{}".format(name, descr) for name, (_, descr) in sorted(COMMANDS.items()))
+
+    parse_descr = "Run one of the Mist API scripts in this repo (use '<command> --help' for the args of a command) \n"
+    parser = argparse.ArgumentParser(description=parse_descr, epilog="commands:\n" + command_list,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=sorted(COMMANDS), metavar='command', help="command to run (see list below)")
+    parser.add_argument('args', nargs=argparse.REMAINDER, help="args passed to the command")
+
+    args = parser.parse_args(argv)
+
+    return run_command(args.command, args.args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+An asyncio flavour of MistVerbs that allows many API calls to be in flight
+at the same time (e.g. reading the devices of every site in a large org).
+
+Each call is run by the standard (blocking) MistVerbs methods in a pool of
+worker threads, so read, create, update & delete behave exactly as they do
+in MistVerbs. The number of worker threads (and pooled HTTP connections)
+sets the maximum number of concurrent requests sent to the Mist API.
+
+Calls share the rate limiter of the token (see rate_limiter.py): tasks wait
+in the event loop (rather than tying up a worker thread) while the hourly
+call budget is exhausted or the API has asked us to back off.
+
+Example:
+
+    import asyncio
+    from modules.core.async_mist_verbs import AsyncMistVerbs
+
+    async def get_devices(token, site_ids):
+        async with AsyncMistVerbs(token, concurrency=20) as verb_obj:
+            urls = ["https://api.mist.com/api/v1/sites/{}/devices".format(site_id) for site_id in site_ids]
+            return await verb_obj.gather_read(urls)
+
+    devices_per_site = asyncio.run(get_devices(api_token, site_ids))
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from modules.core.mist_verbs import MistVerbs
+from modules.core.http_pool import HttpPool, PoolConfig
+
+
+class AsyncMistVerbs(object):
+
+    """
+    A class to peform read, create, update & delete operations via the
+    Mist API from asyncio code, with a bounded number of concurrent requests.
+
+    Arguments:
+        token {mandatory str} -- [API token string]
+        read_only {optional boolean} -- [True (default) allows only read operations]
+        concurrency {optional int} -- [Max number of requests in flight at once (default = 10)]
+        rate_limiter {optional RateLimiter obj} -- [Limiter used to pace API calls (default = limiter shared by all users of token)]
+        retry_policy {optional RetryPolicy obj} -- [Policy for retrying failed calls (default = RetryPolicy())]
+        cache {optional ResponseCache obj} -- [Persistent cache used by mist_read() (default = None, no caching)]
+        memo {optional MemoCache obj} -- [In-memory cache of mist_read() results for this run (default = None, no caching)]
+        verb_obj {optional MistVerbs obj} -- [Existing MistVerbs object to make calls with, sharing its session & connection pool (other args are then ignored, default = None)]
+        pool {optional HttpPool obj} -- [Connection pool used to make calls, which may be shared with other objects (default = new pool sized to concurrency)]
+        transport {optional session obj} -- [Session-like object requests are sent through instead of the pool's session (see MistVerbs)]
+    """
+
+    def __init__(self, token, read_only=True, concurrency=10, rate_limiter=None, retry_policy=None,
+                 cache=None, memo=None, verb_obj=None, pool=None, transport=None):
+
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+
+        self.concurrency = concurrency
+        self.shared_verbs = verb_obj is not None
+        self.shared_pool = self.shared_verbs or pool is not None
+
+        if self.shared_verbs:
+            self.verbs = verb_obj
+        else:
+            pool = pool if pool else HttpPool(PoolConfig(max_connections=concurrency))
+            self.verbs = MistVerbs(token, read_only, rate_limiter=rate_limiter, retry_policy=retry_policy,
+                                   cache=cache, memo=memo, pool=pool, transport=transport)
+
+        # size the connection pool to (at least) the number of worker threads
+        # so that concurrent requests re-use connections rather than waiting
+        # for one to be free
+        self.verbs.pool.ensure_capacity(concurrency)
+
+        self.rate_limiter = self.verbs.rate_limiter
+
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='AsyncMistVerbs')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Shut down the worker threads & close the connection pool (unless it
+        is shared with other objects)
+        """
+
+        self.executor.shutdown(wait=True)
+
+        if not self.shared_pool:
+            self.verbs.pool.close()
+
+    async def _run(self, func, *args, **kwargs):
+        """
+        Run a blocking MistVerbs method in the worker pool & await its result
+        """
+
+        await self.rate_limiter.ready_async()
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def call(self, func, *args, **kwargs):
+        """
+        Run a blocking function in the worker pool (paced by the rate
+        limiter) & await its result, e.g. to make a MistVerbs call & read
+        the response_status of the call in the same worker thread
+
+        Arguments:
+            func {function} -- [Function to run, called with args & kwargs]
+
+        Returns:
+            [any] -- [Result of function]
+        """
+
+        return await self._run(func, *args, **kwargs)
+
+    async def mist_read(self, url, deadline=None):
+        """async version of MistVerbs.mist_read()
+
+        Arguments:
+            url {str} -- [Full URL of API call]
+            deadline {optional float} -- [Max secs to spend on call inc retries (default = retry policy deadline)]
+
+        Returns:
+            [data structure] -- [Data structure returned - varies with API call]
+        """
+
+        return await self._run(self.verbs.mist_read, url, deadline)
+
+    async def mist_read_all(self, url, page_size=100):
+        """async call to read all records of a paginated API call (see
+        MistVerbs.mist_iter()). Pages are fetched in a single worker thread.
+
+        Arguments:
+            url {str} -- [Full URL of API call]
+            page_size {optional int} -- [Number of records requested per page (default = 100)]
+
+        Returns:
+            [list] -- [All records returned by the API call]
+        """
+
+        return await self._run(lambda: list(self.verbs.mist_iter(url, page_size=page_size)))
+
+    async def mist_iter_pages(self, url, page_size=100):
+        """async generator version of MistVerbs.mist_iter_pages(). Each page
+        is fetched in a worker thread when the previous page has been
+        consumed, so pages of many calls may be processed as they arrive.
+
+        Arguments:
+            url {str} -- [Full URL of API call]
+            page_size {optional int} -- [Number of records requested per page (default = 100)]
+
+        Yields:
+            [list] -- [List of records contained in each page]
+        """
+
+        pages = self.verbs.mist_iter_pages(url, page_size=page_size)
+        last_page = object()
+
+        while True:
+            records = await self._run(next, pages, last_page)
+
+            if records is last_page:
+                return
+
+            yield records
+
+    async def mist_create(self, url, data='', deadline=None, retry=None):
+        """async version of MistVerbs.mist_create()
+
+        Arguments:
+            url {str} -- [Full URL of API call]
+            data {dict} -- [data dict structure]
+            deadline {optional float} -- [Max secs to spend on call inc retries (default = retry policy deadline)]
+            retry {optional boolean} -- [True allows a failed post to be retried (default = retry policy retry_post)]
+
+        Returns:
+            [data structure] -- [Data structure returned - varies with API call]
+        """
+
+        return await self._run(self.verbs.mist_create, url, data, deadline, retry)
+
+    async def mist_update(self, url, data, deadline=None):
+        """async version of MistVerbs.mist_update()
+
+        Arguments:
+            url {str} -- [Full URL of API call]
+            data {dict} -- [data dict structure]
+            deadline {optional float} -- [Max secs to spend on call inc retries (default = retry policy deadline)]
+
+        Returns:
+            [data structure] -- [Data structure returned - varies with API call]
+        """
+
+        return await self._run(self.verbs.mist_update, url, data, deadline)
+
+    async def mist_delete(self, url, deadline=None):
+        """async version of MistVerbs.mist_delete()
+
+        Arguments:
+            url {str} -- [Full URL of API call inc ID of object to be deleted]
+            deadline {optional float} -- [Max secs to spend on call inc retries (default = retry policy deadline)]
+
+        Returns:
+            [data structure] -- [Data structure returned - varies with API call]
+        """
+
+        return await self._run(self.verbs.mist_delete, url, deadline)
+
+    async def gather_read(self, urls, return_exceptions=False):
+        """read a list of URLs concurrently (up to the concurrency limit of
+        this object)
+
+        Arguments:
+            urls {iterable} -- [Full URLs of API calls]
+            return_exceptions {optional boolean} -- [True returns exceptions in place of results rather than raising the first one (default = False)]
+
+        Returns:
+            [list] -- [Data structures returned, in the same order as urls]
+        """
+
+        tasks = [self.mist_read(url) for url in urls]
+        return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
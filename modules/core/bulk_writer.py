@@ -0,0 +1,253 @@
+"""
+Bulk create/update/delete operations via the Mist API, with a bounded
+number of operations in flight at once.
+
+Each operation is a (url, payload) pair (payload = None for a delete). The
+operations are run by a fixed set of worker tasks (one per concurrent
+request allowed by the AsyncMistVerbs object), which take the next operation
+from the iterable as they become free, so a very large batch is never held
+in memory as tasks. Calls are paced by the rate limiter & retried as any
+other MistVerbs call.
+
+A failed operation does not stop the batch: the outcome of every operation
+is returned as a BulkResult (and passed to an optional callback as each
+operation completes, e.g. to log progress or write a results file).
+
+If a checkpoint file is given, the outcome of each operation is appended to
+it (one JSON line per operation) as it completes. When the batch is run
+again with the same checkpoint file (e.g. after it was interrupted), the
+operations that succeeded are not sent again: they are returned as resumed
+results, with the status recorded in the checkpoint. Operations are
+identified by a hash of their method, URL & payload, so the batch may be
+re-generated (even in a different order) when it is resumed, and an
+operation whose payload has changed is sent again. Failed operations are
+always sent again. Delete the checkpoint file to run the whole batch again.
+
+Example:
+
+    async def delete_tokens(token, urls):
+        async with AsyncMistVerbs(token, read_only=False, concurrency=10) as verb_obj:
+            return await BulkWriter(verb_obj).delete(urls)
+
+    results = asyncio.run(delete_tokens(api_token, token_urls))
+    failed = [result for result in results if not result.ok]
+
+    async def update_devices(token, updates):
+        async with AsyncMistVerbs(token, read_only=False, concurrency=20) as verb_obj:
+            return await BulkWriter(verb_obj, checkpoint_file='updates.checkpoint').update(updates)
+
+    results = asyncio.run(update_devices(api_token, [(device_url, {'name': 'AP-01'}), ...]))
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+from modules.core.mist_errors import MistApiError
+
+METHODS = ('POST', 'PUT', 'DELETE')
+
+
+class BulkResult(object):
+
+    """
+    Outcome of one operation of a bulk run
+
+    Arguments:
+        index {int} -- [Position of the operation in the batch (from 0)]
+        method {str} -- [HTTP method of the operation]
+        url {str} -- [Full URL of API call]
+        ok {boolean} -- [True if the call succeeded]
+        status {optional int} -- [HTTP status of the call (None if no response received)]
+        error {optional str} -- [Description of failure]
+        elapsed {optional float} -- [Secs taken by the call inc retries]
+        data {optional data structure} -- [Data structure returned by a successful call]
+        resumed {optional boolean} -- [True if the operation was not sent as it succeeded in an earlier run (see checkpoint_file)]
+    """
+
+    def __init__(self, index, method, url, ok, status=None, error='', elapsed=0.0, data=None, resumed=False):
+
+        self.index = index
+        self.method = method
+        self.url = url
+        self.ok = ok
+        self.status = status
+        self.error = error
+        self.elapsed = elapsed
+        self.data = data
+        self.resumed = resumed
+
+
+def operation_key(method, url, payload=None):
+    """
+    Return the key an operation is recorded under in a checkpoint file
+    """
+
+    body = json.dumps(payload, sort_keys=True, separators=(',', ':')) if payload is not None else ''
+
+    return hashlib.sha1('{} {} {}'.format(method, url, body).encode('utf-8')).hexdigest()
+
+
+def read_checkpoint(checkpoint_file):
+    """
+    Return the keys & statuses of the operations that succeeded in earlier
+    runs of a batch, from its checkpoint file (if it exists)
+
+    Arguments:
+        checkpoint_file {str} -- [Name of checkpoint file]
+
+    Returns:
+        [dict] -- [Operation key to HTTP status]
+    """
+
+    done = {}
+
+    if not os.path.isfile(checkpoint_file):
+        return done
+
+    with open(checkpoint_file) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # partly written line (run was interrupted)
+                continue
+
+            if entry['ok']:
+                done[entry['key']] = entry['status']
+            else:
+                done.pop(entry['key'], None)
+
+    return done
+
+
+class BulkWriter(object):
+
+    """
+    Run batches of create, update or delete operations concurrently,
+    carrying on past operations that fail
+
+    Arguments:
+        verb_obj {AsyncMistVerbs obj} -- [Object used to make the API calls (must not be read-only), whose concurrency bounds the operations in flight]
+        checkpoint_file {optional str} -- [File the outcome of each operation is appended to, from which an interrupted batch is resumed (default = None, no checkpoint)]
+    """
+
+    def __init__(self, verb_obj, checkpoint_file=None):
+
+        self.verb_obj = verb_obj
+        self.checkpoint_file = checkpoint_file
+
+    async def run(self, method, operations, on_result=None):
+        """
+        Run a batch of operations, returning the result of each
+
+        Arguments:
+            method {str} -- [HTTP method of the operations: POST, PUT or DELETE]
+            operations {iterable} -- [(url, payload) pairs (payload = None for DELETE)]
+            on_result {optional function} -- [Called with each BulkResult as its operation completes (default = None)]
+
+        Returns:
+            [list] -- [BulkResult of each operation, in the order of operations]
+        """
+
+        if method not in METHODS:
+            raise ValueError('method must be one of: {}'.format(', '.join(METHODS)))
+
+        done = read_checkpoint(self.checkpoint_file) if self.checkpoint_file else {}
+        checkpoint = open(self.checkpoint_file, 'a') if self.checkpoint_file else None
+
+        pending = enumerate(operations)
+        results = []
+
+        def add_result(result, key):
+
+            results.append(result)
+
+            if checkpoint and not result.resumed:
+                checkpoint.write(json.dumps({'key': key, 'ok': result.ok, 'status': result.status, 'url': result.url}) + '\n')
+                checkpoint.flush()
+
+            if on_result:
+                on_result(result)
+
+        async def worker():
+
+            # the iterator is only advanced between awaits, so workers
+            # never take the same operation
+            for index, (url, payload) in pending:
+                key = operation_key(method, url, payload)
+
+                if key in done:
+                    add_result(BulkResult(index, method, url, True, status=done[key], resumed=True), key)
+                    continue
+
+                add_result(await self._call(index, method, url, payload), key)
+
+        try:
+            await asyncio.gather(*[worker() for _ in range(self.verb_obj.concurrency)])
+        finally:
+            if checkpoint:
+                checkpoint.close()
+
+        results.sort(key=lambda result: result.index)
+        return results
+
+    def _send(self, method, url, payload):
+        """
+        Make a call in a worker thread, returning the data returned & the
+        status of the response
+        """
+
+        verbs = self.verb_obj.verbs
+
+        if method == 'POST':
+            data = verbs.mist_create(url, payload)
+        elif method == 'PUT':
+            data = verbs.mist_update(url, payload)
+        else:
+            data = verbs.mist_delete(url)
+
+        return data, verbs.response_status
+
+    async def _call(self, index, method, url, payload):
+
+        start_time = time.perf_counter()
+
+        try:
+            data, status = await self.verb_obj.call(self._send, method, url, payload)
+
+        except MistApiError as err:
+            return BulkResult(index, method, url, False, status=err.status, error=str(err),
+                              elapsed=time.perf_counter() - start_time)
+
+        return BulkResult(index, method, url, True, status=status, elapsed=time.perf_counter() - start_time, data=data)
+
+    async def delete(self, urls, on_result=None):
+        """
+        Delete a batch of objects (see run())
+
+        Arguments:
+            urls {iterable} -- [Full URLs of API calls inc ID of object to be deleted]
+            on_result {optional function} -- [Called with each BulkResult as its operation completes (default = None)]
+
+        Returns:
+            [list] -- [BulkResult of each operation, in the order of urls]
+        """
+
+        return await self.run('DELETE', ((url, None) for url in urls), on_result)
+
+    async def update(self, operations, on_result=None):
+        """
+        Update a batch of objects (see run())
+
+        Arguments:
+            operations {iterable} -- [(url, payload) pairs: full URL of API call inc ID of object to be updated & data dict structure]
+            on_result {optional function} -- [Called with each BulkResult as its operation completes (default = None)]
+
+        Returns:
+            [list] -- [BulkResult of each operation, in the order of operations]
+        """
+
+        return await self.run('PUT', operations, on_result)
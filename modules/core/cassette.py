@@ -0,0 +1,432 @@
+"""
+Record & replay of Mist API calls, so that a job may be re-run (e.g. to
+profile its JSON parsing & report writing) without calling the live API.
+
+MistVerbs sends its requests through a session (by default, the session of
+its connection pool). A RecordingSession wraps that session & appends each
+request/response pair to a cassette file as it is made. A ReplaySession
+serves the recorded responses instead, with no network access at all: the
+cassette is memory-mapped & response bodies are sliced straight from it.
+
+    cassette = CassetteWriter('aps.cassette')
+    verb_obj = MistVerbs(api_token, transport=RecordingSession(HttpPool().session, cassette))
+    ...
+    cassette.close()
+
+    verb_obj = MistVerbs(api_token, transport=ReplaySession(CassetteReader('aps.cassette')))
+
+Scripts may be recorded & replayed unchanged by setting the MIST_CASSETTE
+env var to the cassette file name & MIST_CASSETTE_MODE to 'record' or
+'replay' (default = replay), e.g.:
+
+    MIST_CASSETTE=aps.cassette MIST_CASSETTE_MODE=record python aps_org_dump_to_csv.py
+    MIST_CASSETTE=aps.cassette python aps_org_dump_to_csv.py
+
+Requests are matched on method, URL (with its query params sorted) & a
+hash of the request body. A request made more than once is answered with
+its recorded responses in the order they were recorded (the last response is
+repeated once all have been used), so polling, paging & retries replay as
+they happened. The API token & request headers are not recorded.
+
+Cassette file format (all integers little-endian):
+
+    b'MISTCAS1'
+    records, each: <u32 meta length> <u32 body length> <meta JSON> <body>
+        (meta holds the request key, status, response headers & elapsed time)
+    index JSON: {request key: [record offset, ...]}
+    footer: <u64 index offset> <u32 index length> b'MISTIDX1'
+
+The index is written when the writer is closed. A cassette with no index
+(e.g. recording was interrupted) is still readable: its records are scanned
+when it is opened.
+"""
+
+import atexit
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import timedelta
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from requests.structures import CaseInsensitiveDict
+
+from modules.core.mist_errors import MistApiError
+
+CASSETTE_VAR = 'MIST_CASSETTE'
+CASSETTE_MODE_VAR = 'MIST_CASSETTE_MODE'
+CASSETTE_MODES = ('record', 'replay')
+
+MAGIC = b'MISTCAS1'
+INDEX_MAGIC = b'MISTIDX1'
+RECORD_HEADER = struct.Struct('<II')
+FOOTER = struct.Struct('<QI8s')
+
+# response headers not recorded
+SKIPPED_HEADERS = ('set-cookie', 'connection', 'keep-alive', 'transfer-encoding', 'content-encoding')
+
+
+class CassetteMissError(MistApiError):
+
+    """
+    Raised when a request has no recorded response to replay. It is a
+    MistApiError (not retried, as a retry would miss again), so scripts
+    report it as any other failed call.
+    """
+
+
+def request_key(method, url, data=None):
+    """
+    Return the key a request is recorded under
+    """
+
+    scheme, netloc, path, query, fragment = urlsplit(url)
+    url = urlunsplit((scheme, netloc, path, urlencode(sorted(parse_qsl(query, keep_blank_values=True))), ''))
+
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+
+    body_hash = hashlib.sha1(data).hexdigest()[:16] if data else ''
+
+    return '{} {} {}'.format(method.upper(), url, body_hash).rstrip()
+
+
+class CassetteWriter(object):
+
+    """
+    Append request/response pairs to a cassette file (thread-safe)
+
+    Arguments:
+        cassette_file {str} -- [Name of cassette file (replaced if it exists)]
+    """
+
+    def __init__(self, cassette_file):
+
+        self.cassette_file = cassette_file
+        self.index = {}
+        self.records = 0
+        self.lock = threading.Lock()
+
+        folder = os.path.dirname(cassette_file)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        self.file = open(cassette_file, 'w+b')
+        self.file.write(MAGIC)
+        self.data_end = self.file.tell()
+
+    def record(self, key, status, headers, body, elapsed=0.0):
+        """
+        Append a response to the cassette
+
+        Arguments:
+            key {str} -- [Request key (see request_key())]
+            status {int} -- [HTTP status of response]
+            headers {dict} -- [Response headers]
+            body {bytes} -- [Response body]
+            elapsed {optional float} -- [Secs from sending request to receiving response headers]
+        """
+
+        meta = json.dumps({
+            'key': key,
+            'status': status,
+            'headers': {name: value for name, value in headers.items() if name.lower() not in SKIPPED_HEADERS},
+            'elapsed': elapsed,
+        }, separators=(',', ':')).encode('utf-8')
+
+        with self.lock:
+
+            # appending overwrites any index written by a previous close()
+            self.file.seek(self.data_end)
+            self.file.write(RECORD_HEADER.pack(len(meta), len(body)))
+            self.file.write(meta)
+            self.file.write(body)
+
+            self.index.setdefault(key, []).append(self.data_end)
+            self.data_end = self.file.tell()
+            self.records += 1
+
+    def write_index(self):
+        """
+        Write the index & footer after the records, so the cassette may be
+        replayed (recording may continue afterwards)
+        """
+
+        with self.lock:
+
+            if self.file.closed:
+                return
+
+            index = json.dumps(self.index, separators=(',', ':')).encode('utf-8')
+
+            self.file.seek(self.data_end)
+            self.file.write(index)
+            self.file.write(FOOTER.pack(self.data_end, len(index), INDEX_MAGIC))
+            self.file.truncate()
+            self.file.flush()
+
+    def close(self):
+        """
+        Write the index & close the cassette file
+        """
+
+        self.write_index()
+
+        with self.lock:
+            self.file.close()
+
+
+class CassetteReader(object):
+
+    """
+    Read responses from a memory-mapped cassette file
+
+    Arguments:
+        cassette_file {str} -- [Name of cassette file]
+    """
+
+    def __init__(self, cassette_file):
+
+        self.cassette_file = cassette_file
+
+        with open(cassette_file, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.data[:len(MAGIC)] != MAGIC:
+            self.data.close()
+            raise ValueError('{} is not a cassette file'.format(cassette_file))
+
+        self.index = self._read_index()
+
+    def _read_index(self):
+
+        if len(self.data) >= len(MAGIC) + FOOTER.size:
+            index_offset, index_length, magic = FOOTER.unpack_from(self.data, len(self.data) - FOOTER.size)
+
+            if magic == INDEX_MAGIC:
+                return json.loads(self.data[index_offset:index_offset + index_length])
+
+        # no index (recording was interrupted): scan the records
+        index = {}
+        offset = len(MAGIC)
+
+        while offset + RECORD_HEADER.size <= len(self.data):
+            meta_length, body_length = RECORD_HEADER.unpack_from(self.data, offset)
+            end = offset + RECORD_HEADER.size + meta_length + body_length
+
+            if end > len(self.data):
+                break
+
+            try:
+                meta = json.loads(self.data[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + meta_length])
+            except ValueError:
+                # partly written record
+                break
+
+            index.setdefault(meta['key'], []).append(offset)
+            offset = end
+
+        return index
+
+    def response(self, offset):
+        """
+        Return the (meta dict, body memoryview) of the record at an offset
+        """
+
+        meta_length, body_length = RECORD_HEADER.unpack_from(self.data, offset)
+        meta_start = offset + RECORD_HEADER.size
+        body_start = meta_start + meta_length
+
+        meta = json.loads(self.data[meta_start:body_start])
+        body = memoryview(self.data)[body_start:body_start + body_length]
+
+        return meta, body
+
+    def close(self):
+
+        self.data.close()
+
+
+class CassetteResponse(object):
+
+    """
+    A recorded response, which may be used as a requests response by MistVerbs
+    """
+
+    def __init__(self, url, status_code, headers, body, elapsed=0.0):
+
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.body = body
+        self.elapsed = timedelta(seconds=elapsed)
+        self._content = None
+
+    @property
+    def content(self):
+
+        if self._content is None:
+            self._content = bytes(self.body)
+
+        return self._content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def iter_content(self, chunk_size=65536):
+
+        for start in range(0, len(self.body), chunk_size):
+            yield bytes(self.body[start:start + chunk_size])
+
+    def close(self):
+        pass
+
+
+class RecordingSession(object):
+
+    """
+    A requests.Session-like wrapper of a session, which records each
+    response in a cassette. Streamed responses are read in full (so that
+    they may be recorded) before they are returned.
+
+    Arguments:
+        session {session obj} -- [Session used to send requests (e.g. HttpPool.session)]
+        writer {CassetteWriter obj} -- [Cassette responses are recorded in]
+    """
+
+    def __init__(self, session, writer):
+
+        self.session = session
+        self.writer = writer
+
+    def request(self, method, url, headers=None, timeout=None, data=None, stream=False):
+
+        response = self.session.request(method, url, headers=headers, timeout=timeout, data=data, stream=stream)
+
+        body = response.content
+        elapsed = response.elapsed.total_seconds()
+        self.writer.record(request_key(method, url, data), response.status_code, response.headers, body, elapsed)
+
+        return CassetteResponse(url, response.status_code, response.headers, body, elapsed)
+
+    def close(self):
+        """
+        Close the wrapped session & write the cassette index, so that the
+        cassette may be replayed
+        """
+
+        self.session.close()
+        self.writer.write_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ReplaySession(object):
+
+    """
+    A requests.Session-like object serving recorded responses from a
+    cassette, with no network access. Requests with no recorded response
+    raise CassetteMissError.
+
+    Arguments:
+        reader {CassetteReader obj} -- [Cassette responses are served from]
+        latency {optional boolean} -- [True waits the recorded time of each response before returning it (default = False, no wait)]
+    """
+
+    def __init__(self, reader, latency=False):
+
+        self.reader = reader
+        self.latency = latency
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def request(self, method, url, headers=None, timeout=None, data=None, stream=False):
+
+        key = request_key(method, url, data)
+        offsets = self.reader.index.get(key)
+
+        if not offsets:
+            raise CassetteMissError('No recorded response in {}'.format(self.reader.cassette_file), method.upper(), url)
+
+        with self.lock:
+            call = self.calls.get(key, 0)
+            self.calls[key] = call + 1
+
+        meta, body = self.reader.response(offsets[min(call, len(offsets) - 1)])
+
+        if self.latency:
+            time.sleep(meta['elapsed'])
+
+        return CassetteResponse(url, meta['status'], meta['headers'], body, meta['elapsed'] if self.latency else 0.0)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# cassettes opened from the env vars, by file name
+_writers = {}
+_replays = {}
+_cassettes_lock = threading.Lock()
+
+
+def _close_writers():
+
+    for writer in _writers.values():
+        writer.close()
+
+
+def cassette_transport(session):
+    """
+    Return the session MistVerbs should send requests through: if the
+    MIST_CASSETTE env var is set, a RecordingSession wrapping the session
+    or a ReplaySession (see MIST_CASSETTE_MODE), otherwise the session itself.
+    Cassettes are shared by all MistVerbs objects in the process (so calls
+    are replayed in the order they were recorded, whichever object makes
+    them), & recorded cassettes are closed when the process exits.
+
+    Arguments:
+        session {session obj} -- [Session that would otherwise be used (e.g. HttpPool.session)]
+
+    Returns:
+        [session obj] -- [Session to use]
+    """
+
+    cassette_file = os.environ.get(CASSETTE_VAR)
+
+    if not cassette_file:
+        return session
+
+    mode = os.environ.get(CASSETTE_MODE_VAR, 'replay')
+
+    if mode not in CASSETTE_MODES:
+        raise ValueError('{} must be one of: {}'.format(CASSETTE_MODE_VAR, ', '.join(CASSETTE_MODES)))
+
+    with _cassettes_lock:
+
+        if mode == 'replay':
+            if cassette_file not in _replays:
+                _replays[cassette_file] = ReplaySession(CassetteReader(cassette_file))
+
+            return _replays[cassette_file]
+
+        if cassette_file not in _writers:
+            if not _writers:
+                atexit.register(_close_writers)
+
+            _writers[cassette_file] = CassetteWriter(cassette_file)
+
+        return RecordingSession(session, _writers[cassette_file])
@@ -13,6 +13,9 @@ The following variables are searched for:
  3. site_id
  4. device_id
  5. client_id
+ 6. base_url (URL of the Mist API, default https://api.mist.com - may be
+    set to use another Mist cloud, or a local mock of the API, see
+    benchmarks/mock_mist_api.py)
 
 The folowing sources will be checked in the following order (last match wins):
 
@@ -26,6 +29,7 @@ Env-vars:
  MIST_SITE_ID
  MIST_DEVICE_ID
  MIST_CLIENT_ID
+ MIST_BASE_URL
 
 config.json file format: (all fields are optional and others may be added as required)
 
@@ -35,12 +39,14 @@ config.json file format: (all fields are optional and others may be added as req
     "site_id":   "xxxxxxxxxxxxxxxxxxxxxxxxx",
     "device_id": "xxxxxxxxxxxxxxxxxxxxxxxxx",
     "client_id": "xxxxxxxxxxxxxxxxxxxxxxxxx",
+    "base_url":  "https://api.mist.com",
 }
 """
 
 import os
 import json
-from modules.core.logger import ScriptLogger
+
+DEFAULT_BASE_URL = "https://api.mist.com"
 
 class GetVars(object):
 
@@ -60,13 +66,15 @@ class GetVars(object):
         self.site_id = ""
         self.device_id = ""
         self.client_id = ""
+        self.base_url = DEFAULT_BASE_URL
 
         self.env_vars = {
             'MIST_TOKEN': 'token', 
             'MIST_ORG_ID': 'org_id', 
             'MIST_SITE_ID': 'site_id', 
             'MIST_DEVICE_ID': 'device_id', 
-            'MIST_CLIENT_ID': 'client_id'
+            'MIST_CLIENT_ID': 'client_id',
+            'MIST_BASE_URL': 'base_url'
         }
 
         self.found_vars = {}
@@ -83,6 +91,9 @@ class GetVars(object):
             [Dict data structure] -- [Dictionary returned with all found variables]
         """
 
+        # API URL used unless overridden
+        self.found_vars['base_url'] = DEFAULT_BASE_URL
+
         # step through all env_vars and store any values that are set
         for env_var_name, key_name in self.env_vars.items():
 
@@ -110,5 +121,7 @@ class GetVars(object):
         self.site_id = self.found_vars.get('site_id')
         self.device_id = self.found_vars.get('device_id')
         self.client_id = self.found_vars.get('client_id')
+        self.base_url = self.found_vars['base_url'].rstrip('/')
+        self.found_vars['base_url'] = self.base_url
     
         return self.found_vars
\ No newline at end of file
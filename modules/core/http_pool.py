@@ -0,0 +1,326 @@
+"""
+A configurable pool of HTTP connections to the Mist API, which may be shared
+by many MistVerbs & AsyncMistVerbs objects in the same process.
+
+By default, connections are made with requests (HTTP/1.1). Connections are
+kept open & re-used between calls (keep-alive), so only the first call to
+the API pays for the TCP & TLS handshakes. The pool never holds more than
+'max_connections' connections to a host: if all are in use, a call waits for
+one to be returned, rather than opening a connection that is discarded after
+one use (which wastes handshakes & leaves sockets in TIME_WAIT). Objects that
+make concurrent calls (e.g. AsyncMistVerbs) grow the pool to match their
+concurrency, so concurrent calls do not queue for connections.
+
+All calls have connect & read timeouts (a call with a deadline is given the
+lower of the timeout and the time left before its deadline).
+
+The time taken to open each connection (inc the TLS handshake) is measured,
+so the latency of a call can be split in to connect & request time (see
+reset_connect_time() & connect_time(), used by modules/core/metrics.py).
+
+HTTP/2 may be used instead, via the httpx module (pip install httpx[http2]),
+which multiplexes concurrent calls over a few connections.
+
+Example:
+
+    pool = HttpPool(PoolConfig(max_connections=20, connect_timeout=5, read_timeout=30))
+    org_verbs = MistVerbs(api_token, pool=pool)
+    site_verbs = MistVerbs(other_token, pool=pool)
+
+    # or share one pool per config across the whole process
+    verb_obj = MistVerbs(api_token, pool=get_shared_pool(PoolConfig(http2=True)))
+"""
+
+import threading
+import time
+from datetime import timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# secs spent opening connections by each thread since reset_connect_time()
+_timing = threading.local()
+
+
+def reset_connect_time():
+    """
+    Reset the time spent opening connections by the current thread
+    """
+
+    _timing.connect = 0.0
+
+
+def connect_time():
+    """
+    Return the secs spent opening connections by the current thread since
+    reset_connect_time() was called (0 if only pooled connections were used)
+    """
+
+    return getattr(_timing, 'connect', 0.0)
+
+
+class TimedConnectMixin(object):
+
+    """
+    Add the time taken to open a connection to the connect time of the thread
+    """
+
+    def connect(self):
+
+        start_time = time.perf_counter()
+
+        try:
+            super().connect()
+        finally:
+            _timing.connect = connect_time() + time.perf_counter() - start_time
+
+
+class TimedHTTPConnection(TimedConnectMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnectMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+
+    """
+    An HTTPAdapter whose connections record the time taken to open them
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
+
+
+class PoolConfig(object):
+
+    """
+    Settings of an HTTP connection pool
+
+    Arguments:
+        max_connections {optional int} -- [Max connections open to each host at once (default = 10)]
+        max_hosts {optional int} -- [Number of hosts connections are kept for (default = 4)]
+        connect_timeout {optional float} -- [Secs to wait for a connection to be made (default = 10)]
+        read_timeout {optional float} -- [Secs to wait for data from the API (default = 60)]
+        http2 {optional boolean} -- [True uses HTTP/2 via the httpx module (default = False)]
+    """
+
+    def __init__(self, max_connections=10, max_hosts=4, connect_timeout=10, read_timeout=60, http2=False):
+
+        if max_connections < 1:
+            raise ValueError('max_connections must be at least 1')
+
+        self.max_connections = max_connections
+        self.max_hosts = max_hosts
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.http2 = http2
+
+    def key(self):
+        """
+        Return a tuple of the settings, used to find a shared pool
+        """
+
+        return (self.max_connections, self.max_hosts, self.connect_timeout, self.read_timeout, self.http2)
+
+
+class HttpxResponse(object):
+
+    """
+    Wrap an httpx response, so it may be used as a requests response by MistVerbs
+    """
+
+    def __init__(self, response, elapsed):
+
+        self.response = response
+        self.status_code = response.status_code
+        self.headers = CaseInsensitiveDict(response.headers)
+        self.url = str(response.url)
+
+        # time from sending the request to receiving the response headers (as requests)
+        self.elapsed = timedelta(seconds=elapsed)
+
+    @property
+    def content(self):
+        return self.response.read()
+
+    @property
+    def text(self):
+        self.response.read()
+        return self.response.text
+
+    def iter_content(self, chunk_size=65536):
+        return self.response.iter_bytes(chunk_size)
+
+    def close(self):
+        self.response.close()
+
+
+class HttpxSession(object):
+
+    """
+    A requests.Session-like wrapper of an httpx client (used for HTTP/2).
+    httpx errors are raised as the matching requests exceptions.
+
+    Arguments:
+        config {PoolConfig obj} -- [Settings of the connection pool]
+    """
+
+    def __init__(self, config):
+
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError("The httpx module is required to use HTTP/2 (pip install httpx[http2])")
+
+        self.httpx = httpx
+        limits = httpx.Limits(max_connections=config.max_connections * config.max_hosts,
+                              max_keepalive_connections=config.max_connections * config.max_hosts)
+        self.client = httpx.Client(http2=True, limits=limits)
+
+    def request(self, method, url, headers=None, timeout=None, data=None, stream=False):
+
+        if isinstance(timeout, tuple):
+            connect_timeout, read_timeout = timeout
+            timeout = self.httpx.Timeout(read_timeout, connect=connect_timeout)
+
+        try:
+            request = self.client.build_request(method, url, headers=headers, content=data, timeout=timeout)
+
+            # always send streamed, to time the arrival of the headers
+            start_time = time.perf_counter()
+            response = self.client.send(request, stream=True)
+            elapsed = time.perf_counter() - start_time
+
+            if not stream:
+                response.read()
+
+        except self.httpx.TimeoutException as err:
+            raise requests.exceptions.Timeout(err)
+
+        except self.httpx.TransportError as err:
+            raise requests.exceptions.ConnectionError(err)
+
+        return HttpxResponse(response, elapsed)
+
+    def close(self):
+        self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class HttpPool(object):
+
+    """
+    A pool of HTTP connections, shared by the MistVerbs objects it is passed to
+
+    Arguments:
+        config {optional PoolConfig obj} -- [Settings of the pool (default = PoolConfig())]
+    """
+
+    def __init__(self, config=None):
+
+        self.config = config if config else PoolConfig()
+        self.max_connections = self.config.max_connections
+        self.lock = threading.Lock()
+
+        if self.config.http2:
+            self.session = HttpxSession(self.config)
+        else:
+            self.session = requests.Session()
+            self._mount_adapter()
+
+    def _mount_adapter(self):
+
+        # pool_block limits open connections to pool_maxsize, so every
+        # connection opened is kept & re-used
+        adapter = TimedHTTPAdapter(pool_connections=self.config.max_hosts, pool_maxsize=self.max_connections,
+                              pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def ensure_capacity(self, connections):
+        """
+        Grow the pool (if needed) so that 'connections' calls to a host may be
+        in progress at once. Connections of an HTTP/2 pool are shared by
+        concurrent calls, so it is not resized.
+        """
+
+        with self.lock:
+            if self.config.http2 or connections <= self.max_connections:
+                return
+
+            self.max_connections = connections
+            old_adapter = self.session.get_adapter('https://')
+            self._mount_adapter()
+
+            # connections in use are closed as they are returned
+            old_adapter.close()
+
+    def timeout(self, remaining=None):
+        """
+        Return the (connect, read) timeout of a call, limited to the secs
+        remaining before the deadline of the call (if any)
+        """
+
+        connect_timeout = self.config.connect_timeout
+        read_timeout = self.config.read_timeout
+
+        if remaining is not None:
+            connect_timeout = min(connect_timeout, remaining) if connect_timeout else remaining
+            read_timeout = min(read_timeout, remaining) if read_timeout else remaining
+
+        return (connect_timeout, read_timeout)
+
+    def close(self):
+        """
+        Close all connections of the pool
+        """
+
+        self.session.close()
+
+
+# pools shared across the process, by config key
+_shared_pools = {}
+_shared_pools_lock = threading.Lock()
+
+
+def get_shared_pool(config=None):
+    """
+    Return the pool shared by all users of the same pool settings
+
+    Arguments:
+        config {optional PoolConfig obj} -- [Settings of the pool (default = PoolConfig())]
+
+    Returns:
+        [HttpPool obj] -- [Shared pool]
+    """
+
+    config = config if config else PoolConfig()
+
+    with _shared_pools_lock:
+        if config.key() not in _shared_pools:
+            _shared_pools[config.key()] = HttpPool(config)
+
+        return _shared_pools[config.key()]
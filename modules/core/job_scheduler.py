@@ -0,0 +1,217 @@
+"""
+A simple interval scheduler, used to run collection jobs (e.g. AP dumps) in
+a long-running process (see mist_daemon.py) rather than from cron.
+
+Each job runs every 'interval' seconds, plus a random delay of up to 'jitter'
+seconds, so that jobs with the same interval (or many daemons using the same
+token) do not all call the API at the same moment. Run times are planned
+from the previous planned run time (not from when the job finished), so the
+schedule does not drift.
+
+A job is never run again while its previous run is still in progress: if a
+run is due while the job is still running, that run is skipped (& counted)
+and the job is scheduled for its next interval.
+
+Jobs are run in a pool of worker threads, so a long job does not hold up the
+other jobs.
+
+Example:
+
+    scheduler = JobScheduler(max_workers=4)
+    scheduler.add_job('org-summary', lambda: print_summary(verb_obj), interval=300, jitter=30)
+    scheduler.run()     # until scheduler.stop() is called (e.g. from a signal handler)
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.core.logger import ScriptLogger
+
+
+class ScheduledJob(object):
+
+    """
+    A job run by the JobScheduler
+
+    Arguments:
+        name {str} -- [Name of job, used in log messages]
+        func {function} -- [Function (taking no args) called to run the job]
+        interval {float} -- [Secs between runs of the job]
+        jitter {optional float} -- [Max random delay in secs added to each run time (default = 0)]
+        run_at_start {optional boolean} -- [True (default) runs the job when the scheduler starts, rather than after the first interval]
+    """
+
+    def __init__(self, name, func, interval, jitter=0, run_at_start=True):
+
+        if interval <= 0:
+            raise ValueError('interval must be greater than 0')
+
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.run_at_start = run_at_start
+
+        self.running = False
+        self.planned_time = None
+        self.next_run = None
+
+        # counters
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_duration = None
+        self.last_error = None
+
+    def schedule(self, now=None):
+        """
+        Plan the next run of the job (the first run if not yet scheduled)
+        """
+
+        now = now if now is not None else time.monotonic()
+
+        if self.planned_time is None:
+            self.planned_time = now if self.run_at_start else now + self.interval
+        else:
+            self.planned_time += self.interval
+
+            # if runs have been missed (e.g. machine suspended), plan from now
+            if self.planned_time < now:
+                self.planned_time = now
+
+        self.next_run = self.planned_time + random.uniform(0, self.jitter)
+
+    def stats(self):
+        """
+        Return a dict of job counters
+        """
+
+        return {
+            'runs': self.runs,
+            'failures': self.failures,
+            'skipped': self.skipped,
+            'running': self.running,
+            'last_duration': self.last_duration,
+            'last_error': self.last_error,
+        }
+
+
+class JobScheduler(object):
+
+    """
+    Run jobs at intervals, in a pool of worker threads
+
+    Arguments:
+        max_workers {optional int} -- [Max number of jobs running at once (default = 4)]
+    """
+
+    def __init__(self, max_workers=4):
+
+        self.max_workers = max_workers
+        self.jobs = []
+        self.logger = ScriptLogger('JobScheduler')
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def add_job(self, name, func, interval, jitter=0, run_at_start=True):
+        """
+        Add a job to the scheduler (see ScheduledJob for arguments)
+
+        Returns:
+            [ScheduledJob obj] -- [Job added]
+        """
+
+        job = ScheduledJob(name, func, interval, jitter, run_at_start)
+        self.jobs.append(job)
+
+        return job
+
+    def _run_job(self, job):
+
+        start_time = time.monotonic()
+        self.logger.info("Job {} started.".format(job.name))
+
+        try:
+            job.func()
+            job.last_error = None
+            self.logger.info("Job {} complete in {:.2f} sec.".format(job.name, time.monotonic() - start_time))
+
+        except Exception as err:
+            job.failures += 1
+            job.last_error = str(err)
+            self.logger.exception("Job {} failed: {}".format(job.name, err))
+
+        finally:
+            with self.lock:
+                job.runs += 1
+                job.last_duration = time.monotonic() - start_time
+                job.running = False
+
+    def _start_due_jobs(self, executor, now):
+
+        for job in self.jobs:
+
+            if job.next_run > now:
+                continue
+
+            with self.lock:
+                if job.running:
+                    job.skipped += 1
+                    self.logger.warning("Job {} still running, skipping this run.".format(job.name))
+                else:
+                    job.running = True
+                    executor.submit(self._run_job, job)
+
+            job.schedule(now)
+
+    def run(self, run_once=False):
+        """
+        Run the jobs until stop() is called
+
+        Arguments:
+            run_once {optional boolean} -- [True runs each job once (ignoring intervals & jitter), then returns (default = False)]
+        """
+
+        if not self.jobs:
+            raise ValueError('No jobs to run')
+
+        self.stop_event.clear()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='JobScheduler') as executor:
+
+            if run_once:
+                for job in self.jobs:
+                    job.running = True
+                    executor.submit(self._run_job, job)
+                return
+
+            now = time.monotonic()
+            for job in self.jobs:
+                job.schedule(now)
+
+            while not self.stop_event.is_set():
+
+                now = time.monotonic()
+                self._start_due_jobs(executor, now)
+
+                next_run = min(job.next_run for job in self.jobs)
+                self.stop_event.wait(max(0, next_run - time.monotonic()))
+
+            self.logger.info("Stopping, waiting for running jobs to complete.")
+
+    def stop(self):
+        """
+        Stop running jobs (running jobs are allowed to complete). Safe to
+        call from a signal handler or another thread.
+        """
+
+        self.stop_event.set()
+
+    def stats(self):
+        """
+        Return a dict of job name to job counters
+        """
+
+        return {job.name: job.stats() for job in self.jobs}
@@ -0,0 +1,78 @@
+"""
+JSON encoding & decoding used by MistVerbs.
+
+The fastest JSON library installed is used: orjson, then ujson, falling
+back to the standard library json module if neither is available (neither
+is required to run the scripts in this repo). A specific backend may be
+forced by setting the env var MIST_JSON_BACKEND to 'orjson', 'ujson' or
+'json'.
+
+All backends accept the bytes of an API response and encode to bytes,
+ready to send. orjson & ujson decode directly from the bytes; the standard
+library always decodes to str internally, and an explicit utf-8 decode is
+the fastest way to do that.
+"""
+
+import json
+import os
+
+
+def _json_loads(data):
+
+    if isinstance(data, (bytes, bytearray)):
+        data = data.decode('utf-8')
+
+    return json.loads(data)
+
+
+def _json_dumps(obj):
+    return json.dumps(obj).encode('utf-8')
+
+
+def _available_backends():
+    """
+    Return a dict of installed backend names to (loads, dumps) functions
+    """
+
+    backends = {'json': (_json_loads, _json_dumps)}
+
+    try:
+        import orjson
+        backends['orjson'] = (orjson.loads, orjson.dumps)
+    except ImportError:
+        pass
+
+    try:
+        import ujson
+
+        def ujson_dumps(obj):
+            return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+
+        backends['ujson'] = (ujson.loads, ujson_dumps)
+    except ImportError:
+        pass
+
+    return backends
+
+
+BACKENDS = _available_backends()
+
+
+def _select_backend():
+
+    requested = os.environ.get('MIST_JSON_BACKEND')
+
+    if requested:
+        if requested not in BACKENDS:
+            raise ImportError('JSON backend {} requested by MIST_JSON_BACKEND is not installed'.format(requested))
+        return requested
+
+    for name in ('orjson', 'ujson', 'json'):
+        if name in BACKENDS:
+            return name
+
+
+BACKEND = _select_backend()
+
+# json_loads(bytes or str) -> data structure, json_dumps(data structure) -> bytes
+json_loads, json_dumps = BACKENDS[BACKEND]
@@ -0,0 +1,214 @@
+"""
+Incremental decoding of large JSON API responses.
+
+Rather than decoding a whole response in one go (which holds the raw bytes,
+the decoded text and the complete object tree in memory together), the
+response body is consumed chunk by chunk and the items of its main array
+are decoded & yielded one at a time. Peak memory use is then bounded by the
+size of a single item (plus one chunk), not the size of the response.
+
+The main array is either the response itself (e.g. a device list), or the
+array held under a key of a top-level object (e.g. the 'results' list of a
+search call). Any other top-level fields of an object response (e.g. the
+'next' link of a search call) are collected in a 'meta' dict.
+
+Example:
+
+    meta = {}
+    for client in iter_json_array(response.iter_content(65536), key='results', meta=meta):
+        print(client['mac'])
+    next_url = meta.get('next')
+"""
+
+import codecs
+import json
+
+# compact the text buffer once this many characters have been consumed
+COMPACT_SIZE = 65536
+
+WHITESPACE = ' \t\n\r'
+
+
+class _ChunkReader(object):
+
+    """
+    A text buffer fed from an iterable of byte chunks, with helpers to
+    decode the JSON values it contains as the data arrives
+    """
+
+    def __init__(self, chunks):
+
+        self.chunks = iter(chunks)
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """
+        Add the next chunk to the buffer, returning False if no more data
+        """
+
+        if self.eof:
+            return False
+
+        # drop consumed text so the buffer holds no more than the current value
+        if self.pos > COMPACT_SIZE:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+
+        for chunk in self.chunks:
+            text = self.utf8.decode(chunk)
+            if text:
+                self.buf += text
+                return True
+
+        self.buf += self.utf8.decode(b'', final=True)
+        self.eof = True
+        return False
+
+    def peek(self):
+        """
+        Return the next non-whitespace character (without consuming it), or
+        '' at end of data
+        """
+
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        """
+        Consume the next non-whitespace character, which must be one of chars
+        """
+
+        char = self.peek()
+
+        if not char or char not in chars:
+            raise ValueError('Invalid JSON: expected {!r} at offset {}, found {!r}'.format(chars, self.pos, char))
+
+        self.pos += 1
+        return char
+
+    def value(self):
+        """
+        Decode & consume the next JSON value, reading more data as needed
+        """
+
+        self.peek()
+
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+
+            # a number may be cut short by the end of the buffer, even if more
+            # text follows it (e.g. '2.' decodes as 2), so is only complete
+            # once a delimiter (or the end of the data) follows it
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and self._open_ended(end):
+                if self.fill():
+                    continue
+
+            self.pos = end
+            return value
+
+    def _open_ended(self, end):
+        """
+        Return True if no delimiter follows the text decoded up to end
+        """
+
+        while end < len(self.buf) and self.buf[end] in WHITESPACE:
+            end += 1
+
+        return end == len(self.buf) or self.buf[end] not in ',]}'
+
+
+def iter_json_array(chunks, key='results', meta=None):
+    """generator to decode the items of the main array of a JSON document
+    one at a time, as the data arrives
+
+    Arguments:
+        chunks {iterable} -- [Chunks of bytes making up the JSON document]
+        key {optional str} -- [Key of the main array if the document is an object (default = 'results')]
+        meta {optional dict} -- [Dict updated with the other top-level fields of an object document]
+
+    Raises:
+        ValueError: [If the data is not valid JSON, or has no main array]
+
+    Yields:
+        [data structure] -- [Each item of the main array]
+    """
+
+    reader = _ChunkReader(chunks)
+    meta = meta if meta is not None else {}
+
+    first = reader.peek()
+
+    if first == '[':
+        yield from _iter_items(reader)
+        _expect_end(reader)
+        return
+
+    if first != '{':
+        raise ValueError('Invalid JSON: expected an array or object, found {!r}'.format(first))
+
+    reader.expect('{')
+    found = False
+
+    if reader.peek() == '}':
+        reader.expect('}')
+    else:
+        while True:
+            field = reader.value()
+            reader.expect(':')
+
+            if field == key and reader.peek() == '[':
+                found = True
+                yield from _iter_items(reader)
+            else:
+                meta[field] = reader.value()
+
+            if reader.expect(',}') == '}':
+                break
+
+    _expect_end(reader)
+
+    if not found:
+        raise ValueError('JSON object has no {!r} array'.format(key))
+
+
+def _iter_items(reader):
+    """
+    Yield the items of the array starting at the reader position
+    """
+
+    reader.expect('[')
+
+    if reader.peek() == ']':
+        reader.expect(']')
+        return
+
+    while True:
+        yield reader.value()
+
+        if reader.expect(',]') == ']':
+            return
+
+
+def _expect_end(reader):
+    """
+    Check that nothing but whitespace follows the document
+    """
+
+    if reader.peek():
+        raise ValueError('Invalid JSON: extra data at offset {}'.format(reader.pos))
@@ -9,6 +9,10 @@ def ScriptLogger(name, log_level=logging.INFO):
     logger = logging.getLogger(name)
     logger.setLevel(log_level)
 
+    # logger already set up (e.g. by an earlier MistVerbs object)
+    if logger.handlers:
+        return logger
+
     # set up logging to console
 
     ## create console handler & set level
@@ -0,0 +1,170 @@
+"""
+A bounded, in-memory cache of mist_read() results for the lifetime of a
+single run, used by MistVerbs to avoid fetching the same data (e.g. the
+site list of an org) more than once.
+
+Entries expire after a TTL, which may be set per endpoint using
+shell-style patterns matched against the URL path (first match wins).
+When the cache is full, the least recently used entry is dropped.
+
+Any create, update or delete made through the same MistVerbs object
+invalidates cached reads of overlapping paths, i.e. the written object
+itself, anything below it, and the collections above it. For example, a
+PUT to /api/v1/sites/{id}/devices/{device_id} drops cached reads of
+/api/v1/sites/{id}/devices and /api/v1/sites/{id}/devices/{device_id}.
+
+Cached results are shared, not copied, so callers should treat them as
+read-only.
+
+Example:
+
+    memo = MemoCache(max_entries=500, ttls={'*/sites': 300, '*/stats': 10})
+    verb_obj = MistVerbs(api_token, memo=memo)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from fnmatch import fnmatch
+from urllib.parse import urlsplit
+
+
+class MemoCache(object):
+
+    """
+    An LRU cache with per-endpoint TTLs
+
+    Arguments:
+        max_entries {optional int} -- [Max number of cached reads (default = 256)]
+        default_ttl {optional float} -- [Secs an entry is kept if no TTL pattern matches (default = 60, 0 = not cached)]
+        ttls {optional dict} -- [URL path pattern to TTL (secs) mapping]
+    """
+
+    def __init__(self, max_entries=256, default_ttl=60, ttls=None):
+
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttls = ttls if ttls else {}
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def ttl(self, url):
+        """
+        Return the TTL (secs) that applies to a URL
+        """
+
+        path = urlsplit(url).path
+
+        for pattern, ttl in self.ttls.items():
+            if fnmatch(path, pattern):
+                return ttl
+
+        return self.default_ttl
+
+    def get(self, url):
+        """
+        Look up a cached read
+
+        Arguments:
+            url {str} -- [Full URL of API call]
+
+        Returns:
+            [tuple or None] -- [(data, response headers) of cached read, or None if not cached]
+        """
+
+        # reads of endpoints that are not cached are not counted as misses
+        if self.ttl(url) <= 0:
+            return None
+
+        with self.lock:
+            entry = self.entries.get(url)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires, data, headers = entry
+
+            if time.monotonic() >= expires:
+                del self.entries[url]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(url)
+            self.hits += 1
+
+            return data, headers
+
+    def put(self, url, data, headers):
+        """
+        Cache the result of a read
+
+        Arguments:
+            url {str} -- [Full URL of API call]
+            data {data structure} -- [Data structure returned by API call]
+            headers {dict} -- [Response headers of API call]
+        """
+
+        ttl = self.ttl(url)
+
+        if ttl <= 0:
+            return
+
+        with self.lock:
+            self.entries[url] = (time.monotonic() + ttl, data, headers)
+            self.entries.move_to_end(url)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, url):
+        """
+        Drop cached reads with a path that overlaps the path of a URL that
+        has been written to
+
+        Arguments:
+            url {str} -- [Full URL of create/update/delete API call]
+        """
+
+        write_path = urlsplit(url).path.rstrip('/') + '/'
+
+        with self.lock:
+            for cached_url in list(self.entries):
+                cached_path = urlsplit(cached_url).path.rstrip('/') + '/'
+
+                if cached_path.startswith(write_path) or write_path.startswith(cached_path):
+                    del self.entries[cached_url]
+                    self.invalidations += 1
+
+    def clear(self):
+        """
+        Drop all cached reads
+        """
+
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """
+        Return a dict of cache counters & current size
+        """
+
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self.entries),
+            }
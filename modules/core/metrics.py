@@ -0,0 +1,366 @@
+"""
+Per-request metrics of Mist API calls made by MistVerbs.
+
+Every attempt of every call is recorded against its endpoint template (the
+URL path with IDs replaced by placeholders, e.g. /api/v1/sites/{id}/devices),
+with its status, response size, whether it was a retry, and its latency,
+split in to:
+
+ - connect: time to open a new connection (inc TLS handshake), zero when a
+   pooled connection is re-used
+ - ttfb: time from sending the request (after any connect) to receiving the
+   response headers
+ - body: time to read the response body (zero for streamed responses, whose
+   body is read as it is used)
+ - total: time of the whole attempt
+
+Latencies are aggregated in to a histogram per endpoint & phase, from which
+p50/p95/p99 are reported. Metrics may be written as a Prometheus textfile
+(for the node_exporter textfile collector) & a JSON summary (endpoints sorted
+by the total time spent on them, so the paths that dominate a job are listed
+first).
+
+If the MIST_METRICS_DIR env var is set, the metrics of the process are
+written to that folder when the process exits:
+
+    MIST_METRICS_DIR=/var/lib/node_exporter python aps_org_dump_to_csv.py
+
+writes /var/lib/node_exporter/mist_api.prom & mist_api_metrics.json
+"""
+
+import atexit
+import json
+import os
+import random
+import re
+import threading
+from urllib.parse import urlsplit
+
+# env var naming the folder metrics are written to when the process exits
+METRICS_DIR_VAR = 'MIST_METRICS_DIR'
+
+PROMETHEUS_FILE = 'mist_api.prom'
+JSON_FILE = 'mist_api_metrics.json'
+
+# upper bounds (secs) of histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# max latencies kept per histogram to calculate percentiles (a random
+# sample is kept once this is exceeded)
+MAX_SAMPLES = 10000
+
+PHASES = ('connect', 'ttfb', 'body', 'total')
+
+UUID_RE = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.I)
+MAC_RE = re.compile(r'^[0-9a-f]{12}$', re.I)
+
+
+def endpoint_template(url):
+    """
+    Return the path of a URL with IDs replaced by placeholders, e.g.
+    https://api.mist.com/api/v1/sites/4ac1dcf4-...-c3a8/devices?page=2
+    becomes /api/v1/sites/{id}/devices
+    """
+
+    segments = []
+
+    for segment in urlsplit(url).path.split('/'):
+
+        if UUID_RE.match(segment):
+            segment = '{id}'
+        elif MAC_RE.match(segment):
+            segment = '{mac}'
+        elif segment.isdigit():
+            segment = '{n}'
+
+        segments.append(segment)
+
+    return '/'.join(segments)
+
+
+class Histogram(object):
+
+    """
+    A latency histogram (with a sample of values, used for percentiles)
+    """
+
+    def __init__(self):
+
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.samples = []
+
+    def add(self, value):
+
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[index] += 1
+                break
+
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(value)
+        else:
+            # reservoir sampling, so each value is equally likely to be kept
+            index = random.randrange(self.count)
+            if index < MAX_SAMPLES:
+                self.samples[index] = value
+
+    def percentile(self, percent):
+
+        if not self.samples:
+            return 0.0
+
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(len(samples) * percent / 100.0))]
+
+    def cumulative_buckets(self):
+        """
+        Return a list of (upper bound, count of values <= bound) pairs
+        """
+
+        total = 0
+        cumulative = []
+
+        for bound, count in zip(BUCKETS, self.buckets):
+            total += count
+            cumulative.append((bound, total))
+
+        return cumulative
+
+    def summary(self):
+
+        return {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+
+class EndpointMetrics(object):
+
+    """
+    Metrics of the calls made to one endpoint (method & endpoint template)
+    """
+
+    def __init__(self, method, endpoint):
+
+        self.method = method
+        self.endpoint = endpoint
+        self.requests = 0
+        self.retries = 0
+        self.bytes = 0
+        self.statuses = {}
+        self.latency = {phase: Histogram() for phase in PHASES}
+
+
+class ApiMetrics(object):
+
+    """
+    Thread-safe collection of the metrics of API calls
+    """
+
+    def __init__(self):
+
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def record(self, method, url, status, size, attempt, total, connect=0.0, ttfb=None, body=None):
+        """
+        Record one attempt of an API call
+
+        Arguments:
+            method {str} -- [HTTP method]
+            url {str} -- [Full URL of API call]
+            status {int or str} -- [HTTP status of response ('error' if no response received)]
+            size {int} -- [Size of response body in bytes]
+            attempt {int} -- [Attempt number of the call (1 = first attempt, higher = retry)]
+            total {float} -- [Secs taken by the attempt]
+            connect {optional float} -- [Secs taken to open a connection (default = 0)]
+            ttfb {optional float} -- [Secs from sending request to receiving response headers (default = not known)]
+            body {optional float} -- [Secs taken to read response body (default = not known)]
+        """
+
+        key = (method, endpoint_template(url))
+
+        with self.lock:
+
+            metrics = self.endpoints.get(key)
+            if metrics is None:
+                metrics = self.endpoints[key] = EndpointMetrics(*key)
+
+            metrics.requests += 1
+            metrics.bytes += size
+            metrics.statuses[str(status)] = metrics.statuses.get(str(status), 0) + 1
+
+            if attempt > 1:
+                metrics.retries += 1
+
+            metrics.latency['total'].add(total)
+            metrics.latency['connect'].add(connect)
+
+            if ttfb is not None:
+                metrics.latency['ttfb'].add(ttfb)
+
+            if body is not None:
+                metrics.latency['body'].add(body)
+
+    def summary(self):
+        """
+        Return a list of per-endpoint summaries, the endpoints on which the
+        most time was spent first
+        """
+
+        with self.lock:
+            endpoints = sorted(self.endpoints.values(), key=lambda metrics: metrics.latency['total'].sum, reverse=True)
+
+            return [{
+                'method': metrics.method,
+                'endpoint': metrics.endpoint,
+                'requests': metrics.requests,
+                'retries': metrics.retries,
+                'bytes': metrics.bytes,
+                'statuses': dict(metrics.statuses),
+                'total_secs': metrics.latency['total'].sum,
+                'latency': {phase: histogram.summary() for phase, histogram in metrics.latency.items()},
+            } for metrics in endpoints]
+
+    def prometheus(self):
+        """
+        Return the metrics in the Prometheus text exposition format
+        """
+
+        lines = [
+            '# HELP mist_api_requests_total Mist API requests (inc retries) by endpoint & status.',
+            '# TYPE mist_api_requests_total counter',
+        ]
+
+        with self.lock:
+            endpoints = sorted(self.endpoints.values(), key=lambda metrics: (metrics.endpoint, metrics.method))
+
+            for metrics in endpoints:
+                for status, count in sorted(metrics.statuses.items()):
+                    lines.append('mist_api_requests_total{{{},status="{}"}} {}'.format(_labels(metrics), status, count))
+
+            lines.extend([
+                '# HELP mist_api_retries_total Mist API requests that were retries of a failed attempt.',
+                '# TYPE mist_api_retries_total counter',
+            ])
+            lines.extend('mist_api_retries_total{{{}}} {}'.format(_labels(metrics), metrics.retries) for metrics in endpoints)
+
+            lines.extend([
+                '# HELP mist_api_response_bytes_total Bytes of Mist API response bodies.',
+                '# TYPE mist_api_response_bytes_total counter',
+            ])
+            lines.extend('mist_api_response_bytes_total{{{}}} {}'.format(_labels(metrics), metrics.bytes) for metrics in endpoints)
+
+            lines.extend([
+                '# HELP mist_api_request_seconds Latency of Mist API requests by phase (connect, ttfb, body, total).',
+                '# TYPE mist_api_request_seconds histogram',
+            ])
+
+            for metrics in endpoints:
+                for phase in PHASES:
+                    histogram = metrics.latency[phase]
+                    labels = '{},phase="{}"'.format(_labels(metrics), phase)
+
+                    for bound, count in histogram.cumulative_buckets():
+                        lines.append('mist_api_request_seconds_bucket{{{},le="{}"}} {}'.format(labels, bound, count))
+
+                    lines.append('mist_api_request_seconds_bucket{{{},le="+Inf"}} {}'.format(labels, histogram.count))
+                    lines.append('mist_api_request_seconds_sum{{{}}} {:.6f}'.format(labels, histogram.sum))
+                    lines.append('mist_api_request_seconds_count{{{}}} {}'.format(labels, histogram.count))
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, directory):
+        """
+        Write the metrics to a Prometheus textfile & a JSON summary file in a
+        folder. Files are replaced atomically, so a collector never reads a
+        partly written file.
+
+        Returns:
+            [list] -- [Names of files written]
+        """
+
+        os.makedirs(directory, exist_ok=True)
+
+        prometheus_file = os.path.join(directory, PROMETHEUS_FILE)
+        json_file = os.path.join(directory, JSON_FILE)
+
+        _write_atomic(prometheus_file, self.prometheus())
+        _write_atomic(json_file, json.dumps({'endpoints': self.summary()}, indent=2))
+
+        return [prometheus_file, json_file]
+
+    def clear(self):
+
+        with self.lock:
+            self.endpoints.clear()
+
+
+def _labels(metrics):
+
+    return 'method="{}",endpoint="{}"'.format(metrics.method, _escape(metrics.endpoint))
+
+
+def _escape(value):
+
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _write_atomic(filename, content):
+
+    temp_file = filename + '.tmp'
+
+    with open(temp_file, 'w') as f:
+        f.write(content)
+
+    os.replace(temp_file, filename)
+
+
+# metrics of all MistVerbs objects in the process
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """
+    Return the metrics shared by all MistVerbs objects in the process. If
+    the MIST_METRICS_DIR env var is set, the metrics are written to that
+    folder when the process exits.
+    """
+
+    global _metrics
+
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = ApiMetrics()
+
+            if os.environ.get(METRICS_DIR_VAR):
+                atexit.register(write_metrics)
+
+        return _metrics
+
+
+def write_metrics(directory=None):
+    """
+    Write the metrics of the process to a folder (default = the folder set
+    by the MIST_METRICS_DIR env var), returning the names of the files
+    written (an empty list if no folder is set)
+    """
+
+    directory = directory if directory else os.environ.get(METRICS_DIR_VAR)
+
+    if not directory:
+        return []
+
+    return get_metrics().write(directory)
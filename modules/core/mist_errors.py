@@ -0,0 +1,142 @@
+"""
+Exceptions raised by MistVerbs when an API call fails.
+
+All exceptions are derived from MistApiError, so a script can catch any
+API failure with a single except clause, or pick out specific failures:
+
+    MistApiError
+     +-- MistReadOnlyError      (write attempted with a read-only MistVerbs object)
+     +-- MistConnectionError    (no response received - DNS, refused, reset etc.)
+     |    +-- MistTimeoutError  (no response within the call deadline/timeout)
+     +-- MistDecodeError        (response body is not valid JSON, e.g. truncated)
+     +-- MistHttpError          (API returned a non-success status code)
+          +-- MistClientError   (4xx)
+          |    +-- MistAuthError      (401, 403)
+          |    +-- MistNotFoundError  (404)
+          |    +-- MistRateLimitError (429)
+          +-- MistServerError   (5xx)
+
+(CassetteMissError, raised when a replayed call has no recorded response,
+is also derived from MistApiError - see cassette.py.)
+"""
+
+from http.client import responses
+
+
+class MistApiError(Exception):
+
+    """
+    Base class of all Mist API call failures
+
+    Arguments:
+        message {str} -- [Description of failure]
+        method {optional str} -- [HTTP method of failed call]
+        url {optional str} -- [Full URL of failed call]
+        status {optional int} -- [HTTP status code returned, if any]
+        headers {optional dict} -- [Response headers returned, if any]
+        attempts {optional int} -- [Number of attempts made, inc retries]
+    """
+
+    def __init__(self, message, method=None, url=None, status=None, headers=None, attempts=1):
+
+        super().__init__(message)
+
+        self.message = message
+        self.method = method
+        self.url = url
+        self.status = status
+        self.headers = headers if headers is not None else {}
+        self.attempts = attempts
+
+    def __str__(self):
+
+        if self.url:
+            return '{} - {} {} (attempts: {})'.format(self.message, self.method, self.url, self.attempts)
+
+        return self.message
+
+
+class MistReadOnlyError(MistApiError):
+    pass
+
+
+class MistConnectionError(MistApiError):
+    pass
+
+
+class MistTimeoutError(MistConnectionError):
+    pass
+
+
+class MistDecodeError(MistApiError):
+    pass
+
+
+class MistHttpError(MistApiError):
+
+    """
+    Base class of failures where the API returned a non-success status code.
+    The response body (if any) is available as 'body'.
+    """
+
+    def __init__(self, message, method=None, url=None, status=None, headers=None, attempts=1, body=b''):
+
+        super().__init__(message, method, url, status, headers, attempts)
+        self.body = body
+
+
+class MistClientError(MistHttpError):
+    pass
+
+
+class MistAuthError(MistClientError):
+    pass
+
+
+class MistNotFoundError(MistClientError):
+    pass
+
+
+class MistRateLimitError(MistClientError):
+    pass
+
+
+class MistServerError(MistHttpError):
+    pass
+
+
+def error_from_response(method, url, response, attempts=1):
+    """
+    Create the exception matching the status code of a failed API call
+
+    Arguments:
+        method {str} -- [HTTP method of call]
+        url {str} -- [Full URL of call]
+        response {requests response obj} -- [Response to call]
+        attempts {optional int} -- [Number of attempts made, inc retries]
+
+    Returns:
+        [MistHttpError obj] -- [Exception to be raised]
+    """
+
+    status = response.status_code
+
+    if status in (401, 403):
+        error_class = MistAuthError
+        hint = ' (check token?)'
+    elif status == 404:
+        error_class = MistNotFoundError
+        hint = ' (check req URL format?)'
+    elif status == 429:
+        error_class = MistRateLimitError
+        hint = ' (API call budget exhausted)'
+    elif status >= 500:
+        error_class = MistServerError
+        hint = ''
+    else:
+        error_class = MistClientError
+        hint = ' (check token or req URL format?)'
+
+    message = 'Query to Mist API failed: {} {}{}'.format(status, responses.get(status, 'Unknown'), hint)
+
+    return error_class(message, method, url, status, response.headers, attempts, response.content)
@@ -0,0 +1,262 @@
+"""
+A local SQLite mirror of the sites, devices, WLANs & inventory of an org.
+
+Each sync reads the current data from the API & compares a content hash of
+each record with the hash stored in the mirror, so only new or changed
+records are written (and records no longer returned by the API are
+removed). Reports can then be produced from the mirror without making any
+API calls.
+
+Example:
+
+    mirror = MistMirror()
+    mirror.sync(MistVerbs(api_token), org_id)
+
+    for device in mirror.records('inventory', org_id=org_id, type='ap'):
+        print(device['name'])
+
+Reports open the mirror read-only (read_only=True), which never creates
+the mirror file, & should check last_synced() before using it, as a mirror
+that has not been synced is empty.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.core.logger import ScriptLogger
+
+DEFAULT_MIRROR_FILE = os.path.join('.mist_cache', 'mirror.sqlite')
+
+# collections mirrored & the field that uniquely identifies their records
+COLLECTIONS = {
+    'sites': 'id',
+    'devices': 'id',
+    'wlans': 'id',
+    'inventory': 'mac',
+}
+
+# record fields copied to indexed columns, so they may be used to filter records
+INDEXED_FIELDS = ('org_id', 'site_id', 'type', 'model', 'serial', 'name')
+
+
+class MistMirror(object):
+
+    """
+    A local mirror of org data
+
+    Arguments:
+        mirror_file {optional str} -- [SQLite file used to store mirror (default = .mist_cache/mirror.sqlite)]
+        read_only {optional boolean} -- [True opens an existing mirror for reading only, raising IOError if there is none (default = False, created if needed)]
+    """
+
+    def __init__(self, mirror_file=DEFAULT_MIRROR_FILE, read_only=False):
+
+        self.mirror_file = mirror_file
+        self.read_only = read_only
+        self.logger = ScriptLogger('MistMirror')
+
+        if read_only:
+            if not os.path.isfile(mirror_file):
+                raise IOError("No mirror found at {} (run mirror_sync.py to create it)".format(mirror_file))
+
+            self.db = sqlite3.connect('file:{}?mode=ro'.format(mirror_file), uri=True)
+            return
+
+        mirror_dir = os.path.dirname(mirror_file)
+        if mirror_dir:
+            os.makedirs(mirror_dir, exist_ok=True)
+
+        self.db = sqlite3.connect(mirror_file)
+        self.db.execute("PRAGMA journal_mode=WAL")
+
+        for collection in COLLECTIONS:
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS {} (
+                    key TEXT PRIMARY KEY,
+                    org_id TEXT,
+                    site_id TEXT,
+                    type TEXT,
+                    model TEXT,
+                    serial TEXT,
+                    name TEXT,
+                    content_hash TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    synced_at REAL NOT NULL
+                )""".format(collection))
+            self.db.execute("CREATE INDEX IF NOT EXISTS {0}_org_id ON {0} (org_id, type)".format(collection))
+            self.db.execute("CREATE INDEX IF NOT EXISTS {0}_site_id ON {0} (site_id, type)".format(collection))
+
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS sync_log (
+                org_id TEXT NOT NULL,
+                collection TEXT NOT NULL,
+                synced_at REAL NOT NULL,
+                PRIMARY KEY (org_id, collection)
+            )""")
+        self.db.commit()
+
+    @staticmethod
+    def content_hash(record):
+        """
+        Return a hash of the content of a record (independent of key order)
+        """
+
+        return hashlib.sha1(json.dumps(record, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+    def update_collection(self, collection, org_id, records, site_id=None):
+        """
+        Bring the mirror of a collection in line with the records returned
+        by the API, writing only new or changed records
+
+        Arguments:
+            collection {str} -- [Name of collection (sites, devices, wlans or inventory)]
+            org_id {str} -- [Org ID the records belong to]
+            records {iterable} -- [All records of the collection returned by the API]
+            site_id {optional str} -- [Site ID, if the records are those of a single site]
+
+        Returns:
+            [dict] -- [Counts of records inserted, updated, unchanged & deleted]
+        """
+
+        key_field = COLLECTIONS[collection]
+        scope_sql = "org_id = ?" if site_id is None else "org_id = ? AND site_id = ?"
+        scope_args = (org_id,) if site_id is None else (org_id, site_id)
+
+        stored = dict(self.db.execute(
+            "SELECT key, content_hash FROM {} WHERE {}".format(collection, scope_sql), scope_args))
+
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+        now = time.time()
+        upserts = []
+
+        for record in records:
+            key = str(record[key_field])
+            record_hash = self.content_hash(record)
+            stored_hash = stored.pop(key, None)
+
+            if stored_hash == record_hash:
+                counts['unchanged'] += 1
+                continue
+
+            counts['updated' if stored_hash else 'inserted'] += 1
+
+            fields = dict(record, org_id=record.get('org_id', org_id))
+            if site_id is not None:
+                fields.setdefault('site_id', site_id)
+
+            upserts.append((key,) + tuple(fields.get(field) for field in INDEXED_FIELDS) +
+                           (record_hash, json.dumps(record), now))
+
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO {} (key, org_id, site_id, type, model, serial, name, content_hash, data, synced_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)".format(collection), upserts)
+
+            # anything left in stored is no longer returned by the API
+            self.db.executemany("DELETE FROM {} WHERE key = ?".format(collection), [(key,) for key in stored])
+            counts['deleted'] = len(stored)
+
+            self.db.execute("INSERT OR REPLACE INTO sync_log (org_id, collection, synced_at) VALUES (?, ?, ?)",
+                            (org_id, collection, now))
+
+        return counts
+
+    def sync(self, verb_obj, org_id, base_url="https://api.mist.com", workers=10):
+        """
+        Sync the mirror of an org with the API
+
+        Arguments:
+            verb_obj {MistVerbs obj} -- [Object used to read from the API]
+            org_id {str} -- [ID of org to sync]
+            base_url {optional str} -- [Base URL of the API (default = https://api.mist.com)]
+            workers {optional int} -- [Number of sites whose devices are read concurrently (default = 10)]
+
+        Returns:
+            [dict] -- [Counts of records inserted, updated, unchanged & deleted per collection]
+        """
+
+        org_url = "{}/api/v1/orgs/{}".format(base_url, org_id)
+        results = {}
+
+        sites = list(verb_obj.mist_iter(org_url + "/sites"))
+        results['sites'] = self.update_collection('sites', org_id, sites)
+        results['wlans'] = self.update_collection('wlans', org_id, verb_obj.mist_iter(org_url + "/wlans"))
+        results['inventory'] = self.update_collection('inventory', org_id, verb_obj.mist_iter(org_url + "/inventory"))
+
+        def read_site_devices(site):
+            return site['id'], list(verb_obj.mist_iter("{}/api/v1/sites/{}/devices".format(base_url, site['id'])))
+
+        device_counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+
+        # size the connection pool to the number of worker threads, as
+        # workers would otherwise wait for a free connection
+        verb_obj.pool.ensure_capacity(workers)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for site_id, devices in executor.map(read_site_devices, sites):
+                for name, count in self.update_collection('devices', org_id, devices, site_id).items():
+                    device_counts[name] += count
+
+        # remove devices of sites that no longer exist
+        site_ids = [site['id'] for site in sites]
+        with self.db:
+            cursor = self.db.execute(
+                "DELETE FROM devices WHERE org_id = ? AND site_id NOT IN ({})".format(','.join('?' * len(site_ids))),
+                [org_id] + site_ids)
+            device_counts['deleted'] += cursor.rowcount
+
+        results['devices'] = device_counts
+
+        return results
+
+    def records(self, collection, **filters):
+        """generator to return the mirrored records of a collection
+
+        Arguments:
+            collection {str} -- [Name of collection (sites, devices, wlans or inventory)]
+            filters {optional} -- [Indexed field values to match, e.g. org_id=..., type='ap']
+
+        Yields:
+            [dict] -- [Each matching record, as returned by the API]
+        """
+
+        if collection not in COLLECTIONS:
+            raise ValueError("Unknown collection: {}".format(collection))
+
+        for field in filters:
+            if field not in INDEXED_FIELDS:
+                raise ValueError("Cannot filter on field: {}".format(field))
+
+        where = " AND ".join("{} = ?".format(field) for field in filters)
+        sql = "SELECT data FROM {}{}".format(collection, " WHERE " + where if where else "")
+
+        for (data,) in self.db.execute(sql, tuple(filters.values())):
+            yield json.loads(data)
+
+    def site_names(self, org_id):
+        """
+        Return a dict of site ID to site name for the mirrored sites of an org
+        """
+
+        return dict(self.db.execute("SELECT key, name FROM sites WHERE org_id = ?", (org_id,)))
+
+    def last_synced(self, org_id, collection):
+        """
+        Return the epoch time a collection of an org (or of any org, if
+        org_id is None) was last synced, or None if it has not been synced
+        """
+
+        if org_id is None:
+            row = self.db.execute("SELECT MAX(synced_at) FROM sync_log WHERE collection = ?", (collection,)).fetchone()
+        else:
+            row = self.db.execute("SELECT synced_at FROM sync_log WHERE org_id = ? AND collection = ?",
+                                  (org_id, collection)).fetchone()
+
+        return row[0] if row else None
+
+    def close(self):
+        self.db.close()
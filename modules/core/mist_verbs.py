@@ -1,9 +1,21 @@
 import requests
-import json
-import sys
-from http.client import responses
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, urljoin
+
+from requests.structures import CaseInsensitiveDict
 
 from modules.core.logger import ScriptLogger
+from modules.core.http_pool import HttpPool, reset_connect_time, connect_time
+from modules.core.metrics import get_metrics
+from modules.core.stopwatch import Phase
+from modules.core.cassette import cassette_transport
+from modules.core.rate_limiter import get_rate_limiter
+from modules.core.retry import RetryPolicy
+from modules.core.json_stream import iter_json_array
+from modules.core.json_backend import json_loads, json_dumps
+from modules.core.mist_errors import (MistReadOnlyError, MistConnectionError, MistTimeoutError,
+                                      MistDecodeError, error_from_response)
 
 class MistVerbs(object):
 
@@ -11,141 +23,524 @@ class MistVerbs(object):
     A class to peform read, create, update & delete operations via the
     Mist API.
 
+    Failed calls raise an exception derived from MistApiError (see
+    mist_errors.py), after any retries allowed by the retry policy (see
+    retry.py) have been made.
+
     Arguments:
         token {mandatory str} -- [API token string]
         read_only {optional boolean} -- [True (default) allows only read operations]
+        rate_limiter {optional RateLimiter obj} -- [Limiter used to pace API calls (default = limiter shared by all users of token)]
+        max_throttle_retries {optional int} -- [Number of times a call is retried after HTTP 429 (default = 5)]
+        retry_policy {optional RetryPolicy obj} -- [Policy for retrying failed calls (default = RetryPolicy())]
+        cache {optional ResponseCache obj} -- [Persistent cache used by mist_read() (default = None, no caching)]
+        memo {optional MemoCache obj} -- [In-memory cache of mist_read() results for this run (default = None, no caching)]
+        pool {optional HttpPool obj} -- [Connection pool used to make calls, which may be shared with other objects (default = new pool with default settings)]
+        metrics {optional ApiMetrics obj} -- [Metrics that every call is recorded in (default = metrics shared by the process, see metrics.py)]
+        transport {optional session obj} -- [Session-like object requests are sent through instead of the pool's session, e.g. a RecordingSession or ReplaySession (default = pool session, or the cassette set by the MIST_CASSETTE env var, see cassette.py)]
     """
 
-    def __init__(self, token, read_only=True):
+    def __init__(self, token, read_only=True, rate_limiter=None, max_throttle_retries=5, retry_policy=None,
+                 cache=None, memo=None, pool=None, metrics=None, transport=None):
 
         self.token = token
         self.read_only = read_only
-        self.session = requests.Session()
+        self.pool = pool if pool else HttpPool()
+        self.session = transport if transport else cassette_transport(self.pool.session)
         self.logger = ScriptLogger('MistVerbs')
+        self._local = threading.local()
         self.response_headers = ''
+        self.rate_limiter = rate_limiter if rate_limiter else get_rate_limiter(token)
+        self.max_throttle_retries = max_throttle_retries
+        self.retry_policy = retry_policy if retry_policy else RetryPolicy()
+        self.cache = cache
+        self.memo = memo
+        self.metrics = metrics if metrics else get_metrics()
 
         # define common headers
         self.headers = {
                 'Content-Type': 'application/json',
                 'Authorization': 'Token {}'.format(token)
         }
-    
-    def mist_read(self, url):
+
+    @property
+    def response_headers(self):
+        """
+        Headers of the last response received by the calling thread (kept
+        per-thread so that concurrent calls don't see each other's headers)
+        """
+
+        return getattr(self._local, 'response_headers', '')
+
+    @response_headers.setter
+    def response_headers(self, headers):
+        self._local.response_headers = headers
+
+    @property
+    def response_status(self):
+        """
+        HTTP status of the last response received by the calling thread
+        (None if no response has been received)
+        """
+
+        return getattr(self._local, 'response_status', None)
+
+    @response_status.setter
+    def response_status(self, status):
+        self._local.response_status = status
+
+    def _request(self, method, url, deadline=None, retry_post=None, extra_headers=None, decode=False, **kwargs):
+        """
+        Send a request via the session, pacing it with the rate limiter &
+        retrying it if it fails in a way the retry policy allows. Throttled
+        calls (HTTP 429) are always retried (up to max_throttle_retries), as
+        the API has not acted on them.
+
+        With decode=True, the JSON body of a successful response is decoded
+        (as response.data) before it is returned, & a body that is not valid
+        JSON (e.g. it was cut short) is treated as a transient failure, so is
+        retried if the method may be.
+
+        Returns the response of a successful call (or a '304 Not Modified'
+        response to a conditional request), or raises a MistApiError
+        """
+
+        headers = self.headers
+
+        if extra_headers:
+            headers = dict(self.headers, **extra_headers)
+
+        policy = self.retry_policy
+        can_retry = policy.can_retry_method(method, retry_post)
+        expires = policy.expiry(deadline)
+        attempts = 0
+        throttled = 0
+
+        while True:
+
+            with Phase('rate limit wait'):
+                self.rate_limiter.acquire()
+
+            attempts += 1
+
+            reset_connect_time()
+            start_time = time.perf_counter()
+
+            try:
+                timeout = self.pool.timeout(policy.remaining(expires, method, url, attempts))
+
+                with Phase('http request'):
+                    response = self.session.request(method, url, headers=headers, timeout=timeout, **kwargs)
+
+            except requests.exceptions.Timeout as err:
+                self._record_metrics(method, url, None, attempts + throttled, start_time)
+                error = MistTimeoutError('No response from Mist API: {}'.format(err), method, url, attempts=attempts)
+
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as err:
+                self._record_metrics(method, url, None, attempts + throttled, start_time)
+                error = MistConnectionError('Unable to connect to Mist API: {}'.format(err), method, url, attempts=attempts)
+
+            else:
+                self._record_metrics(method, url, response, attempts + throttled, start_time, kwargs.get('stream'))
+                self.response_headers = response.headers
+                self.response_status = response.status_code
+                self.rate_limiter.update_from_headers(response.headers)
+
+                if response.status_code == 304 and extra_headers:
+                    return response
+
+                if 200 <= response.status_code < 300:
+                    if not decode:
+                        return response
+
+                    try:
+                        response.data = self._decode(method, url, response.content)
+                        return response
+                    except MistDecodeError as err:
+                        # body cut short or garbled in transit: retry as a transient failure
+                        err.status = response.status_code
+                        err.attempts = attempts
+                        error = err
+
+                else:
+                    error = error_from_response(method, url, response, attempts)
+
+                    if response.status_code == 429 and throttled < self.max_throttle_retries:
+                        throttled += 1
+                        attempts -= 1
+                        delay = self.rate_limiter.backoff(response.headers.get('Retry-After'), throttled)
+
+                        if expires is not None and time.monotonic() + delay >= expires:
+                            raise error
+
+                        self.logger.warning('API rate limit hit, backing off for {:.1f} secs (attempt {}/{}): {}'.format(
+                            delay, throttled, self.max_throttle_retries, url))
+                        continue
+
+                    if response.status_code not in policy.retry_statuses:
+                        raise error
+
+            # transient failure: retry if policy allows & time remains
+            if not can_retry or attempts > policy.max_retries:
+                raise error
+
+            delay = policy.backoff(attempts)
+
+            if expires is not None and time.monotonic() + delay >= expires:
+                raise error
+
+            self.logger.warning('{} (retry {}/{} in {:.1f} secs)'.format(error, attempts, policy.max_retries, delay))
+
+            with Phase('retry backoff'):
+                time.sleep(delay)
+
+    def _record_metrics(self, method, url, response, attempt, start_time, stream=False):
+        """
+        Record an attempt of a call in the metrics, splitting its latency in
+        to connect, time to first byte (response headers) & body read time
+        """
+
+        total = time.perf_counter() - start_time
+        connect = connect_time()
+
+        if response is None:
+            self.metrics.record(method, url, 'error', 0, attempt, total, connect)
+            return
+
+        headers_time = response.elapsed.total_seconds()
+
+        if stream:
+            # body not yet read, so use its advertised size
+            size = int(response.headers.get('Content-Length') or 0)
+            body = 0.0
+        else:
+            size = len(response.content)
+            body = max(0.0, total - headers_time)
+
+        self.metrics.record(method, url, response.status_code, size, attempt, total, connect,
+                            max(0.0, headers_time - connect), body)
+
+    def _decode(self, method, url, body):
+        """
+        Decode a JSON response body, raising MistDecodeError if it is not
+        valid JSON (e.g. the response was cut short)
+        """
+
+        with Phase('json decode'):
+            try:
+                return json_loads(body)
+            except ValueError as err:
+                raise MistDecodeError('Invalid JSON in response from Mist API: {}'.format(err), method, url)
+
+    def _check_writable(self):
+        """
+        Raise MistReadOnlyError if this object only allows read operations
+        """
+
+        if self.read_only:
+            self.logger.error('Object is read only...exiting')
+            raise MistReadOnlyError('Object is read-only. If you intend to perform write/update/delete operations, set read_only=False when creating object')
+
+    def _write(self, method, url, deadline=None, retry_post=None, data=None):
+        """
+        Send a create/update/delete request, dropping any in-memory cached
+        reads that it may have made stale (even if the request failed, as
+        it may have been partly applied)
+        """
+
+        # check if object is read only
+        self._check_writable()
+
+        kwargs = {'data': json_dumps(data)} if data is not None else {}
+
+        try:
+            response = self._request(method, url, deadline=deadline, retry_post=retry_post, **kwargs)
+        finally:
+            if self.memo:
+                self.memo.invalidate(url)
+
+        return self._decode(method, url, response.content)
+
+    def mist_read(self, url, deadline=None):
         """function to get data structure from Mist API using a requests session. This
         provides a read operation via the Mist API to retrieve data.
 
         Arguments:
             url {str} -- [Full URL of API call]
-            session {requests session obj} -- [session object created using requests]
+            deadline {optional float} -- [Max secs to spend on call inc retries (default = retry policy deadline)]
 
         Raises:
-            Exception: [Generic failure message if http request fails]
+            MistApiError: [Failure details if http request fails]
 
         Returns:
             [data structure] -- [Data structure returned - varies with API call]
         """
 
-        response = self.session.get(url, headers=self.headers)
-        self.response_headers = response.headers
+        if self.memo:
+            memo_entry = self.memo.get(url)
+
+            if memo_entry:
+                data, self.response_headers = memo_entry
+                return data
 
-        if response.status_code == 200:
-            return json.loads(response.content.decode('utf-8'))
+        if self.cache:
+            data = self._cached_read(url, deadline)
         else:
-            print('** Query to Mist API failed: {} (check token or req URL format?) - Bad URL: {}'.format(responses[response.status_code], url))
-            sys.exit()
+            data = self._request('GET', url, deadline=deadline, decode=True).data
 
-    def mist_create(self, url, data=''):
-        """function to post data structure to Mist API using a requests session. This
-        has the effect of creating new objects via the Mist API
+        if self.memo:
+            self.memo.put(url, data, self.response_headers)
+
+        return data
+
+    def _cached_read(self, url, deadline=None):
+        """
+        Return the decoded body of a GET, using the response cache if
+        possible. Only a body that decoded is cached.
+        """
+
+        entry = self.cache.get(self.token, url)
+
+        if entry and entry.fresh:
+            self.response_headers = entry.headers
+            return self._decode('GET', url, entry.body)
+
+        response = self._request('GET', url, deadline=deadline, extra_headers=entry.validators() if entry else None,
+                                 decode=True)
+
+        if response.status_code == 304:
+            self.cache.touch(self.token, url)
+            self.response_headers = CaseInsensitiveDict(entry.headers)
+            self.response_headers.update(response.headers)
+            return self._decode('GET', url, entry.body)
+
+        self.cache.put(self.token, url, response.content, response.headers)
+
+        return response.data
+
+    def mist_iter_pages(self, url, page_size=100):
+        """generator to walk a paginated Mist API call one page at a time. Each
+        page is fetched only when the previous page has been consumed, so memory
+        use stays flat regardless of the size of the full result set.
+
+        List calls (e.g. /orgs/{id}/inventory) are paged using the 'limit' &
+        'page' query params and the X-Page-* response headers. Search calls
+        (e.g. /sites/{id}/clients/sessions/search) return a 'results' list
+        and a 'next' link, which is followed until exhausted.
 
         Arguments:
             url {str} -- [Full URL of API call]
-            session {requests session obj} -- [session object created using requests]
-            data {dict} -- [data dict structure]
+            page_size {optional int} -- [Number of records requested per page (default = 100)]
+
+        Yields:
+            [list] -- [List of records contained in each page]
+        """
+
+        page = 1
+        next_url = self._page_url(url, page_size, page)
+
+        while next_url:
+
+            data = self.mist_read(next_url)
+
+            # the next page URL is worked out before yielding, as the
+            # generator may be resumed in a different thread (e.g. by
+            # AsyncMistVerbs), which would not see this response's headers
+
+            # search-style response: follow the 'next' link
+            if isinstance(data, dict):
+
+                if 'results' not in data:
+                    # not a paged response, just hand back the object
+                    yield [data]
+                    return
+
+                records = data['results']
+                next_url = self._next_page_url(url, page_size, page, len(records), data.get('next'), search=True)
+
+            # list-style response: use page headers to decide if more to come
+            else:
+                records = data
+                next_url = self._next_page_url(url, page_size, page, len(records), headers=self.response_headers)
+
+            yield records
+
+            page += 1
+
+    def mist_iter(self, url, page_size=100, stream=False):
+        """generator to return records from a paginated Mist API call one at a
+        time. Pages are retrieved on demand (see mist_iter_pages()), so the
+        records of each page may be used as soon as that page arrives.
+
+        With stream=True, each page is also decoded incrementally as it is
+        received (see mist_stream()), so that peak memory use is bounded by
+        the size of a single record rather than a full page. Streamed reads
+        are not cached.
+
+        Arguments:
+            url {str} -- [Full URL of API call]
+            page_size {optional int} -- [Number of records requested per page (default = 100)]
+            stream {optional boolean} -- [True decodes each page incrementally (default = False)]
+
+        Yields:
+            [dict] -- [Individual record returned by API call]
+        """
+
+        if not stream:
+            for records in self.mist_iter_pages(url, page_size=page_size):
+                for record in records:
+                    yield record
+            return
+
+        page = 1
+        next_url = self._page_url(url, page_size, page)
+
+        while next_url:
+
+            meta = {}
+            count = 0
+            headers = {}
+
+            for record in self.mist_stream(next_url, meta=meta):
+                count += 1
+
+                # keep the headers of this page's response, in case the
+                # generator is resumed in a different thread
+                if count == 1:
+                    headers = self.response_headers
+
+                yield record
+
+            next_url = self._next_page_url(url, page_size, page, count, meta.get('next'), search=bool(meta), headers=headers)
+            page += 1
+
+    def mist_stream(self, url, key='results', meta=None, chunk_size=65536):
+        """generator to read a (potentially very large) API response & decode
+        it incrementally as it is received, returning the items of its main
+        array one at a time. The main array is either the response itself
+        (e.g. a device list) or the array under 'key' in an object response
+        (e.g. the 'results' of a search call). Streamed reads are not cached.
+
+        Arguments:
+            url {str} -- [Full URL of API call]
+            key {optional str} -- [Key of main array in an object response (default = 'results')]
+            meta {optional dict} -- [Dict updated with the other top-level fields of an object response (e.g. 'next')]
+            chunk_size {optional int} -- [Bytes read from the response at a time (default = 65536)]
 
         Raises:
-            Exception: [Generic failure message if http post fails]
+            MistApiError: [Failure details if http request fails]
 
-        Returns:
-            [boolean] -- [True = post OK, False = bad post]
+        Yields:
+            [data structure] -- [Each item of the main array]
         """
 
-        # check if object is read only
-        if self.read_only:
-            self.logger.error('Object is read only...exiting')
-            print('** Object is read-only. If you intend to perform write/update/delete operations, set read_only=False when creating object')
-            sys.exit()
+        response = self._request('GET', url, stream=True)
 
-        response = None
+        try:
+            yield from iter_json_array(response.iter_content(chunk_size), key=key, meta=meta)
 
-        if data:
-            response = self.session.post(url, headers=self.headers, data=json.dumps(data))
-            self.response_headers = response.headers
-        else:
-            response = self.session.post(url, headers=self.headers)
-            self.response_headers = response.headers
+        except ValueError as err:
+            raise MistDecodeError('Invalid JSON in response from Mist API: {}'.format(err), 'GET', url)
+
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as err:
+            raise MistConnectionError('Connection to Mist API lost while reading response: {}'.format(err), 'GET', url)
+
+        finally:
+            response.close()
 
-        if response.status_code == 200:
-            return json.loads(response.content.decode('utf-8'))
+    def _next_page_url(self, url, page_size, page, count, next_link=None, search=False, headers=None):
+        """
+        Return the URL of the page following page number 'page' (which held
+        'count' records), or None if it was the last page. 'headers' are the
+        response headers of the page (default = the last response headers of
+        the calling thread).
+        """
+
+        if not count:
+            return None
+
+        # search-style response: follow the 'next' link
+        if search or urlsplit(url).path.endswith('/search'):
+            return urljoin(url, next_link) if next_link else None
+
+        # list-style response: use page headers to decide if more to come
+        # no headers if the page was served from a cache
+        headers = (headers if headers is not None else self.response_headers) or {}
+        total = headers.get('X-Page-Total')
+        limit = int(headers.get('X-Page-Limit', page_size))
+
+        if total is not None:
+            more_pages = page * limit < int(total)
         else:
-            print('** Query to Mist API failed: {} (check token or req URL format?) - bad URL: {}'.format(responses[response.status_code], url))
-            sys.exit()
+            more_pages = count >= limit
 
-    def mist_update(self, url, data):
-        """function to put data structure to Mist API using a requests session. This
-        hs the effect of doing an update of data sent to the Mist API
+        return self._page_url(url, page_size, page + 1) if more_pages else None
+
+    @staticmethod
+    def _page_url(url, page_size, page):
+        """
+        Add (or replace) the 'limit' & 'page' query params of a URL
+        """
+
+        scheme, netloc, path, query, fragment = urlsplit(url)
+        params = [(k, v) for k, v in parse_qsl(query) if k not in ('limit', 'page')]
+        params.append(('limit', page_size))
+
+        # search calls page using their 'next' link, not a page number
+        if not path.endswith('/search'):
+            params.append(('page', page))
+
+        return urlunsplit((scheme, netloc, path, urlencode(params), fragment))
+
+    def mist_create(self, url, data='', deadline=None, retry=None):
+        """function to post data structure to Mist API using a requests session. This
+        has the effect of creating new objects via the Mist API
 
         Arguments:
             url {str} -- [Full URL of API call]
-            session {requests session obj} -- [session object created using requests]
             data {dict} -- [data dict structure]
+            deadline {optional float} -- [Max secs to spend on call inc retries (default = retry policy deadline)]
+            retry {optional boolean} -- [True allows a failed post to be retried, which may create duplicates (default = retry policy retry_post)]
 
         Raises:
-            Exception: [Generic failure message if http post fails]
+            MistApiError: [Failure details if http post fails]
 
         Returns:
-            [boolean] -- [True = post OK, False = bad post]
+            [data structure] -- [Data structure returned - varies with API call]
         """
 
-        # check if object is read only
-        if self.read_only:
-            self.logger.error('Object is read only...exiting')
-            print('Object is read-only. If you intend to perform write/update/delete operations, set read_only=False when creating object')
-            sys.exit()
+        return self._write('POST', url, deadline=deadline, retry_post=retry, data=data if data else None)
 
-        response = self.session.put(url, headers=self.headers, data=json.dumps(data))
-        self.response_headers = response.headers
+    def mist_update(self, url, data, deadline=None):
+        """function to put data structure to Mist API using a requests session. This
+        hs the effect of doing an update of data sent to the Mist API
 
-        if response.status_code == 200:
-            return json.loads(response.content.decode('utf-8'))
-        else:
-            print('** Query to Mist API failed: {} (check token or req URL format?)'.format(responses[response.status_code]))
-            sys.exit()
+        Arguments:
+            url {str} -- [Full URL of API call]
+            data {dict} -- [data dict structure]
+            deadline {optional float} -- [Max secs to spend on call inc retries (default = retry policy deadline)]
+
+        Raises:
+            MistApiError: [Failure details if http put fails]
+
+        Returns:
+            [data structure] -- [Data structure returned - varies with API call]
+        """
 
-    def mist_delete(self, url):
+        return self._write('PUT', url, deadline=deadline, data=data)
+
+    def mist_delete(self, url, deadline=None):
         """function to delete object from Mist API using a requests session
 
         Arguments:
             url {str} -- [Full URL of API call inc ID of object to be deleted]
-            session {requests session obj} -- [session object created using requests]
+            deadline {optional float} -- [Max secs to spend on call inc retries (default = retry policy deadline)]
 
         Raises:
-            Exception: [Generic failure message if http delete fails]
+            MistApiError: [Failure details if http delete fails]
 
         Returns:
-            [boolean] -- [True = delete OK, False = bad delete]
+            [data structure] -- [Data structure returned - varies with API call]
         """
 
-        # check if object is read only
-        if self.read_only:
-            self.logger.error('Object is read only...exiting')
-            raise Exception('Object is read-only. If you intend to perform write/update/delete operations, set read_only=False when creating object')
-        
-        response = self.session.delete(url, headers=self.headers)
-        self.response_headers = response.headers
-
-        if response.status_code == 200:
-            return json.loads(response.content.decode('utf-8'))
-        else:
-            print('** Query to Mist API failed: {} (check token or req URL format?) - Bad URL: {}'.format(responses[response.status_code], url))
-            sys.exit()
+        return self._write('DELETE', url, deadline=deadline)
@@ -0,0 +1,211 @@
+"""
+Time-window sharding of Mist search calls (e.g. client session searches).
+
+Search calls such as /sites/{id}/clients/sessions/search return at most
+'limit' results per query, so a single query over a long (or busy) period
+silently loses data. The sharder splits the requested start/end range into
+time shards, which are queried concurrently. Any shard that returns a full
+'limit' of results may have been truncated, so it is split in two & each
+half queried again, until every shard is under the limit (or the shard
+reaches the minimum shard size, when a warning is logged). The results of
+all shards are merged, with duplicates (e.g. a session overlapping two
+shards) removed. Only a result whose time span reaches past the edge of its
+shard can be returned by another shard, so only the keys of those results
+are kept to find duplicates: memory use does not grow with every result.
+
+Example:
+
+    async def get_sessions(token, url, start, end):
+        async with AsyncMistVerbs(token, concurrency=10) as verb_obj:
+            sharder = QuerySharder(verb_obj, shard_seconds=3600)
+            return await sharder.search(url, start, end)
+
+    sessions = asyncio.run(get_sessions(api_token, sessions_url, start, end))
+"""
+
+import asyncio
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from modules.core.logger import ScriptLogger
+
+
+def session_key(record):
+    """
+    Default key used to identify duplicate search results (client sessions)
+    """
+
+    return (record.get('mac'), record.get('ap'), record.get('connect'), record.get('disconnect'))
+
+
+def session_span(record):
+    """
+    Default (start, end) epoch times of a search result (client session),
+    either of which may be None if not known
+    """
+
+    return record.get('connect'), record.get('disconnect')
+
+
+class QuerySharder(object):
+
+    """
+    Run a search call over a time range as a set of concurrent time-shard queries
+
+    Arguments:
+        verb_obj {AsyncMistVerbs obj} -- [Object used to make the API calls]
+        shard_seconds {optional int} -- [Initial size of time shards in secs (default = 3600)]
+        limit {optional int} -- [Max results requested per query (default = 1000)]
+        min_shard_seconds {optional int} -- [Shards are not split below this size in secs (default = 60)]
+        key {optional function} -- [Returns the identity of a result, used to remove duplicates (default = session_key)]
+        span {optional function} -- [Returns the (start, end) times of a result, used to find results that may be in more than one shard (default = session_span)]
+    """
+
+    def __init__(self, verb_obj, shard_seconds=3600, limit=1000, min_shard_seconds=60, key=session_key, span=session_span):
+
+        self.verb_obj = verb_obj
+        self.shard_seconds = shard_seconds
+        self.limit = limit
+        self.min_shard_seconds = min_shard_seconds
+        self.key = key
+        self.span = span
+        self.logger = ScriptLogger('QuerySharder')
+
+        # counters
+        self.queries = 0
+        self.splits = 0
+        self.truncated = 0
+        self.duplicates = 0
+
+    def shards(self, start, end):
+        """
+        Return the initial list of (start, end) shards of a time range
+        """
+
+        shards = []
+        shard_start = start
+
+        while shard_start < end:
+            shard_end = min(end, shard_start + self.shard_seconds)
+            shards.append((shard_start, shard_end))
+            shard_start = shard_end
+
+        return shards
+
+    def shard_url(self, url, start, end):
+        """
+        Return a search URL with the start, end & limit params of a shard
+        """
+
+        scheme, netloc, path, query, fragment = urlsplit(url)
+        params = [(k, v) for k, v in parse_qsl(query) if k not in ('start', 'end', 'limit', 'page')]
+        params.extend([('start', start), ('end', end), ('limit', self.limit)])
+
+        return urlunsplit((scheme, netloc, path, urlencode(params), fragment))
+
+    async def _query(self, url, start, end):
+
+        self.queries += 1
+        data = await self.verb_obj.mist_read(self.shard_url(url, start, end))
+
+        return start, end, data.get('results', []) if isinstance(data, dict) else data
+
+    def _at_edge(self, result, shard_start, shard_end, start, end):
+        """
+        Return True if a result may also be returned by a neighbouring shard,
+        as its time span reaches an edge of its shard inside the time range
+        (or its span is not known)
+        """
+
+        first, last = self.span(result)
+
+        if first is None or last is None:
+            return True
+
+        return (first <= shard_start and shard_start > start) or (last >= shard_end and shard_end < end)
+
+    async def iter_search(self, url, start, end):
+        """async generator to return the (de-duplicated) results of a search
+        over a time range, as each shard completes
+
+        Arguments:
+            url {str} -- [Full URL of search API call, inc any filter params]
+            start {int} -- [Start of time range (epoch secs)]
+            end {int} -- [End of time range (epoch secs)]
+
+        Yields:
+            [dict] -- [Each result of the search]
+        """
+
+        start = int(start)
+        end = int(end)
+
+        # keys of the results that may be returned by more than one shard
+        edge_keys = set()
+        pending = {asyncio.ensure_future(self._query(url, shard_start, shard_end))
+                   for shard_start, shard_end in self.shards(start, end)}
+
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    shard_start, shard_end, results = task.result()
+
+                    # shard may have been truncated, split it in two & try again
+                    if len(results) >= self.limit:
+
+                        if shard_end - shard_start > self.min_shard_seconds:
+                            self.splits += 1
+                            middle = (shard_start + shard_end) // 2
+                            pending.add(asyncio.ensure_future(self._query(url, shard_start, middle)))
+                            pending.add(asyncio.ensure_future(self._query(url, middle, shard_end)))
+                            continue
+
+                        self.truncated += 1
+                        self.logger.warning('Shard {}-{} hit result limit ({}) at minimum shard size, results may be incomplete'.format(
+                            shard_start, shard_end, self.limit))
+
+                    for result in results:
+
+                        if not self._at_edge(result, shard_start, shard_end, start, end):
+                            yield result
+                            continue
+
+                        result_key = self.key(result)
+
+                        if result_key in edge_keys:
+                            self.duplicates += 1
+                            continue
+
+                        edge_keys.add(result_key)
+                        yield result
+
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def search(self, url, start, end):
+        """return the merged & de-duplicated results of a search over a time range
+
+        Arguments:
+            url {str} -- [Full URL of search API call, inc any filter params]
+            start {int} -- [Start of time range (epoch secs)]
+            end {int} -- [End of time range (epoch secs)]
+
+        Returns:
+            [list] -- [All results of the search]
+        """
+
+        return [result async for result in self.iter_search(url, start, end)]
+
+    def stats(self):
+        """
+        Return a dict of sharder counters
+        """
+
+        return {
+            'queries': self.queries,
+            'splits': self.splits,
+            'truncated': self.truncated,
+            'duplicates': self.duplicates,
+        }
@@ -0,0 +1,249 @@
+"""
+A token-bucket rate limiter used to keep Mist API calls within the hourly
+call budget of an API token (5000 calls per hour by default).
+
+Calls are paced before the budget runs out: the bucket holds up to 'burst'
+calls which are refilled at the hourly rate, so short scripts run at full
+speed while long bulk jobs settle to the sustainable rate. If the API
+reports rate limit headers, the bucket is re-synced to the calls remaining.
+When the API does return HTTP 429, all users of the bucket are paused for
+the 'Retry-After' period (or an exponential backoff with jitter if no
+Retry-After header is provided).
+
+One limiter is shared by all MistVerbs & AsyncMistVerbs objects in the same
+process that use the same token (see get_rate_limiter()), so parallel
+threads & asyncio tasks draw on a single budget. The limiter is safe to use
+from threads (acquire()) and from asyncio code (acquire_async()).
+"""
+
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# default hourly API call budget for a Mist API token
+MIST_CALLS_PER_HOUR = 5000
+
+
+class RateLimiter(object):
+
+    """
+    A thread-safe token bucket
+
+    Arguments:
+        calls_per_hour {optional int} -- [Hourly call budget (default = 5000)]
+        burst {optional int} -- [Max calls that may be made back-to-back before pacing starts (default = 10% of hourly budget)]
+        max_backoff {optional float} -- [Upper limit in secs of backoff delay after a 429 with no Retry-After header (default = 300)]
+    """
+
+    def __init__(self, calls_per_hour=MIST_CALLS_PER_HOUR, burst=None, max_backoff=300):
+
+        self.calls_per_hour = calls_per_hour
+        self.rate = calls_per_hour / 3600.0
+        self.capacity = burst if burst else max(1, calls_per_hour // 10)
+        self.max_backoff = max_backoff
+
+        self.tokens = float(self.capacity)
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+        # counters
+        self.calls = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+
+    def _refill(self, now):
+        """
+        Add tokens accrued since last refill (lock must be held)
+        """
+
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def wait_time(self):
+        """
+        Return the number of seconds until a call could be made, without
+        using up a call from the budget
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            token_wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+            return max(token_wait, self.blocked_until - now, 0.0)
+
+    def reserve(self):
+        """
+        Take one call from the budget & return the number of seconds the
+        caller must wait before making the call
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            self.calls += 1
+
+            token_wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            wait = max(token_wait, self.blocked_until - now, 0.0)
+            self.total_wait += wait
+
+            return wait
+
+    def acquire(self):
+        """
+        Block the calling thread until a call may be made
+        """
+
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """
+        Suspend the calling asyncio task until a call may be made
+        """
+
+        # imported here, as most scripts never use asyncio (see bench_startup.py)
+        import asyncio
+
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+    async def ready_async(self):
+        """
+        Suspend the calling asyncio task until a call could be made, without
+        using up a call from the budget (used where the call itself will
+        acquire() in a worker thread)
+        """
+
+        import asyncio
+
+        wait = self.wait_time()
+        while wait:
+            await asyncio.sleep(wait)
+            wait = self.wait_time()
+
+    def update_from_headers(self, headers):
+        """
+        Re-sync the bucket with any rate limit headers returned by the API
+
+        Arguments:
+            headers {dict} -- [Response headers]
+        """
+
+        remaining = headers.get('X-RateLimit-Remaining')
+        limit = headers.get('X-RateLimit-Limit')
+
+        with self.lock:
+
+            if limit and limit.isdigit() and int(limit) != self.calls_per_hour:
+                self.calls_per_hour = int(limit)
+                self.rate = self.calls_per_hour / 3600.0
+
+            if remaining and remaining.isdigit():
+                self.tokens = min(self.tokens, float(remaining))
+
+                if int(remaining) == 0:
+                    reset_wait = parse_retry_after(headers.get('X-RateLimit-Reset'))
+                    if reset_wait:
+                        self.blocked_until = max(self.blocked_until, time.monotonic() + reset_wait)
+
+    def backoff(self, retry_after=None, attempt=1):
+        """
+        Pause all users of this bucket after the API has returned HTTP 429
+
+        Arguments:
+            retry_after {optional str} -- [Value of Retry-After header, if provided]
+            attempt {optional int} -- [Number of consecutive 429s received for this call]
+
+        Returns:
+            [float] -- [Backoff delay applied in seconds]
+        """
+
+        delay = parse_retry_after(retry_after)
+
+        if delay is None:
+            delay = min(self.max_backoff, 2 ** attempt)
+
+        # add jitter so that paused callers don't all retry at the same instant
+        delay += random.uniform(0, max(1.0, delay * 0.1))
+
+        with self.lock:
+            self.throttled += 1
+            self.tokens = min(self.tokens, 0.0)
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+
+        return delay
+
+    def stats(self):
+        """
+        Return a dict of limiter counters
+        """
+
+        with self.lock:
+            return {
+                'calls': self.calls,
+                'throttled': self.throttled,
+                'total_wait': round(self.total_wait, 3),
+            }
+
+
+def parse_retry_after(value):
+    """
+    Convert a Retry-After (or rate limit reset) header value to seconds.
+    The value may be a number of seconds, an HTTP date or a Unix epoch time.
+
+    Returns:
+        [float or None] -- [Seconds to wait, or None if no usable value]
+    """
+
+    if not value:
+        return None
+
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            retry_time = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+
+        # dates with a '-0000' zone are parsed as naive, but HTTP dates are always UTC
+        if retry_time.tzinfo is None:
+            retry_time = retry_time.replace(tzinfo=timezone.utc)
+
+        return max(0.0, (retry_time - datetime.now(timezone.utc)).total_seconds())
+
+    # large values are an absolute epoch time rather than a delay
+    if seconds > 10 ** 9:
+        seconds -= time.time()
+
+    return max(0.0, seconds)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(token, calls_per_hour=MIST_CALLS_PER_HOUR, burst=None):
+    """
+    Return the rate limiter shared by all users of an API token in this
+    process, creating it on first use
+
+    Arguments:
+        token {str} -- [API token string]
+        calls_per_hour {optional int} -- [Hourly call budget if limiter is created (default = 5000)]
+        burst {optional int} -- [Burst size if limiter is created]
+
+    Returns:
+        [RateLimiter obj] -- [Shared limiter]
+    """
+
+    with _limiters_lock:
+        if token not in _limiters:
+            _limiters[token] = RateLimiter(calls_per_hour, burst)
+        return _limiters[token]
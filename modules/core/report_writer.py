@@ -0,0 +1,493 @@
+"""
+Report writers used by the scripts that dump data to files in the 'reports'
+folder.
+
+Rows are written as they are produced (e.g. as each page of API results
+arrives), through a large write buffer, rather than being collected in a
+list & written at the end. The time to the first row written is then the
+time to get the first page of results, and memory use does not grow with
+the size of the report.
+
+Reports may be written in these formats:
+
+ - csv: plain CSV file
+ - parquet: Apache Parquet file (requires pyarrow)
+ - arrow: Apache Arrow IPC (Feather v2) file (requires pyarrow)
+
+Parquet & Arrow reports have typed columns (see COLUMN_TYPES), & are written
+in batches (row groups) so that memory use stays bounded. Columns with few
+distinct values (e.g. model, band, OS, site name) should be given the
+'dictionary' type, which stores each distinct value once.
+
+Reports may also be compressed as they are written (no temp file), using
+gzip or zstd (zstd requires the zstandard module for CSV reports). CSV
+reports get a .gz or .zst extension, while Parquet & Arrow reports use the
+compression built in to those formats (Arrow IPC files support zstd only).
+Compressed or not, CSV reports can be read back using open_report() or
+read_report(), which detect the compression from the start of the file.
+
+Example:
+
+    rows = ({"name": device['name']} for device in verb_obj.mist_iter(url))
+    write_report(rows, 'reports/Devices.csv', ["name"])
+"""
+
+import csv
+import gzip
+import io
+import os
+import time
+
+from modules.core.logger import ScriptLogger
+from modules.core.stopwatch import Phase
+
+# size of write buffer used for report files (bytes)
+BUFFER_SIZE = 1024 * 1024
+
+# number of rows in each batch (row group) of a columnar report
+BATCH_SIZE = 50000
+
+REPORT_FORMATS = ('csv', 'parquet', 'arrow')
+
+# column types available for columnar reports
+COLUMN_TYPES = ('string', 'dictionary', 'int', 'float', 'bool', 'timestamp')
+
+COMPRESSIONS = ('gzip', 'zstd')
+
+# default compression levels - favour speed, as reports are written as the
+# API results arrive
+DEFAULT_COMPRESS_LEVELS = {'gzip': 6, 'zstd': 3}
+
+# file extensions of compressed CSV reports
+COMPRESS_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+# magic bytes at the start of compressed files
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def _zstandard():
+
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("The zstandard module is required for zstd compressed reports (pip install zstandard)")
+
+    return zstandard
+
+
+def _open_compressed(filename, compress, compress_level=None, buffer_size=BUFFER_SIZE):
+    """
+    Open a binary file for writing, compressing the data written to it (the
+    buffer sits in front of the compressor, so it is given large chunks)
+    """
+
+    level = compress_level if compress_level is not None else DEFAULT_COMPRESS_LEVELS[compress]
+
+    if compress == 'gzip':
+        compressed = gzip.GzipFile(filename, 'wb', compresslevel=level)
+    elif compress == 'zstd':
+        compressed = _zstandard().ZstdCompressor(level=level).stream_writer(open(filename, 'wb'), closefd=True)
+    else:
+        raise ValueError("Unknown compression: {}".format(compress))
+
+    return io.BufferedWriter(compressed, buffer_size)
+
+
+def open_report(filename, mode='rt'):
+    """
+    Open a report file for reading, which may be uncompressed or compressed
+    using gzip or zstd (detected from the start of the file)
+
+    Arguments:
+        filename {str} -- [Name of report file]
+        mode {optional str} -- [rt (text, default) or rb (binary)]
+
+    Returns:
+        [file obj] -- [File object returning the uncompressed data]
+    """
+
+    if mode not in ('rt', 'rb'):
+        raise ValueError("Unsupported mode: {}".format(mode))
+
+    with open(filename, 'rb') as f:
+        magic = f.read(4)
+
+    if magic.startswith(GZIP_MAGIC):
+        report = gzip.GzipFile(filename, 'rb')
+    elif magic == ZSTD_MAGIC:
+        report = io.BufferedReader(_zstandard().ZstdDecompressor().stream_reader(open(filename, 'rb'), closefd=True))
+    else:
+        report = open(filename, 'rb')
+
+    return io.TextIOWrapper(report, newline='') if mode == 'rt' else report
+
+
+def read_report(filename):
+    """generator to return the rows of a CSV report file (compressed or not)
+
+    Arguments:
+        filename {str} -- [Name of report file]
+
+    Yields:
+        [dict] -- [Each row of the report]
+    """
+
+    with open_report(filename) as f:
+        for row in csv.DictReader(f):
+            yield row
+
+
+class ReportWriter(object):
+
+    """
+    Base class of report writers. May be used as a context manager, which
+    opens & closes the report file.
+
+    Arguments:
+        report_file {str} -- [Name of report file]
+        column_headers {list} -- [Column names, in the order they are written]
+    """
+
+    def __init__(self, report_file, column_headers):
+
+        self.report_file = report_file
+        self.column_headers = column_headers
+
+        self.rows_written = 0
+        self.open_time = None
+        self.first_row_time = None
+
+    def open(self):
+        """
+        Open the report file
+        """
+
+        self._open()
+        self.open_time = time.perf_counter()
+
+    def write_row(self, row):
+        """
+        Write a single row (dict) to the report
+        """
+
+        if self.first_row_time is None:
+            self.first_row_time = time.perf_counter() - self.open_time
+
+        self._write(row)
+        self.rows_written += 1
+
+    def write_rows(self, rows):
+        """
+        Write each row produced by an iterable (e.g. a generator) to the report
+        """
+
+        for row in rows:
+            self.write_row(row)
+
+    def close(self):
+        """
+        Flush any buffered rows & close the report file
+        """
+
+        self._close()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CsvReportWriter(ReportWriter):
+
+    """
+    Write rows (dicts) to a CSV report file as they are produced.
+
+    Arguments:
+        report_file {str} -- [Name of report file]
+        column_headers {list} -- [Column names, in the order they are written]
+        buffer_size {optional int} -- [Size of write buffer in bytes (default = 1MB)]
+        compress {optional str} -- [Compress the report using gzip or zstd (default = no compression)]
+        compress_level {optional int} -- [Compression level (default = 6 for gzip, 3 for zstd)]
+    """
+
+    def __init__(self, report_file, column_headers, buffer_size=BUFFER_SIZE, compress=None, compress_level=None):
+
+        super().__init__(report_file, column_headers)
+
+        self.buffer_size = buffer_size
+        self.compress = compress
+        self.compress_level = compress_level
+        self.file = None
+        self.writer = None
+
+    def _open(self):
+
+        if self.compress:
+            self.file = io.TextIOWrapper(
+                _open_compressed(self.report_file, self.compress, self.compress_level, self.buffer_size), newline='')
+        else:
+            self.file = open(self.report_file, 'w', newline='', buffering=self.buffer_size)
+
+        self.writer = csv.DictWriter(self.file, fieldnames=self.column_headers, extrasaction='ignore')
+        self.writer.writeheader()
+
+    def _write(self, row):
+        self.writer.writerow(row)
+
+    def _close(self):
+
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+class ArrowReportWriter(ReportWriter):
+
+    """
+    Write rows (dicts) to a Parquet or Arrow IPC report file in batches.
+
+    Arguments:
+        report_file {str} -- [Name of report file]
+        column_headers {list} -- [Column names, in the order they are written]
+        file_format {optional str} -- [parquet (default) or arrow]
+        column_types {optional dict} -- [Column name to type (see COLUMN_TYPES) mapping (default type = string)]
+        batch_size {optional int} -- [Number of rows in each batch/row group (default = 50000)]
+        compress {optional str} -- [Compress the report using gzip or zstd (default = format default)]
+        compress_level {optional int} -- [Compression level (default = codec default)]
+    """
+
+    def __init__(self, report_file, column_headers, file_format='parquet', column_types=None, batch_size=BATCH_SIZE,
+                 compress=None, compress_level=None):
+
+        super().__init__(report_file, column_headers)
+
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError("The pyarrow module is required to write {} reports (pip install pyarrow)".format(file_format))
+
+        self.pa = pyarrow
+        self.file_format = file_format
+        self.column_types = column_types if column_types else {}
+        self.batch_size = batch_size
+        self.compress = compress
+        self.compress_level = compress_level
+
+        if compress and compress not in COMPRESSIONS:
+            raise ValueError("Unknown compression: {}".format(compress))
+
+        if compress == 'gzip' and file_format == 'arrow':
+            raise ValueError("Arrow reports support zstd compression only")
+
+        self.schema = pyarrow.schema([(name, self._arrow_type(self.column_types.get(name, 'string')))
+                                      for name in column_headers])
+
+        # dictionary columns keep one dictionary for the whole report, which
+        # only grows, so each batch just adds any new values to it
+        self.dictionaries = {name: {} for name in column_headers if self.column_types.get(name) == 'dictionary'}
+
+        self.batch = {name: [] for name in column_headers}
+        self.batch_rows = 0
+        self.sink = None
+        self.writer = None
+
+    def _arrow_type(self, column_type):
+
+        pa = self.pa
+
+        types = {
+            'string': pa.string(),
+            'dictionary': pa.dictionary(pa.int32(), pa.string()),
+            'int': pa.int64(),
+            'float': pa.float64(),
+            'bool': pa.bool_(),
+            'timestamp': pa.timestamp('s', tz='UTC'),
+        }
+
+        if column_type not in types:
+            raise ValueError("Unknown column type: {}".format(column_type))
+
+        return types[column_type]
+
+    def _open(self):
+
+        if self.file_format == 'parquet':
+            import pyarrow.parquet
+            options = {'compression': self.compress, 'compression_level': self.compress_level} if self.compress else {}
+            self.writer = pyarrow.parquet.ParquetWriter(self.report_file, self.schema, **options)
+
+        elif self.file_format == 'arrow':
+            import pyarrow.ipc
+            self.sink = self.pa.OSFile(self.report_file, 'wb')
+            codec = self.pa.Codec(self.compress, self.compress_level) if self.compress else None
+            options = pyarrow.ipc.IpcWriteOptions(emit_dictionary_deltas=True, compression=codec)
+            self.writer = pyarrow.ipc.new_file(self.sink, self.schema, options=options)
+
+        else:
+            raise ValueError("Unknown columnar report format: {}".format(self.file_format))
+
+    def _write(self, row):
+
+        for name in self.column_headers:
+            self.batch[name].append(row.get(name))
+
+        self.batch_rows += 1
+
+        if self.batch_rows >= self.batch_size:
+            self._write_batch()
+
+    def _column_array(self, name, values):
+
+        pa = self.pa
+
+        if name in self.dictionaries:
+            dictionary = self.dictionaries[name]
+            indices = [None if value is None else dictionary.setdefault(str(value), len(dictionary)) for value in values]
+            return pa.DictionaryArray.from_arrays(pa.array(indices, type=pa.int32()),
+                                                  pa.array(list(dictionary), type=pa.string()))
+
+        arrow_type = self.schema.field(name).type
+
+        if arrow_type == pa.string():
+            values = [None if value is None else str(value) for value in values]
+
+        return pa.array(values, type=arrow_type)
+
+    def _write_batch(self):
+
+        if not self.batch_rows:
+            return
+
+        arrays = [self._column_array(name, self.batch[name]) for name in self.column_headers]
+        self.writer.write_batch(self.pa.record_batch(arrays, schema=self.schema))
+
+        self.batch = {name: [] for name in self.column_headers}
+        self.batch_rows = 0
+
+    def _close(self):
+
+        if self.writer:
+            self._write_batch()
+            self.writer.close()
+            self.writer = None
+
+        if self.sink:
+            self.sink.close()
+            self.sink = None
+
+
+def report_file_name(report_file, file_format='csv', compress=None):
+    """
+    Return the name of a report file with the extension of a report format
+    (and compression, for CSV reports)
+    """
+
+    extensions = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+    report_file = os.path.splitext(report_file)[0] + extensions[file_format]
+
+    if compress and file_format == 'csv':
+        report_file += COMPRESS_EXTENSIONS[compress]
+
+    return report_file
+
+
+def check_report_options(file_format='csv', compress=None):
+    """
+    Check a report format & compression can be written, raising ValueError
+    if they can't be used together (or ImportError if a module they need is
+    missing). Scripts call this as they parse their options, so a bad
+    combination is rejected before any API call is made.
+
+    Arguments:
+        file_format {optional str} -- [Report format: csv (default), parquet or arrow]
+        compress {optional str} -- [Compression: gzip or zstd (default = no compression)]
+    """
+
+    if file_format not in REPORT_FORMATS:
+        raise ValueError("Unknown report format: {}".format(file_format))
+
+    if compress and compress not in COMPRESSIONS:
+        raise ValueError("Unknown compression: {}".format(compress))
+
+    if file_format == 'csv':
+        if compress == 'zstd':
+            _zstandard()
+        return
+
+    if compress == 'gzip' and file_format == 'arrow':
+        raise ValueError("Arrow reports support zstd compression only")
+
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("The pyarrow module is required to write {} reports (pip install pyarrow)".format(file_format))
+
+    if compress and not pyarrow.Codec.is_available(compress):
+        raise ValueError("{} compression of {} reports is not supported by the installed pyarrow".format(compress, file_format))
+
+
+def create_report_writer(report_file, column_headers, file_format='csv', column_types=None, compress=None,
+                         compress_level=None):
+    """
+    Create a report writer for a report format
+
+    Arguments:
+        report_file {str} -- [Name of report file (extension is set to match format)]
+        column_headers {list} -- [Column names, in the order they are written]
+        file_format {optional str} -- [Report format: csv (default), parquet or arrow]
+        column_types {optional dict} -- [Column name to type mapping, used by columnar formats]
+        compress {optional str} -- [Compress the report using gzip or zstd (default = no compression)]
+        compress_level {optional int} -- [Compression level (default = codec default)]
+
+    Returns:
+        [ReportWriter obj] -- [Report writer (not yet opened)]
+    """
+
+    check_report_options(file_format, compress)
+
+    report_file = report_file_name(report_file, file_format, compress)
+
+    if file_format == 'csv':
+        return CsvReportWriter(report_file, column_headers, compress=compress, compress_level=compress_level)
+
+    return ArrowReportWriter(report_file, column_headers, file_format, column_types, compress=compress,
+                             compress_level=compress_level)
+
+
+def write_report(rows, report_file, column_headers, logger=None, file_format='csv', column_types=None, compress=None,
+                 compress_level=None):
+    """pipeline stage to write the rows produced by an iterable (e.g. a
+    generator) to a report file, as they are produced
+
+    Arguments:
+        rows {iterable} -- [Rows (dicts) to be written]
+        report_file {str} -- [Name of report file (extension is set to match format)]
+        column_headers {list} -- [Column names, in the order they are written]
+        logger {optional logger obj} -- [Logger used to report progress]
+        file_format {optional str} -- [Report format: csv (default), parquet or arrow]
+        column_types {optional dict} -- [Column name to type mapping, used by columnar formats]
+        compress {optional str} -- [Compress the report using gzip or zstd (default = no compression)]
+        compress_level {optional int} -- [Compression level (default = codec default)]
+
+    Returns:
+        [int] -- [Number of rows written]
+    """
+
+    logger = logger if logger else ScriptLogger('ReportWriter')
+
+    # rows are produced as they are written, so this phase includes the
+    # phases of the producer (e.g. API calls), which are listed beneath it
+    with Phase('write report'), create_report_writer(report_file, column_headers, file_format, column_types,
+                                                     compress, compress_level) as writer:
+        logger.info("Dumping report file: {}.".format(writer.report_file))
+        writer.write_rows(rows)
+
+    if writer.first_row_time is not None:
+        logger.info("{} rows written (first row after {:.2f} sec).".format(writer.rows_written, writer.first_row_time))
+    else:
+        logger.info("No rows written.")
+
+    return writer.rows_written
@@ -0,0 +1,265 @@
+"""
+An opt-in, persistent (on-disk) cache of Mist API GET responses, used by
+MistVerbs to avoid re-downloading data that has not changed between runs.
+
+Responses are stored zlib-compressed in a SQLite database, keyed by a hash
+of the URL & API token (so different tokens never see each other's data,
+and the token itself is not stored). The ETag/Last-Modified validators of
+each response are stored with the body:
+
+ - if an entry is younger than the TTL of its URL it is used as-is, with no
+   API call made
+ - otherwise a conditional GET (If-None-Match/If-Modified-Since) is sent, &
+   if the API returns '304 Not Modified' the cached body is used
+
+TTLs are set per endpoint using shell-style patterns matched against the
+URL path (first match wins), e.g.:
+
+    cache = ResponseCache(ttls={'*/inventory': 300, '*/wlans': 3600})
+    verb_obj = MistVerbs(api_token, cache=cache)
+
+The total size of the cached bodies is capped, with the least recently used
+entries evicted first.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from fnmatch import fnmatch
+from urllib.parse import urlsplit
+
+from requests.structures import CaseInsensitiveDict
+
+DEFAULT_CACHE_FILE = os.path.join('.mist_cache', 'responses.sqlite')
+
+# response headers kept with a cached body (needed for pagination etc.)
+KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'X-Page-Limit', 'X-Page-Page', 'X-Page-Total')
+
+
+class CacheEntry(object):
+
+    """
+    A cached response
+
+    Arguments:
+        body {bytes} -- [Response body]
+        headers {dict} -- [Kept response headers]
+        stored_at {float} -- [Epoch time the response was last received or revalidated]
+        fresh {boolean} -- [True if entry is within its TTL & may be used without revalidation]
+    """
+
+    def __init__(self, body, headers, stored_at, fresh):
+
+        self.body = body
+        self.headers = CaseInsensitiveDict(headers)
+        self.stored_at = stored_at
+        self.fresh = fresh
+
+    def validators(self):
+        """
+        Return the conditional request headers used to revalidate this entry
+        """
+
+        headers = {}
+
+        if self.headers.get('ETag'):
+            headers['If-None-Match'] = self.headers['ETag']
+
+        if self.headers.get('Last-Modified'):
+            headers['If-Modified-Since'] = self.headers['Last-Modified']
+
+        return headers
+
+
+class ResponseCache(object):
+
+    """
+    A persistent cache of API responses
+
+    Arguments:
+        cache_file {optional str} -- [SQLite file used to store cache (default = .mist_cache/responses.sqlite)]
+        max_size_mb {optional float} -- [Max total size of (compressed) cached bodies (default = 100)]
+        default_ttl {optional float} -- [Secs a response is used without revalidation if no TTL pattern matches (default = 0, always revalidate)]
+        ttls {optional dict} -- [URL path pattern to TTL (secs) mapping]
+        compress_level {optional int} -- [zlib compression level (default = 6)]
+    """
+
+    def __init__(self, cache_file=DEFAULT_CACHE_FILE, max_size_mb=100, default_ttl=0, ttls=None, compress_level=6):
+
+        self.cache_file = cache_file
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.default_ttl = default_ttl
+        self.ttls = ttls if ttls else {}
+        self.compress_level = compress_level
+
+        # counters
+        self.hits = 0
+        self.revalidated = 0
+        self.refreshed = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(cache_file, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                body BLOB NOT NULL,
+                headers TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+
+    @staticmethod
+    def make_key(token, url):
+        """
+        Return the cache key for a URL read using an API token
+        """
+
+        return hashlib.sha256('{}\n{}'.format(token, url).encode('utf-8')).hexdigest()
+
+    def ttl(self, url):
+        """
+        Return the TTL (secs) that applies to a URL
+        """
+
+        path = urlsplit(url).path
+
+        for pattern, ttl in self.ttls.items():
+            if fnmatch(path, pattern):
+                return ttl
+
+        return self.default_ttl
+
+    def get(self, token, url):
+        """
+        Look up a cached response
+
+        Arguments:
+            token {str} -- [API token used for the read]
+            url {str} -- [Full URL of API call]
+
+        Returns:
+            [CacheEntry obj or None] -- [Cached response, or None if not cached]
+        """
+
+        key = self.make_key(token, url)
+
+        with self.lock:
+            row = self.db.execute("SELECT body, headers, stored_at FROM responses WHERE key = ?", (key,)).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+
+        body, headers, stored_at = row
+        fresh = time.time() - stored_at < self.ttl(url)
+
+        if fresh:
+            self.hits += 1
+
+        return CacheEntry(zlib.decompress(body), json.loads(headers), stored_at, fresh)
+
+    def put(self, token, url, body, headers):
+        """
+        Store a response in the cache, evicting least recently used entries
+        if the cache is over its size limit. Replacing a stale entry (the API
+        returned a changed response) is counted as a refresh.
+
+        Arguments:
+            token {str} -- [API token used for the read]
+            url {str} -- [Full URL of API call]
+            body {bytes} -- [Response body]
+            headers {dict} -- [Response headers]
+        """
+
+        kept_headers = {name: headers[name] for name in KEPT_HEADERS if name in headers}
+        compressed = zlib.compress(body, self.compress_level)
+        now = time.time()
+
+        key = self.make_key(token, url)
+
+        with self.lock:
+            if self.db.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone():
+                self.refreshed += 1
+
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (key, url, body, headers, size, stored_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, url, compressed, json.dumps(kept_headers), len(compressed), now, now))
+            self.stores += 1
+            self._evict()
+
+    def touch(self, token, url):
+        """
+        Mark a cached response as revalidated (API returned 304), restarting its TTL
+        """
+
+        with self.lock:
+            self.db.execute("UPDATE responses SET stored_at = ? WHERE key = ?", (time.time(), self.make_key(token, url)))
+            self.revalidated += 1
+
+    def _evict(self):
+        """
+        Remove least recently used entries until under size limit (lock must be held)
+        """
+
+        total_size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+        if total_size <= self.max_size:
+            return
+
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+
+            if total_size <= self.max_size:
+                break
+
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total_size -= size
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Remove all entries from the cache
+        """
+
+        with self.lock:
+            self.db.execute("DELETE FROM responses")
+
+    def stats(self):
+        """
+        Return a dict of cache counters & current size: each lookup is a hit
+        (fresh entry used), revalidated (stale entry, API returned 304),
+        refreshed (stale entry replaced by a new response) or miss (not cached)
+        """
+
+        with self.lock:
+            entries, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+
+        return {
+            'hits': self.hits,
+            'revalidated': self.revalidated,
+            'refreshed': self.refreshed,
+            'misses': self.misses,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'entries': entries,
+            'size_bytes': size,
+        }
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,102 @@
+"""
+Retry policy used by MistVerbs to decide whether (and when) a failed API
+call is sent again.
+
+Only calls that are safe to repeat are retried by default: GET, PUT &
+DELETE are idempotent, whereas repeating a POST may create a duplicate
+object, so POSTs are only retried if explicitly allowed (retry_post=True
+on the policy, or on the individual mist_create() call).
+
+Retries use exponential backoff with "full jitter" (a random delay between
+zero and the backoff ceiling), so parallel callers that fail together do
+not all retry together. A deadline limits the total time spent on a call,
+including all retries.
+"""
+
+import random
+import time
+
+from modules.core.mist_errors import MistTimeoutError
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class RetryPolicy(object):
+
+    """
+    A retry policy for Mist API calls
+
+    Arguments:
+        max_retries {optional int} -- [Max number of retries after the first attempt (default = 3)]
+        backoff_base {optional float} -- [Backoff ceiling in secs for the first retry, doubled for each retry after (default = 0.5)]
+        backoff_max {optional float} -- [Max backoff ceiling in secs (default = 30)]
+        retry_statuses {optional tuple} -- [HTTP status codes that are retried (default = 500, 502, 503, 504)]
+        retry_post {optional boolean} -- [True allows POSTs to be retried (default = False)]
+        deadline {optional float} -- [Max secs to spend on a call inc retries (default = None, no limit)]
+    """
+
+    def __init__(self, max_retries=3, backoff_base=0.5, backoff_max=30, retry_statuses=RETRY_STATUSES,
+                 retry_post=False, deadline=None):
+
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_statuses = retry_statuses
+        self.retry_post = retry_post
+        self.deadline = deadline
+
+    def can_retry_method(self, method, retry_post=None):
+        """
+        Return True if calls using this HTTP method may be retried
+
+        Arguments:
+            method {str} -- [HTTP method]
+            retry_post {optional boolean} -- [Per-call override of the policy retry_post setting]
+        """
+
+        if method.upper() in IDEMPOTENT_METHODS:
+            return True
+
+        if method.upper() == 'POST':
+            return self.retry_post if retry_post is None else retry_post
+
+        return False
+
+    def backoff(self, attempt):
+        """
+        Return a jittered backoff delay (secs) before retry number 'attempt'
+        """
+
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+    def expiry(self, deadline=None):
+        """
+        Return the monotonic clock time at which a call started now must
+        complete (or None if there is no deadline)
+
+        Arguments:
+            deadline {optional float} -- [Per-call override of the policy deadline]
+        """
+
+        deadline = self.deadline if deadline is None else deadline
+
+        return time.monotonic() + deadline if deadline else None
+
+    @staticmethod
+    def remaining(expires, method=None, url=None, attempts=1):
+        """
+        Return the secs left before a call expires (or None if no deadline).
+        Raises MistTimeoutError if the deadline has already passed.
+        """
+
+        if expires is None:
+            return None
+
+        remaining = expires - time.monotonic()
+
+        if remaining <= 0:
+            raise MistTimeoutError('Mist API call deadline exceeded', method, url, attempts=attempts)
+
+        return remaining
@@ -1,23 +1,284 @@
+"""
+A run timer that also times the phases of a run (e.g. API calls, JSON
+decoding, report writing), so that it's clear where the time of a slow run
+went.
+
+Phases are timed with Phase, as a context manager or a decorator, and may be
+nested. Phases are recorded in the StopWatch that was last started (scripts
+start one in main()), & cost little when no StopWatch is running:
+
+    timer = StopWatch()
+    timer.start()
+
+    with Phase('load sites'):
+        sites = verb_obj.mist_read(sites_url)
+
+    @Phase('build rows')
+    def ap_rows(devices, sites_lookup):
+        ...
+
+    timer.stop()
+
+MistVerbs & the report writers time their own phases ('rate limit wait',
+'http request', 'retry backoff', 'json decode' & 'write report').
+
+When stopped, the StopWatch prints the run time followed by a tree of the
+phases, with the number of calls, elapsed time & self time (elapsed time
+less the time of nested phases) of each. Phases timed in worker threads
+(e.g. by AsyncMistVerbs) are listed under '[worker threads]', with times
+summed across the threads.
+
+If the MIST_TRACE_FILE env var is set (or a trace_file is given), the phases
+are also written to that file in the Chrome trace event format, which may be
+opened in chrome://tracing or https://ui.perfetto.dev as a flame chart.
+
+All times are taken from the monotonic high resolution clock
+(time.perf_counter), so are not affected by changes to the system clock.
+"""
+
+import json
+import os
+import threading
 import time
+from contextlib import ContextDecorator
+
+# env var naming the file the Chrome trace is written to
+TRACE_FILE_VAR = 'MIST_TRACE_FILE'
+
+# max phases kept for the trace (phases after this are counted, not kept)
+MAX_TRACE_EVENTS = 100000
+
+WORKER_THREADS = '[worker threads]'
+
+# StopWatch that phases are recorded in (the last one started)
+_active = None
+
+# stack of phases in progress in each thread
+_local = threading.local()
+
+
+def _phase_stack():
+
+    stack = getattr(_local, 'stack', None)
+
+    if stack is None:
+        stack = _local.stack = []
+
+    return stack
+
+
+class PhaseNode(object):
+
+    """
+    Totals of a phase, at one position in the tree of phases
+    """
+
+    def __init__(self, name):
+
+        self.name = name
+        self.calls = 0
+        self.elapsed = 0.0
+        self.child_time = 0.0
+        self.children = {}
+
+    @property
+    def self_time(self):
+        return max(0.0, self.elapsed - self.child_time)
+
+    def child(self, name):
+
+        node = self.children.get(name)
+
+        if node is None:
+            node = self.children[name] = PhaseNode(name)
+
+        return node
+
+
+class Phase(ContextDecorator):
+
+    """
+    Time a phase of the run, in the StopWatch that is running (if any). May
+    be used as a context manager or a decorator, and nested.
+
+    Arguments:
+        name {str} -- [Name of phase, shown in the report & trace]
+    """
+
+    def __init__(self, name):
+
+        self.name = name
+
+    def __enter__(self):
+
+        # the timing is kept on the stack, not the object, so one Phase
+        # object (e.g. a decorator) may be used by many threads at once
+        watch = _active
+        _phase_stack().append((self.name, watch, time.perf_counter() if watch else 0))
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        stack = _phase_stack()
+        name, watch, start = stack.pop()
+
+        if watch is not None:
+            watch.record([entry[0] for entry in stack] + [name], start, time.perf_counter())
+
+        return False
+
 
 class StopWatch(object):
 
-    def __init__(self):
+    """
+    Time a run & the phases within it (see Phase)
+
+    Arguments:
+        trace_file {optional str} -- [File the Chrome trace of phases is written to on stop() (default = MIST_TRACE_FILE env var, if set)]
+    """
+
+    def __init__(self, trace_file=None):
 
         self.start_time = 0
+        self.trace_file = trace_file if trace_file else os.environ.get(TRACE_FILE_VAR)
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+
+        self.root = PhaseNode('total')
+        self.trace_events = []
+        self.dropped_events = 0
 
     def start(self):
         """
         Record current time to start stopwatch timer
         """
 
-        self.start_time = time.time()
+        global _active
+
+        self._reset()
+        self.start_time = time.perf_counter()
+        _active = self
+
+    def phase(self, name):
+        """
+        Return a Phase to time a phase of the run (see Phase)
+        """
+
+        return Phase(name)
+
+    def record(self, path, start, end):
+        """
+        Record a completed phase
+
+        Arguments:
+            path {list} -- [Names of enclosing phases & the phase, outermost first]
+            start {float} -- [perf_counter() time phase started]
+            end {float} -- [perf_counter() time phase ended]
+        """
+
+        elapsed = end - start
+        thread = threading.current_thread()
+
+        # phases of other threads overlap those of the main thread, so are
+        # kept apart from them
+        if thread is not threading.main_thread():
+            path = [WORKER_THREADS] + path
+
+        with self.lock:
+
+            parent = self.root
+            for name in path[:-1]:
+                parent = parent.child(name)
+
+            node = parent.child(path[-1])
+            node.calls += 1
+            node.elapsed += elapsed
+            parent.child_time += elapsed
+
+            if parent.name == WORKER_THREADS:
+                parent.elapsed += elapsed
+
+            if len(self.trace_events) < MAX_TRACE_EVENTS:
+                self.trace_events.append({
+                    'name': path[-1],
+                    'ph': 'X',
+                    'ts': round((start - self.start_time) * 1e6, 3),
+                    'dur': round(elapsed * 1e6, 3),
+                    'pid': os.getpid(),
+                    'tid': thread.ident,
+                })
+            else:
+                self.dropped_events += 1
+
+    def report(self):
+        """
+        Return the tree of phases as a list of lines of text
+        """
+
+        lines = ["{:<44}{:>9}{:>13}{:>13}".format('Phase', 'Calls', 'Total (s)', 'Self (s)')]
+
+        def add_node(node, depth):
+
+            name = '  ' * depth + node.name
+            calls = '' if node.name == WORKER_THREADS else node.calls
+            lines.append("{:<44}{:>9}{:>13.3f}{:>13.3f}".format(name[:43], calls, node.elapsed, node.self_time))
+
+            for child in sorted(node.children.values(), key=lambda child: child.elapsed, reverse=True):
+                add_node(child, depth + 1)
+
+        with self.lock:
+            add_node(self.root, 0)
+
+        return lines
+
+    def write_trace(self, trace_file):
+        """
+        Write the phases to a file in the Chrome trace event format
+        """
+
+        with self.lock:
+            events = list(self.trace_events)
+
+        events.append({
+            'name': self.root.name,
+            'ph': 'X',
+            'ts': 0,
+            'dur': round(self.root.elapsed * 1e6, 3),
+            'pid': os.getpid(),
+            'tid': threading.main_thread().ident,
+        })
+
+        with open(trace_file, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms',
+                       'otherData': {'dropped_events': self.dropped_events}}, f)
 
     def stop(self):
         """
-        Use start time to calculate elapsed time and print it out
+        Use start time to calculate elapsed time and print it out, with the
+        tree of phases timed during the run (& write the trace file, if set)
         """
 
-        run_time = time.time() - self.start_time
+        global _active
+
+        run_time = time.perf_counter() - self.start_time
+        self.root.calls = 1
+        self.root.elapsed = run_time
+
+        if _active is self:
+            _active = None
+
         print("")
-        print("** Time to run: %s sec" % round(run_time, 2))
\ No newline at end of file
+        print("** Time to run: %s sec" % round(run_time, 2))
+
+        if self.root.children:
+            print("")
+            for line in self.report():
+                print(line)
+
+        if self.trace_file:
+            self.write_trace(self.trace_file)
+            print("")
+            print("** Trace of phases written to: {}".format(self.trace_file))
@@ -14,45 +14,42 @@ as env vars that are private to your environment, not global vars on the
 machine that you are working on.
 """
 
-import os
-import json
-import requests
-import logging
 import sys
-import time
-import csv
-from datetime import datetime
 import argparse
 
 from modules.core.logger import ScriptLogger
 from modules.core.mist_verbs import MistVerbs
+from modules.core.mist_errors import MistApiError
+from modules.core.response_cache import ResponseCache
 from modules.core.stopwatch import StopWatch
 from modules.core.get_vars import GetVars
 from modules.core.banner import header, footer
 
-# set up logging
-logger = ScriptLogger('mist_api')
+# define URLs
+org_stats_url = "{}/api/v1/orgs/{}/stats"
 
-# get requried vars (token & org IDs)
-vars_obj = GetVars()
-vars_found = vars_obj.find_vars()
-api_token = vars_found.get('token')
+def main(argv=None):
 
-# create parser args
-parse_descr = "Script to list summary of an organisation. (Requires MIST_TOKEN env var, org_id may be passed on CLI or via MIST_ORG_ID env var) \n"
-parser = argparse.ArgumentParser(description=parse_descr)
-parser.add_argument('org_id', nargs='?', default=vars_found.get('org_id'))
+    # create parser args
+    parse_descr = "Script to list summary of an organisation. (Requires MIST_TOKEN env var, org_id may be passed on CLI or via MIST_ORG_ID env var) \n"
+    parser = argparse.ArgumentParser(description=parse_descr)
+    parser.add_argument('org_id', nargs='?')
+    parser.add_argument('--cache', action='store_true', help="re-use API responses cached by earlier runs if unchanged")
+    parser.add_argument('--cache-ttl', type=float, default=0, help="secs a cached response is used without checking for changes (default: 0)")
 
-args = parser.parse_args()
+    args = parser.parse_args(argv)
 
-# get the site_id passed on the command line
-org_id = args.org_id
+    # set up logging
+    logger = ScriptLogger('mist_api')
 
-# define URLs
-base_url = "https://api.mist.com"
-org_stats_url = "{}/api/v1/orgs/{}/stats".format(base_url, org_id)
+    # get requried vars (token & org IDs)
+    vars_obj = GetVars()
+    vars_found = vars_obj.find_vars()
+    api_token = vars_found.get('token')
+    base_url = vars_found.get('base_url')
 
-def main():
+    # get the org_id passed on the command line (if any)
+    org_id = args.org_id if args.org_id else vars_found.get('org_id')
 
     timer = StopWatch()
     timer.start()
@@ -69,8 +66,14 @@ def main():
 
     # Get my org sites
     logger.info("Getting org info.")
-    verb_obj = MistVerbs(api_token)
-    org_info = verb_obj.mist_read(org_stats_url)
+    cache = ResponseCache(default_ttl=args.cache_ttl) if args.cache else None
+    verb_obj = MistVerbs(api_token, cache=cache)
+
+    try:
+        org_info = verb_obj.mist_read(org_stats_url.format(base_url, org_id))
+    except MistApiError as err:
+        logger.error("Unable to get org info: {}".format(err))
+        sys.exit(1)
 
     """
     Data structure returned:
@@ -103,6 +106,9 @@ def main():
         Number Sites: {org_info['num_sites']}
     """)
     
+    if cache:
+        logger.info("Response cache stats: {}".format(cache.stats()))
+
     logger.info("Script complete.")
 
     timer.stop()
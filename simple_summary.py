@@ -14,75 +14,42 @@ as env vars that are private to your environment, not global vars on the
 machine that you are working on.
 """
 
-import os
-import json
-import requests
-import logging
 import sys
-import time
+import argparse
 
+from modules.core.logger import ScriptLogger
+from modules.core.mist_verbs import MistVerbs
+from modules.core.mist_errors import MistApiError
+from modules.core.response_cache import ResponseCache
 from modules.core.stopwatch import StopWatch
 from modules.core.get_vars import GetVars
 
-# set up logging to console
-logger = logging.getLogger('mist_api')
-logger.setLevel(logging.INFO)
-
-# create console handler & set level
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG)
-
-# create formatter
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-# add formatter to console handler
-console_handler.setFormatter(formatter)
-
-# add console handler to logger
-logger.addHandler(console_handler)
-
-logger.info("Starting script...")
-
-# supply required token
-vars_obj = GetVars()
-vars_found = vars_obj.find_vars()
-api_token = vars_found.get('token')
-org_id = vars_found.get('org_id')
-
 # define URLs
-base_url = "https://api.mist.com"
-sites_url = "{}/api/v1/orgs/{}/sites".format(base_url, org_id)
-org_wlans_url = "{}/api/v1/orgs/{}/wlans".format(base_url, org_id)
-inventory_url = "{}/api/v1/orgs/{}/inventory".format(base_url, org_id)
+sites_url = "{}/api/v1/orgs/{}/sites"
+org_wlans_url = "{}/api/v1/orgs/{}/wlans"
+inventory_url = "{}/api/v1/orgs/{}/inventory"
 
-# define common headers
-headers = {
-        'Content-Type': 'application/json',
-        'Authorization': 'Token {}'.format(api_token)
-}
+def main(argv=None):
 
-def mist_request(url, session):
-    """function to return data structure from Mist API using a requests session
+    # create parser args
+    parse_descr = "Script to list a simple summary of an organisation (sites, WLANs & inventory) \n"
+    parser = argparse.ArgumentParser(description=parse_descr)
+    parser.add_argument('--cache', action='store_true', help="re-use API responses cached by earlier runs if unchanged")
+    parser.add_argument('--cache-ttl', type=float, default=0, help="secs a cached response is used without checking for changes (default: 0)")
 
-    Arguments:
-        url {str} -- [Full URL of API call]
-        session {requests session obj} -- [session object created using requests]
+    args = parser.parse_args(argv)
 
-    Raises:
-        Exception: [Generic failure message if http request fails]
+    # set up logging
+    logger = ScriptLogger('mist_api')
 
-    Returns:
-        [data structure] -- [Data structure returned - varies with API call]
-    """
+    logger.info("Starting script...")
 
-    response = session.get(url, headers=headers)
-
-    if response.status_code == 200:
-        return json.loads(response.content.decode('utf-8'))
-    else:
-        raise Exception('Query to Mist API failed: {} (check token or req URL format?)'.format(response.status_code))
-
-def main():
+    # supply required token
+    vars_obj = GetVars()
+    vars_found = vars_obj.find_vars()
+    api_token = vars_found.get('token')
+    base_url = vars_found.get('base_url')
+    org_id = vars_found.get('org_id')
 
     timer = StopWatch()
     timer.start()
@@ -95,41 +62,52 @@ def main():
         print("You must define a valid organization ID using the MIST_ORG environmental variable name to use this script...exiting.")
         sys.exit()
     
-    with requests.Session() as session:    
+    cache = ResponseCache(default_ttl=args.cache_ttl) if args.cache else None
+    verb_obj = MistVerbs(api_token, cache=cache)
 
-        # Get my org sites
-        logger.info("Getting sites info.")
-        sites = mist_request(sites_url, session)
+    try:
+        with verb_obj.session:
 
-        print("\nOrganization sites: \n")
+            # Get my org sites
+            logger.info("Getting sites info.")
+            sites = verb_obj.mist_read(sites_url.format(base_url, org_id))
 
-        for site in sites:
-            print("\t{} - ID: {}".format(site['name'], site['id']))
+            print("\nOrganization sites: \n")
 
-        print("\n")
+            for site in sites:
+                print("\t{} - ID: {}".format(site['name'], site['id']))
 
-        # Get my org wlans
-        logger.info("Getting WLANs info.")
-        wlans = mist_request(org_wlans_url, session)
+            print("\n")
+
+            # Get my org wlans
+            logger.info("Getting WLANs info.")
+            wlans = verb_obj.mist_read(org_wlans_url.format(base_url, org_id))
         
-        print("\nOrganization WLANs: \n")
+            print("\nOrganization WLANs: \n")
 
-        for wlan in wlans:
-            print("\t" + wlan['ssid'])
+            for wlan in wlans:
+                print("\t" + wlan['ssid'])
         
-        print("\n")
+            print("\n")
         
-        # Get device inventory
-        logger.info("Getting device inventory info.")
-        devices = mist_request(inventory_url, session)
+            # Get device inventory
+            logger.info("Getting device inventory info.")
+            devices = verb_obj.mist_read(inventory_url.format(base_url, org_id))
         
-        print("\nOrganization Inventory: \n")
+            print("\nOrganization Inventory: \n")
 
-        for device in devices:
-            print("\t{}\t{}\t{}".format(device['name'], device['model'], device['type']))
+            for device in devices:
+                print("\t{}\t{}\t{}".format(device['name'], device['model'], device['type']))
+
+            print("\n")
+
+    except MistApiError as err:
+        logger.error("Mist API call failed: {}".format(err))
+        sys.exit(1)
+
+    if cache:
+        logger.info("Response cache stats: {}".format(cache.stats()))
 
-        print("\n")
-    
     logger.info("Script complete.")
     timer.stop()
 
@@ -18,30 +18,34 @@ that is private to your environment, not a global var on the machine that
 you are working on.
 """
 
-import os
 import sys
-from pprint import pprint
+import argparse
 
 from modules.core.logger import ScriptLogger
 from modules.core.mist_verbs import MistVerbs
+from modules.core.mist_errors import MistApiError
 from modules.core.stopwatch import StopWatch
 from modules.core.get_vars import GetVars
 from modules.core.banner import header, footer
 
+# define URLs
+tokens_url = "{}/api/v1/self/apitokens"
 
-# set up logging
-logger = ScriptLogger('mist_api')
+def main(argv=None):
 
-# supply required token
-vars_obj = GetVars()
-vars_found = vars_obj.find_vars()
-api_token = vars_found.get('token')
+    # create parser args
+    parse_descr = "Script to create a new API token \n"
+    parser = argparse.ArgumentParser(description=parse_descr)
+    parser.parse_args(argv)
 
-# define URLs
-base_url = "https://api.mist.com"
-tokens_url = "{}/api/v1/self/apitokens".format(base_url)
+    # set up logging
+    logger = ScriptLogger('mist_api')
 
-def main():
+    # supply required token
+    vars_obj = GetVars()
+    vars_found = vars_obj.find_vars()
+    api_token = vars_found.get('token')
+    base_url = vars_found.get('base_url')
 
     timer = StopWatch()
     timer.start()
@@ -52,7 +56,12 @@ def main():
            
     # Create tokens  
     verb_obj = MistVerbs(api_token, False)
-    token = verb_obj.mist_create(tokens_url)
+
+    try:
+        token = verb_obj.mist_create(tokens_url.format(base_url))
+    except MistApiError as err:
+        logger.error("Unable to create token: {}".format(err))
+        sys.exit(1)
 
     header()
     
@@ -18,42 +18,39 @@ that is private to your environment, not a global var on the machine that
 you are working on.
 """
 
-import os
-import logging
 import sys
-import time
-from pprint import pprint
 import argparse
 
 from modules.core.logger import ScriptLogger
 from modules.core.mist_verbs import MistVerbs
+from modules.core.mist_errors import MistApiError
 from modules.core.stopwatch import StopWatch
 from modules.core.get_vars import GetVars
 from modules.core.banner import header, footer
 
-# create parser args
-parse_descr = "Script to delete a specific token ID \n"
-parser = argparse.ArgumentParser(description=parse_descr)
-parser.add_argument('token_id')
+# define URLs
+tokens_url = "{}/api/v1/self/apitokens"
 
-args = parser.parse_args()
+def main(argv=None):
 
-# set up logging
-logger = ScriptLogger('mist_api')
+    # create parser args
+    parse_descr = "Script to delete a specific token ID \n"
+    parser = argparse.ArgumentParser(description=parse_descr)
+    parser.add_argument('token_id')
 
-# supply required token
-vars_obj = GetVars()
-vars_found = vars_obj.find_vars()
-api_token = vars_found.get('token')
+    args = parser.parse_args(argv)
 
-# get the token_id passed on the command line
-token_id = args.token_id
+    # set up logging
+    logger = ScriptLogger('mist_api')
 
-# define URLs
-base_url = "https://api.mist.com"
-tokens_url = "{}/api/v1/self/apitokens".format(base_url)
+    # supply required token
+    vars_obj = GetVars()
+    vars_found = vars_obj.find_vars()
+    api_token = vars_found.get('token')
+    base_url = vars_found.get('base_url')
 
-def main():
+    # get the token_id passed on the command line
+    token_id = args.token_id
 
     timer = StopWatch()
     timer.start()
@@ -72,7 +69,12 @@ def main():
     logger.info("Deleting supplied token ID.")
     
     verb_obj = MistVerbs(api_token, False)
-    verb_obj.mist_delete("{}/{}".format(tokens_url, token_id))
+
+    try:
+        verb_obj.mist_delete("{}/{}".format(tokens_url.format(base_url), token_id))
+    except MistApiError as err:
+        logger.error("Unable to delete token ID {}: {}".format(token_id, err))
+        sys.exit(1)
   
     logger.info("Script complete.")
 
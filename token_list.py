@@ -16,29 +16,35 @@ that is private to your environment, not a global var on the machine that
 you are working on.
 """
 
-import os
 import sys
+import argparse
 from pprint import pprint
 
 from modules.core.logger import ScriptLogger
 from modules.core.mist_verbs import MistVerbs
+from modules.core.mist_errors import MistApiError
 from modules.core.stopwatch import StopWatch
 from modules.core.get_vars import GetVars
 from modules.core.banner import header, footer
 
-logger = ScriptLogger('mist-api')
-logger.info("Starting script...")
+# define URLs
+tokens_url = "{}/api/v1/self/apitokens"
 
-# supply required token
-vars_obj = GetVars()
-vars_found = vars_obj.find_vars()
-api_token = vars_found.get('token')
+def main(argv=None):
 
-# define URLs
-base_url = "https://api.mist.com"
-tokens_url = "{}/api/v1/self/apitokens".format(base_url)
+    # create parser args
+    parse_descr = "Script to list the API tokens of your Mist login \n"
+    parser = argparse.ArgumentParser(description=parse_descr)
+    parser.parse_args(argv)
+
+    logger = ScriptLogger('mist-api')
+    logger.info("Starting script...")
 
-def main():
+    # supply required token
+    vars_obj = GetVars()
+    vars_found = vars_obj.find_vars()
+    api_token = vars_found.get('token')
+    base_url = vars_found.get('base_url')
 
     timer = StopWatch()
     timer.start()
@@ -52,7 +58,13 @@ def main():
     logger.info("Getting tokens.")
     
     verb_obj = MistVerbs(api_token)
-    tokens = verb_obj.mist_read(tokens_url)
+
+    try:
+        tokens = verb_obj.mist_read(tokens_url.format(base_url))
+    except MistApiError as err:
+        logger.error("Unable to get tokens: {}".format(err))
+        sys.exit(1)
+
     pprint(tokens)
 
     logger.info("Script complete.")
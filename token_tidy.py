@@ -7,6 +7,14 @@ the token being used to run this script. This mitigates potential
 security issues with old tokens being left lying around in your
 Mist account.
 
+The tokens to keep & delete are listed before any are deleted (use --dry-run
+to list them without deleting). Tokens are deleted concurrently (see
+--workers), and the result of each is logged: a token that can't be
+deleted does not stop the others being deleted. The token in use is only
+known from its masked key (first & last 4 chars) in the token list, so
+every token with that masked key is kept, and if none has it no tokens are
+deleted at all.
+
 To use this script, you must set the following environmental variables that
 are used by the script:
 
@@ -18,36 +26,121 @@ that is private to your environment, not a global var on the machine that
 you are working on.
 """
 
-import os
-import logging
 import sys
-import time
-from pprint import pprint
+import asyncio
+import argparse
+from datetime import datetime
 
 from modules.core.logger import ScriptLogger
 from modules.core.mist_verbs import MistVerbs
+from modules.core.mist_errors import MistApiError
+from modules.core.async_mist_verbs import AsyncMistVerbs
+from modules.core.bulk_writer import BulkWriter
 from modules.core.stopwatch import StopWatch
 from modules.core.get_vars import GetVars
 from modules.core.banner import header, footer
 
-# set up logging
-logger = ScriptLogger('mist_api')
+# define URLs
+tokens_url = "{}/api/v1/self/apitokens"
 
-# supply required token
-vars_obj = GetVars()
-vars_found = vars_obj.find_vars()
-api_token = vars_found.get('token')
 
-# define URLs
-base_url = "https://api.mist.com"
-tokens_url = "{}/api/v1/self/apitokens".format(base_url)
+def masked_key(api_token):
+    """
+    Return a token key masked as it is shown in the token list of the API
+    """
+
+    return "{}...{}".format(api_token[0:4], api_token[-4:])
+
+
+def plan_tidy(tokens, api_token):
+    """
+    Split the token list in to the tokens to keep & the tokens to delete.
+    Every token whose masked key matches the token in use is kept (the
+    masked key is not unique, so more than one token may match).
+
+    Arguments:
+        tokens {list} -- [Token list returned by the API]
+        api_token {str} -- [API token in use]
+
+    Returns:
+        [tuple] -- [(tokens to keep, tokens to delete)]
+    """
+
+    our_key = masked_key(api_token)
+
+    keep = [token for token in tokens if token['key'] == our_key]
+    delete = [token for token in tokens if token['key'] != our_key]
+
+    return keep, delete
+
+
+def format_time(timestamp):
+
+    if not timestamp:
+        return '-'
+
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M')
+
+
+def print_plan(keep, delete):
+
+    print("\n    {:<38}{:<13}{:<18}{:<18}{}".format('Token ID', 'Key', 'Created', 'Last used', 'Action'))
+
+    for action, tokens in (('keep (in use)', keep), ('delete', delete)):
+        for token in tokens:
+            print("    {:<38}{:<13}{:<18}{:<18}{}".format(token['id'], token['key'], format_time(token.get('created_time')),
+                                                         format_time(token.get('last_used')), action))
+
+    print("\n    {} token(s) to keep, {} token(s) to delete\n".format(len(keep), len(delete)))
 
-def main():
+
+async def delete_tokens(verb_obj, base_url, tokens, workers, logger):
+    """
+    Delete tokens concurrently, logging the result of each as it completes.
+    Returns the BulkResult of each token.
+    """
+
+    total = len(tokens)
+    token_ids = {"{}/{}".format(tokens_url.format(base_url), token['id']): token['id'] for token in tokens}
+    count = 0
+
+    def log_result(result):
+
+        nonlocal count
+        count += 1
+
+        if result.ok:
+            logger.info("[{}/{}] Deleted token ID {} in {:.2f} sec".format(count, total, token_ids[result.url], result.elapsed))
+        elif result.status == 404:
+            logger.info("[{}/{}] Token ID {} already deleted".format(count, total, token_ids[result.url]))
+        else:
+            logger.error("[{}/{}] Token ID {} could not be deleted: {}".format(count, total, token_ids[result.url], result.error))
+
+    async with AsyncMistVerbs(None, concurrency=workers, verb_obj=verb_obj) as async_verb_obj:
+        return await BulkWriter(async_verb_obj).delete(token_ids, on_result=log_result)
+
+
+def main(argv=None):
+
+    # create parser args
+    parse_descr = "Script to delete all API tokens of your Mist login, except the token in use \n"
+    parser = argparse.ArgumentParser(description=parse_descr)
+    parser.add_argument('--dry-run', action='store_true', help="list the tokens that would be kept & deleted, without deleting any")
+    parser.add_argument('--workers', type=int, default=10, help="number of tokens deleted concurrently (default: 10)")
+    args = parser.parse_args(argv)
+
+    # set up logging
+    logger = ScriptLogger('mist_api')
+
+    # supply required token
+    vars_obj = GetVars()
+    vars_found = vars_obj.find_vars()
+    api_token = vars_found.get('token')
+    base_url = vars_found.get('base_url')
 
     timer = StopWatch()
     timer.start()
 
-
     if not api_token:
         print("You must define a valid API key using the MIST_TOKEN environmental variable name to use this script...exiting.")
         sys.exit()
@@ -58,26 +151,34 @@ def main():
     logger.info("Getting tokens.")
     
     verb_obj = MistVerbs(api_token, False)
-    tokens = verb_obj.mist_read(tokens_url)
-    pprint(tokens)
 
-    # Verify ID of token we are using
-    api_token_short = "{}...{}".format(api_token[0:4], api_token[-4:])
-    our_token_id = None
+    try:
+        tokens = verb_obj.mist_read(tokens_url.format(base_url))
+    except MistApiError as err:
+        logger.error("Unable to get tokens: {}".format(err))
+        sys.exit(1)
 
-    for token in tokens:
-        if token['key'] == api_token_short:
-            our_token_id = token['id']
-    
-    # Delete all tokens apart from our current token
-    if len(tokens) > 1:
-        logger.info("Deleting tokens.")
+    keep, delete = plan_tidy(tokens, api_token)
+    print_plan(keep, delete)
 
-        for token in tokens:
+    # without a match we can't tell which token is in use, so delete nothing
+    if not keep:
+        logger.error("Token in use ({}) not found in token list, no tokens deleted.".format(masked_key(api_token)))
+        sys.exit(1)
+
+    if args.dry_run:
+        logger.info("Dry run, no tokens deleted.")
 
-            if token['id'] != our_token_id:
-                logger.info("Deleting tokens ID: {}".format(token['id']))
-                verb_obj.mist_delete("{}/{}".format(tokens_url, token['id']))
+    elif delete:
+        logger.info("Deleting {} tokens.".format(len(delete)))
+
+        results = asyncio.run(delete_tokens(verb_obj, base_url, delete, args.workers, logger))
+        failed = [result for result in results if not result.ok and result.status != 404]
+
+        logger.info("{} token(s) deleted, {} failed.".format(len(results) - len(failed), len(failed)))
+
+        if failed:
+            logger.warning("{} token(s) could not be deleted.".format(len(failed)))
     else:
         logger.info("No tokens to tidy up.")
     
@@ -89,5 +190,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
-